@@ -1,8 +1,1142 @@
 # CLASS PART
 # import libraries
+import bisect, itertools, json, os, pickle, sys, threading, time
+from contextlib import contextmanager
 import numpy as np, pandas as pd
-from pycoingecko import CoinGeckoAPI
-cg = CoinGeckoAPI()
+
+from api_client import (Metrics, Profile, RateLimiter, ThrottledClient, TTLCache, cg, endpoint_ttl, make_client, market_pages,
+                        metrics, rate_limiter, top_markets)
+from parsing import chart_columns
+
+# cache backends shared between processes
+class CacheBackend():
+    ''' Interface of the caches behind get_data, get_coin_id, get_top_100 and the market snapshot
+    
+    keys are tuples of strings, e.g. ("usd", "bitcoin") for a market chart or ("coins_list",). a backend stores values
+    with the time they were stored and hands out one exclusive lock per key, which every process using the same
+    backend location respects. get_or_fetch uses that lock so when several processes miss the same key at once,
+    only one of them calls the API and the others read what it stored
+    
+    subclasses implement get, set, delete, keys and lock, and optionally a cheaper age
+    
+    Methods
+    ==========
+    get_or_fetch:
+        returns the value of key if it is younger than max_age seconds, otherwise fetches it under the key's lock
+            ex. backend.get_or_fetch(("coins_list",), 3600, lambda stale: cg.get_coins_list())
+    
+    delete_matching:
+        removes every key matching a pattern, where None matches any part
+            ex. backend.delete_matching("usd", None)
+    '''
+    
+    def get(self, key):
+        ''' returns the value stored for key and its age in seconds, or (None, None) if nothing is stored
+        '''
+        raise NotImplementedError
+    
+    def set(self, key, value):
+        raise NotImplementedError
+    
+    def age(self, key):
+        ''' returns the age in seconds of the value stored for key, or None. backends can answer this without reading the value
+        '''
+        return self.get(key)[1]
+    
+    def delete(self, key):
+        raise NotImplementedError
+    
+    def keys(self):
+        raise NotImplementedError
+    
+    def lock(self, key):
+        ''' returns a context manager holding the key's lock across processes
+        '''
+        raise NotImplementedError
+    
+    def get_or_fetch(self, key, max_age, fetch, refresh=False):
+        ''' returns (value, fetched). a missing or stale value (or any value, with refresh=True) is replaced by fetch(stale_value)
+        
+        the fetch runs under the key's lock, and a value stored by another process while this one waited is used as is
+        '''
+        value, age = self.get(key)
+        if value is not None and not refresh and age < max_age:
+            return value, False
+        
+        requested = time.time()
+        with self.lock(key):
+            age = self.age(key)
+            if age is not None and age < time.time() - requested:
+                value, age = self.get(key)
+                if value is not None:
+                    return value, False
+            value = fetch(value)
+            self.set(key, value)
+        return value, True
+    
+    def delete_matching(self, *pattern):
+        ''' removes every key of the same length as pattern whose parts match it (None matches anything)
+        '''
+        for key in self.keys():
+            if len(key) == len(pattern) and all(part is None or part == k for part, k in zip(pattern, key)):
+                self.delete(key)
+
+def default_cache_dir():
+    return os.environ.get("COINGECKO_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".coingecko_cache"))
+
+class FileCache(CacheBackend):
+    ''' Cache backend keeping one file per key under cache_dir, locked with a lock file per key
+    
+    dataframes are written as parquet if pyarrow is installed and can store them, everything else is pickled.
+    locks are advisory file locks, which the operating system releases if the process holding one dies
+    
+    Attributes
+    ==========
+    cache_dir: str
+        directory the entries are written to (default is ~/.coingecko_cache, or the COINGECKO_CACHE_DIR environment variable if set)
+    '''
+    
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir or default_cache_dir()
+        self._format = None
+    
+    def __repr__(self):
+        return "FileCache(cache_dir = {})".format(self.cache_dir)
+    
+    @property
+    def _ext(self):
+        # checked on first use rather than in __init__ so importing this module does not import pyarrow
+        if self._format is None:
+            try:
+                import pyarrow
+                self._format = "parquet"
+            except ImportError:
+                self._format = "pkl"
+        return self._format
+    
+    def path(self, key, ext=None):
+        ''' returns the file path of the entry for key
+        '''
+        return os.path.join(self.cache_dir, *key[:-1], "{}.{}".format(key[-1], ext or self._ext))
+    
+    def get(self, key):
+        for ext in dict.fromkeys([self._ext, "pkl"]):
+            path = self.path(key, ext)
+            try:
+                age = time.time() - os.path.getmtime(path)
+                value = pd.read_parquet(path) if ext == "parquet" else pd.read_pickle(path)
+            except (OSError, ValueError, EOFError, pickle.UnpicklingError):
+                # missing or unreadable entry, treat it as a cache miss
+                continue
+            return value, age
+        return None, None
+    
+    def set(self, key, value):
+        ext = self._ext if isinstance(value, pd.DataFrame) else "pkl"
+        os.makedirs(os.path.dirname(self.path(key, ext)), exist_ok=True)
+        
+        # write to a temporary file first so readers never see a half written entry
+        tmp_path = "{}.{}-{}.tmp".format(self.path(key), os.getpid(), threading.get_ident())
+        try:
+            if ext == "parquet":
+                try:
+                    value.to_parquet(tmp_path)
+                except (ValueError, TypeError):
+                    # columns arrow cannot store (e.g. dicts mixed with None) are pickled instead
+                    ext = "pkl"
+            if ext == "pkl":
+                pd.to_pickle(value, tmp_path)
+            os.replace(tmp_path, self.path(key, ext))
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        
+        # an entry left in the other format would shadow or outlive this one
+        for other in ("parquet", "pkl"):
+            if other != ext and os.path.exists(self.path(key, other)):
+                os.remove(self.path(key, other))
+    
+    def age(self, key):
+        for ext in dict.fromkeys([self._ext, "pkl"]):
+            try:
+                return time.time() - os.path.getmtime(self.path(key, ext))
+            except OSError:
+                pass
+        return None
+    
+    def delete(self, key):
+        for ext in ("parquet", "pkl"):
+            try:
+                os.remove(self.path(key, ext))
+            except OSError:
+                pass
+    
+    def keys(self):
+        keys = []
+        for root, dirs, files in os.walk(self.cache_dir):
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            parts = os.path.relpath(root, self.cache_dir).split(os.sep)
+            parts = [] if parts == ["."] else parts
+            for name in files:
+                stem, ext = os.path.splitext(name)
+                if ext in (".parquet", ".pkl"):
+                    keys.append(tuple(parts + [stem]))
+        return keys
+    
+    @contextmanager
+    def lock(self, key):
+        path = os.path.join(self.cache_dir, ".locks", "{}.lock".format("-".join(key)))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "a+b") as f:
+            try:
+                import fcntl
+            except ImportError:
+                # windows
+                import msvcrt
+                while True:
+                    try:
+                        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        pass
+                try:
+                    yield
+                finally:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+                return
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+class SQLiteCache(CacheBackend):
+    ''' Cache backend keeping every entry in one SQLite database, shared by every process that opens the same file
+    
+    values are pickled. locks are rows of a locks table that expire after lock_timeout seconds, so a lock left behind
+    by a crashed process is broken rather than blocking the key forever. a held lock is renewed from a background
+    thread every lock_timeout / 3 seconds, so a fetch slowed down by the rate limiter keeps it however long it takes
+    
+    Attributes
+    ==========
+    path: str
+        database file (default is cache.sqlite in the cache directory)
+    lock_timeout: float
+        seconds after which a lock that stopped being renewed is considered abandoned (default is 120)
+    poll_interval: float
+        seconds between attempts to take a lock held by another process (default is 0.05)
+    '''
+    
+    def __init__(self, path=None, lock_timeout=120.0, poll_interval=0.05):
+        self.path = path or os.path.join(default_cache_dir(), "cache.sqlite")
+        self.cache_dir = os.path.dirname(os.path.abspath(self.path))
+        self.lock_timeout = lock_timeout
+        self.poll_interval = poll_interval
+        self._local = threading.local()
+    
+    def __repr__(self):
+        return "SQLiteCache(path = {})".format(self.path)
+    
+    def _connect(self):
+        # one connection per thread, and a new one after a fork
+        local = self._local
+        if getattr(local, "pid", None) != os.getpid():
+            import sqlite3
+            os.makedirs(self.cache_dir, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value BLOB, stored_at REAL)")
+            connection.execute("CREATE TABLE IF NOT EXISTS locks (key TEXT PRIMARY KEY, owner TEXT, expires REAL)")
+            local.connection = connection
+            local.pid = os.getpid()
+        return local.connection
+    
+    def get(self, key):
+        row = self._connect().execute("SELECT value, stored_at FROM entries WHERE key = ?", (json.dumps(key),)).fetchone()
+        if row is None:
+            return None, None
+        try:
+            return pickle.loads(row[0]), time.time() - row[1]
+        except (EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            return None, None
+    
+    def set(self, key, value):
+        self._connect().execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?)",
+                                (json.dumps(key), pickle.dumps(value, pickle.HIGHEST_PROTOCOL), time.time()))
+    
+    def age(self, key):
+        row = self._connect().execute("SELECT stored_at FROM entries WHERE key = ?", (json.dumps(key),)).fetchone()
+        return None if row is None else time.time() - row[0]
+    
+    def delete(self, key):
+        self._connect().execute("DELETE FROM entries WHERE key = ?", (json.dumps(key),))
+    
+    def keys(self):
+        return [tuple(json.loads(key)) for key, in self._connect().execute("SELECT key FROM entries")]
+    
+    @contextmanager
+    def lock(self, key):
+        connection = self._connect()
+        name = json.dumps(key)
+        owner = os.urandom(8).hex()
+        while True:
+            now = time.time()
+            connection.execute("DELETE FROM locks WHERE key = ? AND expires < ?", (name, now))
+            if connection.execute("INSERT OR IGNORE INTO locks VALUES (?, ?, ?)", (name, owner, now + self.lock_timeout)).rowcount:
+                break
+            time.sleep(self.poll_interval)
+        stop = threading.Event()
+        threading.Thread(target=self._renew, args=(name, owner, stop), name="coingecko-lock-renewal", daemon=True).start()
+        try:
+            yield
+        finally:
+            stop.set()
+            connection.execute("DELETE FROM locks WHERE key = ? AND owner = ?", (name, owner))
+    
+    def _renew(self, name, owner, stop):
+        # pushes the expiry of a held lock forward until it is released. a connection of its own, since sqlite
+        # connections stay in the thread that opened them
+        import sqlite3
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            while not stop.wait(self.lock_timeout / 3):
+                try:
+                    connection.execute("UPDATE locks SET expires = ? WHERE key = ? AND owner = ?",
+                                       (time.time() + self.lock_timeout, name, owner))
+                except sqlite3.OperationalError:
+                    # database busy, tried again on the next round
+                    pass
+        finally:
+            connection.close()
+
+class MarketChartCache(CacheBackend):
+    ''' Stores parsed market chart dataframes in a cache backend, keyed by (vs_currency, coin)
+    
+    Attributes
+    ==========
+    cache_dir: str
+        directory of the default FileCache backend (default is ~/.coingecko_cache, or the COINGECKO_CACHE_DIR environment variable if set)
+    max_age: int
+        number of seconds a cached dataframe is treated as fresh. older entries only have their missing tail refetched (default is 6 hours)
+    backend: CacheBackend
+        where the dataframes are stored (default is a FileCache in cache_dir). a SQLiteCache or FileCache shared by
+        several processes makes them fetch each coin only once between them
+            ex. MarketChartCache(backend=SQLiteCache("/var/cache/coingecko.sqlite"))
+        
+    Methods
+    ==========
+    load:
+        returns the cached dataframe and its age in seconds, or (None, None) if nothing is cached
+        
+    save:
+        writes a dataframe to the cache
+    
+    get_or_fetch:
+        returns the cached dataframe if fresh, otherwise fetches it with only one process fetching at a time
+        
+    invalidate:
+        removes cached entries. leave coin and/or vs_currency as None to remove all matching entries
+            ex. MarketChartCache().invalidate(coin="bitcoin")
+    '''
+    
+    def __init__(self, cache_dir=None, max_age=6 * 60 * 60, backend=None):
+        self.backend = backend or FileCache(cache_dir)
+        self.max_age = max_age
+    
+    def __repr__(self):
+        return "MarketChartCache(backend = {}, max_age = {})".format(self.backend, self.max_age)
+    
+    @property
+    def cache_dir(self):
+        return self.backend.cache_dir
+    
+    def path(self, coin, vs_currency):
+        ''' returns the file path of the cache entry for coin and vs_currency (FileCache backends only)
+        '''
+        return self.backend.path((vs_currency, coin))
+    
+    def get(self, key):
+        start = metrics.clock()
+        data, age = self.backend.get(key)
+        if data is None or len(data) == 0:
+            return None, None
+        data = validate_index(data)
+        if start:
+            metrics.record("stage", "cache_load", start, rows=len(data))
+        return data, age
+    
+    def set(self, key, data):
+        start = metrics.clock()
+        self.backend.set(key, data)
+        if start:
+            metrics.record("stage", "cache_save", start, rows=len(data))
+    
+    def age(self, key):
+        return self.backend.age(key)
+    
+    def delete(self, key):
+        self.backend.delete(key)
+    
+    def keys(self):
+        # market charts are the only two part keys, the repaired charts of load_market_chart(repair=True) are left out
+        return [key for key in self.backend.keys() if len(key) == 2]
+    
+    def lock(self, key):
+        return self.backend.lock(key)
+    
+    def load(self, coin, vs_currency):
+        ''' returns the cached dataframe and its age in seconds, or (None, None) if nothing is cached
+        '''
+        return self.get((vs_currency, coin))
+    
+    def save(self, coin, vs_currency, data):
+        ''' writes the dataframe for coin and vs_currency to the cache
+        '''
+        self.set((vs_currency, coin), data)
+    
+    def is_fresh(self, age):
+        ''' returns True if an entry of the given age (in seconds) does not need refreshing
+        '''
+        return age is not None and age < self.max_age
+    
+    def invalidate(self, coin=None, vs_currency=None):
+        ''' removes cached entries matching coin and vs_currency (None matches everything), repaired charts included
+        '''
+        self.delete_matching(vs_currency, coin)
+        self.delete_matching(vs_currency, coin, "repaired")
+
+market_chart_cache = MarketChartCache()
+
+# backend shared between processes for the coin list, top coins and market snapshots (None keeps them per process)
+shared_cache = None
+
+def use_shared_cache(backend):
+    ''' shares get_data, get_coin_id, get_top_100 and the market snapshot between every process using backend,
+    so workers asking for the same data at the same time make one API call between them
+        ex. use_shared_cache(SQLiteCache("/var/cache/coingecko.sqlite"))
+    
+    can also be set with the COINGECKO_SHARED_CACHE environment variable (file or sqlite)
+    '''
+    global shared_cache
+    shared_cache = backend
+    market_chart_cache.backend = backend
+
+def shared_fetch(key, ttl, fetch):
+    ''' returns fetch() through the shared cache, or calls it directly if there is none
+    '''
+    if shared_cache is None:
+        return fetch()
+    return shared_cache.get_or_fetch(key, ttl, lambda stale: fetch())[0]
+
+if os.environ.get("COINGECKO_SHARED_CACHE") == "file":
+    use_shared_cache(FileCache())
+elif os.environ.get("COINGECKO_SHARED_CACHE") == "sqlite":
+    use_shared_cache(SQLiteCache())
+
+# in-memory cache of the coin list, top coins and market data dataframes
+response_cache = TTLCache()
+# exchange rates and converted market charts
+conversion_cache = TTLCache(maxsize=256, name="conversion")
+
+# bulk market snapshot
+class MarketSnapshot():
+    ''' Market data of many coins, fetched at most once per time bucket and indexed by coin id
+    
+    Attributes
+    ==========
+    vs_currency: str
+        currency the market data is quoted in (default is set to usd)
+    interval: int
+        length of a time bucket in seconds. the snapshot is dropped and refetched when a new bucket starts
+        (default is endpoint_ttl["coins_markets"])
+    batch_size: int
+        number of ids requested per get_coins_markets call (default is 250, the API maximum)
+        
+    Methods
+    ==========
+    get:
+        returns the market data of the given coin ids, fetching only the ids missing from the current bucket
+            ex. get_market_snapshot().get(["bitcoin", "ethereum"])
+    
+    missing, add, select:
+        the steps of get, for callers that fetch the missing ids on their own (e.g. the async client)
+            ex. bucket, wanted = snapshot.missing(ids)
+                snapshot.add(bucket, wanted, fetched)
+                snapshot.select(ids)
+    '''
+    
+    def __init__(self, vs_currency="usd", interval=None, batch_size=250, client=None):
+        self.vs_currency = vs_currency
+        self.interval = interval or endpoint_ttl["coins_markets"]
+        self.batch_size = batch_size
+        self._client = client
+        self._bucket = None
+        self._frame = None
+        self._missing = set()
+        self._lock = threading.Lock()
+    
+    def __repr__(self):
+        return "MarketSnapshot(vs_currency = {}, coins = {})".format(self.vs_currency, 0 if self._frame is None else len(self._frame))
+    
+    def _fetch(self, ids):
+        client = self._client or cg
+        rows = []
+        for start in range(0, len(ids), self.batch_size):
+            batch = ids[start:start + self.batch_size]
+            rows.extend(client.get_coins_markets(vs_currency=self.vs_currency, ids=",".join(batch), per_page=len(batch)))
+        return pd.DataFrame(rows).set_index("id") if rows else None
+    
+    def _fetch_shared(self, bucket, ids):
+        # the bucket's snapshot is shared, so ids another process already fetched are read rather than requested
+        key = ("market_snapshot", self.vs_currency, str(bucket))
+        frame, age = shared_cache.get(key)
+        if frame is not None and all(i in frame.index for i in ids):
+            return frame
+        with shared_cache.lock(key):
+            frame, age = shared_cache.get(key)
+            wanted = [i for i in ids if frame is None or i not in frame.index]
+            fetched = self._fetch(wanted) if wanted else None
+            if fetched is not None:
+                frame = fetched if frame is None else pd.concat([frame, fetched])
+                shared_cache.set(key, frame)
+                shared_cache.delete(("market_snapshot", self.vs_currency, str(bucket - 1)))
+        return frame
+    
+    def _missing_ids(self, ids, count):
+        # starts a new bucket if the current one is over, and returns it with the ids it has no market data for yet
+        bucket = int(time.time() // self.interval)
+        if bucket != self._bucket:
+            self._bucket = bucket
+            self._frame = None
+            self._missing = set()
+        known = set() if self._frame is None else set(self._frame.index)
+        wanted = [i for i in ids if i not in known and i not in self._missing]
+        if count and metrics.enabled:
+            metrics.record("cache", "market_snapshot", hits=len(ids) - len(wanted), misses=len(wanted))
+        return bucket, wanted
+    
+    def _add(self, bucket, wanted, fetched):
+        if bucket != self._bucket:
+            # fetched for a bucket that is over
+            return
+        known = set() if self._frame is None else set(self._frame.index)
+        if fetched is not None:
+            fetched = fetched[~fetched.index.isin(known)]
+            self._frame = fetched if self._frame is None else pd.concat([self._frame, fetched])
+            known.update(fetched.index)
+        self._missing.update(i for i in wanted if i not in known)
+    
+    def _select(self, ids):
+        if self._frame is None:
+            return pd.DataFrame(index=pd.Index([], name="id"))
+        return self._frame.loc[[i for i in dict.fromkeys(ids) if i in self._frame.index]]
+    
+    def get(self, ids):
+        ''' returns a pandas dataframe of market data for ids (indexed by id), skipping ids CoinGecko has no market data for
+        '''
+        ids = list(dict.fromkeys(ids))
+        with self._lock:
+            bucket, wanted = self._missing_ids(ids, True)
+            if wanted:
+                fetched = self._fetch(wanted) if shared_cache is None else self._fetch_shared(bucket, wanted)
+                self._add(bucket, wanted, fetched)
+            return self._select(ids)
+    
+    def missing(self, ids, count=True):
+        ''' returns the current bucket and the ids it has no market data for yet. count=False leaves the lookup out of metrics
+        '''
+        with self._lock:
+            return self._missing_ids(list(dict.fromkeys(ids)), count)
+    
+    def add(self, bucket, wanted, fetched):
+        ''' adds the market data fetched for the wanted ids (a dataframe indexed by id, or None) to the snapshot of bucket
+        '''
+        with self._lock:
+            self._add(bucket, wanted, fetched)
+    
+    def select(self, ids):
+        ''' returns the market data the snapshot holds for ids, as get does
+        '''
+        with self._lock:
+            return self._select(ids)
+
+market_snapshots = {}
+
+def get_market_snapshot(vs_currency="usd"):
+    ''' returns the snapshot shared by every caller for vs_currency
+    '''
+    if vs_currency not in market_snapshots:
+        market_snapshots[vs_currency] = MarketSnapshot(vs_currency)
+    return market_snapshots[vs_currency]
+
+def get_mkt_data_many(ids, vs_currency="usd"):
+    ''' retrieves market data about several coins at once from the shared snapshot
+        ex. get_mkt_data_many(["bitcoin", "ethereum"])
+    '''
+    mkt_data_df = get_market_snapshot(vs_currency).get(ids).reset_index()
+    return mkt_data_df.drop(columns=['name','image','roi','last_updated'], errors="ignore")
+
+def top_coins(n=100, client=None):
+    ''' returns the ids of the top n (default 100) coins by market cap, indexed by market_cap_rank, as CoinGeckoAPI.get_top_100
+    
+    fetched with client (default is cg) page by page and cached for endpoint_ttl["coins_markets"] seconds, in the
+    shared cache too if one is in use. the result is shared between callers and must not be modified.
+    raises ValueError if n is not a positive integer
+        ex. top_coins(250, client=cg.with_priority(RateLimiter.BULK))
+    '''
+    market_pages(n)
+    client = client or cg
+    
+    def fetch():
+        markets = top_markets(n, lambda page, per_page: client.get_coins_markets(vs_currency="usd", per_page=per_page, page=page))
+        return pd.DataFrame(markets, columns=["id", "market_cap_rank"]).set_index(keys="market_cap_rank")
+    
+    key = ("coins_markets", "usd", str(n))
+    ttl = endpoint_ttl["coins_markets"]
+    return response_cache.get_or_set(key, ttl, lambda: shared_fetch(key, ttl, fetch))
+
+def parse_market_chart(data):
+    ''' transforms a raw market chart response into a pandas dataframe of prices, log returns, market caps and total volumes
+    '''
+    start = metrics.clock()
+    columns = chart_columns(data)
+    dates = pd.DatetimeIndex(pd.to_datetime(columns.pop("date"), unit="ms", utc=True), name="date")
+    data = pd.DataFrame(columns, index=dates)
+    if start:
+        metrics.record("stage", "parse_market_chart", start, rows=len(data))
+    return data
+
+def append_market_chart(cached, tail):
+    ''' appends a freshly fetched tail to a cached market chart dataframe
+    
+    cached rows from the first tail date onwards are replaced, since the last point of a daily chart is intraday and gets restated
+    '''
+    if len(tail) == 0:
+        return cached
+    start = metrics.clock()
+    data = pd.concat([cached[cached.index < tail.index[0]], tail])
+    data = data[~data.index.duplicated(keep="last")]
+    # keeps what is known about the cached days, e.g. the days backfill_market_chart found the API has no data for
+    data.attrs = dict(cached.attrs)
+    data["log_returns"] = np.log(data.price / data.price.shift(1))
+    if start:
+        metrics.record("stage", "append_market_chart", start, rows=len(data))
+    return data
+
+def update_market_chart(coin, cached=None, vs_currency="usd", days="10000", client=None):
+    ''' fetches the market chart of coin, or only the days missing from cached (plus the restated intraday point)
+    and appends them to it
+    '''
+    client = client or cg
+    if cached is not None and len(cached):
+        # only fetch the days since the last cached point (plus one to restate the intraday point)
+        tail_days = (utc_timestamp() - cached.index[-1]).days + 2
+        tail = client.get_coin_market_chart_by_id(id=coin,vs_currency=vs_currency,days=str(tail_days),interval='daily')
+        return append_market_chart(cached, parse_market_chart(tail))
+    return parse_market_chart(client.get_coin_market_chart_by_id(id=coin,vs_currency=vs_currency,days=days))
+
+def load_market_chart(coin, vs_currency="usd", days="10000", cache=market_chart_cache, refresh=False, client=None, repair=False,
+                      max_age=None):
+    ''' retrieves the market chart of one coin and transforms it to a pandas dataframe
+    
+    the full history (days="10000") goes through the cache: fresh cached data is reused and stale cached data
+    only has its missing tail fetched. pass refresh=True to fetch the tail even if the cached data is still fresh,
+    or max_age (in seconds) to use another freshness limit than the cache's.
+    processes sharing the cache's backend coalesce their fetches, so a coin is fetched once however many ask for it.
+    with repair=True, the data has its gaps backfilled and is put on the daily grid (see backfill_market_chart).
+    the repaired chart is cached apart from the plain one, which other callers keep getting as the API sent it
+    '''
+    client = client or cg
+    
+    def fetch(cached):
+        data = update_market_chart(coin, cached, vs_currency, days, client)
+        if repair:
+            data = backfill_market_chart(coin, data, vs_currency, client=client)
+        return data
+    
+    if days != "10000" or not cache:
+        return fetch(None)
+    max_age = cache.max_age if max_age is None else max_age
+    
+    if repair:
+        def fetch_repaired(repaired):
+            grid = to_daily_grid(load_market_chart(coin, vs_currency, cache=cache, refresh=refresh, client=client, max_age=max_age))
+            if repaired is not None:
+                # days filled by earlier backfills are kept, and the ones found unavailable are not asked for again
+                grid = grid.combine_first(repaired.reindex(grid.index))[grid.columns]
+                grid["log_returns"] = np.log(grid.price / grid.price.shift(1))
+                grid.attrs = dict(repaired.attrs)
+            return backfill_market_chart(coin, grid, vs_currency, client=client)
+        return cache.get_or_fetch((vs_currency, coin, "repaired"), max_age, fetch_repaired, refresh)[0]
+    
+    # only one process (and thread) fetches a coin at a time, the others wait and read what it stored
+    data, fetched = cache.get_or_fetch((vs_currency, coin), max_age, fetch, refresh)
+    if metrics.enabled:
+        # a stale entry counts as a miss, even though only its tail is fetched
+        metrics.record("cache", "market_chart", hits=int(not fetched), misses=int(fetched))
+    return data
+
+def utc_timestamp(value=None):
+    ''' converts a date string, datetime or timestamp to a UTC pandas timestamp (default is now). naive values are taken as UTC
+    '''
+    if value is None:
+        return pd.Timestamp.now(tz="UTC")
+    value = pd.Timestamp(value)
+    if value.tzinfo is None:
+        return value.tz_localize("UTC")
+    return value.tz_convert("UTC")
+
+def validate_index(data):
+    ''' returns data with a sorted, de-duplicated UTC DatetimeIndex
+    
+    data is returned as is if its index already is one, so this is cheap to call before every slice
+    '''
+    if not isinstance(data.index, pd.DatetimeIndex):
+        data = data.set_axis(pd.DatetimeIndex(data.index, name=data.index.name), axis=0)
+    if data.index.tz is None:
+        data = data.tz_localize("UTC")
+    elif str(data.index.tz) != "UTC":
+        data = data.tz_convert("UTC")
+    if not data.index.is_monotonic_increasing:
+        data = data.sort_index(kind="stable")
+    if not data.index.is_unique:
+        # the later point is the restated one
+        data = data[~data.index.duplicated(keep="last")]
+    return data
+
+def slice_dates(data, start=None, end=None, snap=None):
+    ''' returns the rows of data from start to end (both included) as a view, found by binary search on the index
+    
+    with snap="nearest", start and end are first moved to the closest date in the index, so a date without a data
+    point still picks the row next to it
+        ex. slice_dates(CoinGeckoAPI().data, "2021-01-01", "2021-12-31")
+    '''
+    clock = metrics.clock()
+    data = validate_index(data)
+    index = data.index
+    if len(index) == 0:
+        return data
+    
+    # the index can be in ms (as parsed) while the bounds are in ns, and searchsorted refuses to drop precision,
+    # so bounds are rounded to the index's unit: start up and end down, which keeps both inclusive
+    def bound(value, rounding):
+        value = utc_timestamp(value)
+        return getattr(value, rounding)(index.unit).as_unit(index.unit)
+    
+    if start is None:
+        start_pos = 0
+    elif snap == "nearest":
+        start_pos = index.get_indexer([bound(start, "round")], method="nearest")[0]
+    else:
+        start_pos = index.searchsorted(bound(start, "ceil"), side="left")
+    
+    if end is None:
+        end_pos = len(index)
+    elif snap == "nearest":
+        end_pos = index.get_indexer([bound(end, "round")], method="nearest")[0] + 1
+    else:
+        end_pos = index.searchsorted(bound(end, "floor"), side="right")
+    
+    data = data.iloc[start_pos:max(start_pos, end_pos)]
+    if clock:
+        metrics.record("stage", "slice_dates", clock, rows=len(data))
+    return data
+
+# the longest window the range endpoint returns at each granularity (None means any length). it is also the default
+# range when no start is given, since splitting the whole history into windows would take thousands of calls
+granularity_windows = {
+    "5m": pd.Timedelta(days=1),
+    "hourly": pd.Timedelta(days=90),
+    "daily": None
+}
+# the shortest window the range endpoint serves at each granularity, an hourly window of a day or less comes back at 5m
+granularity_min_windows = {
+    "5m": None,
+    "hourly": pd.Timedelta(days=1, hours=1),
+    "daily": None
+}
+
+def load_market_chart_range(coin, start=None, end=None, vs_currency="usd", granularity="daily", max_workers=4, client=None):
+    ''' retrieves the market chart of one coin between start and end (default is up to now)
+    
+    granularity is one of 5m, hourly or daily. ranges longer than the endpoint serves at that granularity are split
+    into windows that are fetched in parallel and stitched back together, dropping the points duplicated at window edges.
+    the windows are counted back from end and a leftover window too short for the granularity starts earlier, so
+    every window comes back at the same resolution
+        ex. load_market_chart_range("bitcoin", "2024-01-01", "2024-06-30", granularity="hourly")
+    
+    without a start, daily data covers the full history, hourly data the last 90 days and 5m data the last day.
+    the API only serves 5m points for the last day, so 5m ranges starting earlier raise a ValueError instead of
+    silently coming back hourly
+    '''
+    if granularity not in granularity_windows:
+        raise ValueError("granularity must be one of {}".format(", ".join(granularity_windows)))
+    from concurrent.futures import ThreadPoolExecutor
+    
+    clock = metrics.clock()
+    client = client or cg
+    window = granularity_windows[granularity]
+    end = utc_timestamp(end)
+    if start is not None:
+        start = utc_timestamp(start)
+    elif window is not None:
+        start = end - window
+    else:
+        start = utc_timestamp(0)
+    if granularity == "5m" and start < utc_timestamp() - granularity_windows["5m"] - pd.Timedelta(minutes=5):
+        raise ValueError("5m data is only available for the last day, use hourly or daily granularity for older ranges")
+    
+    windows = []
+    if window is not None:
+        window_end = end
+        while window_end > start:
+            windows.insert(0, (max(window_end - window, start), window_end))
+            window_end -= window
+    windows = windows or [(start, end)]
+    shortest = granularity_min_windows[granularity]
+    if shortest is not None and windows[0][1] - windows[0][0] < shortest:
+        # the points before start are sliced off below
+        windows[0] = (windows[0][1] - shortest, windows[0][1])
+    
+    kwargs = {}
+    if granularity == "daily" and end - start <= pd.Timedelta(days=90):
+        # the endpoint would return hourly points for short ranges
+        kwargs["interval"] = "daily"
+    
+    def fetch(window):
+        raw = client.get_coin_market_chart_range_by_id(id=coin, vs_currency=vs_currency,
+                                                       from_timestamp=int(window[0].timestamp()),
+                                                       to_timestamp=int(window[1].timestamp()), **kwargs)
+        return parse_market_chart(raw)
+    
+    if len(windows) == 1:
+        frames = [fetch(windows[0])]
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            frames = list(pool.map(fetch, windows))
+    
+    data = pd.concat(frames).sort_index()
+    data = data[~data.index.duplicated(keep="last")]
+    data = slice_dates(data, start, end).copy()
+    data["log_returns"] = np.log(data.price / data.price.shift(1))
+    if clock:
+        metrics.record("stage", "load_market_chart_range", clock, rows=len(data))
+    return data
+
+def load_many(coin_ids, vs_currency="usd", days="10000", max_workers=8, cache=market_chart_cache, client=None):
+    ''' retrieves the market charts of several coins concurrently
+    
+    returns a pandas dataframe indexed by (coin, date) and a dict of {coin: exception} for the coins that failed,
+    so one bad coin does not abort the whole batch
+        ex. data, errors = load_many(CoinGeckoAPI().get_top_100().id, max_workers=4)
+    '''
+    from concurrent.futures import ThreadPoolExecutor
+    
+    start = metrics.clock()
+    coin_ids = list(coin_ids)
+    
+    # bulk loads queue behind interactive lookups in the rate limiter
+    client = client or cg
+    if isinstance(client, ThrottledClient):
+        client = client.with_priority(RateLimiter.BULK)
+    
+    def fetch(coin):
+        try:
+            return load_market_chart(coin, vs_currency=vs_currency, days=days, cache=cache, client=client), None
+        except Exception as e:
+            return None, e
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        results = list(pool.map(fetch, coin_ids))
+    
+    frames = {}
+    errors = {}
+    for coin, (data, error) in zip(coin_ids, results):
+        if error is None:
+            frames[coin] = data
+        else:
+            errors[coin] = error
+    
+    if frames:
+        data = pd.concat(frames, names=["coin", "date"])
+    else:
+        data = pd.DataFrame(columns=["price", "log_returns", "market_cap", "total_volume"],
+                            index=pd.MultiIndex.from_arrays([[], pd.DatetimeIndex([], tz="UTC")], names=["coin", "date"]))
+    if start:
+        metrics.record("stage", "load_many", start, rows=len(data))
+    return data, errors
+
+# gap detection and backfill
+class ChartCheck():
+    ''' Problems found in a market chart dataframe by check_market_chart
+    
+    Attributes
+    ==========
+    duplicates: DatetimeIndex
+        timestamps that appear more than once (restated points)
+    out_of_order: int
+        number of points dated before the point in front of them
+    gaps: pandas dataframe
+        one row per run of missing days, with the first missing day (start), the last one (end) and the number of days.
+        days whose row has no price count as missing
+    off_grid: DatetimeIndex
+        points that are not at midnight UTC, such as the intraday last point
+    '''
+    
+    def __init__(self, duplicates, out_of_order, gaps, off_grid):
+        self.duplicates = duplicates
+        self.out_of_order = out_of_order
+        self.gaps = gaps
+        self.off_grid = off_grid
+    
+    def __repr__(self):
+        return "ChartCheck(duplicates = {}, out_of_order = {}, gaps = {}, missing_days = {}, off_grid = {})".format(
+            len(self.duplicates), self.out_of_order, len(self.gaps), self.missing_days, len(self.off_grid))
+    
+    @property
+    def missing_days(self):
+        return int(self.gaps["days"].sum())
+    
+    @property
+    def ok(self):
+        ''' True if there are no duplicates, disorder or gaps (points off the daily grid are allowed)
+        '''
+        return not (len(self.duplicates) or self.out_of_order or len(self.gaps))
+    
+    @property
+    def on_grid(self):
+        ''' True if the data is ok and every point is at midnight UTC, as to_daily_grid returns it
+        '''
+        return self.ok and not len(self.off_grid)
+
+def check_market_chart(data):
+    ''' looks for duplicated, out of order and off grid timestamps and for missing days in a market chart dataframe
+        ex. check_market_chart(CoinGeckoAPI().data).gaps
+    '''
+    index = data.index if isinstance(data.index, pd.DatetimeIndex) else pd.DatetimeIndex(data.index)
+    index = index.tz_localize("UTC") if index.tz is None else index.tz_convert("UTC")
+    ns = index.tz_localize(None).values.astype("datetime64[ns]").view("int64")
+    day_ns = 86400 * 10 ** 9
+    
+    out_of_order = int((np.diff(ns) < 0).sum())
+    duplicates = index[index.duplicated()].unique()
+    off_grid = index[ns % day_ns != 0]
+    
+    # days with a price, in order; a step of more than one day between them is a gap
+    present = ns if "price" not in data else ns[data["price"].notna().to_numpy()]
+    days = np.unique(present // day_ns)
+    steps = np.diff(days)
+    at = np.flatnonzero(steps > 1)
+    gaps = pd.DataFrame({
+        "start": pd.to_datetime((days[at] + 1) * day_ns, utc=True),
+        "end": pd.to_datetime((days[at + 1] - 1) * day_ns, utc=True),
+        "days": steps[at] - 1
+    })
+    return ChartCheck(duplicates, out_of_order, gaps, off_grid)
+
+def to_daily_grid(data):
+    ''' returns data on the canonical daily grid: one row per UTC day at midnight from the first day to the last
+    
+    the last point of each day is kept (the restated one, or the intraday one on the last day), missing days are rows
+    of nan and log returns are only computed between consecutive days
+    '''
+    data = validate_index(data)
+    if len(data) == 0:
+        return data
+    days = data.index.floor("D")
+    last = ~days.duplicated(keep="last")
+    data = data[last].set_axis(days[last], axis=0)
+    data = data.reindex(pd.date_range(days[0], days[-1], freq="D", name="date"))
+    data["log_returns"] = np.log(data.price / data.price.shift(1))
+    return data
+
+def _day_numbers(spans):
+    # [[first day, last day], ...] as stored in attrs["unavailable"] to an array of days since the epoch
+    day_ns = 86400 * 10 ** 9
+    days = [np.arange(utc_timestamp(start).value // day_ns, utc_timestamp(end).value // day_ns + 1) for start, end in spans]
+    return np.concatenate(days) if days else np.array([], dtype="int64")
+
+def _day_spans(days):
+    # sorted days since the epoch to [[first day, last day], ...] of consecutive runs, as iso dates
+    if len(days) == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(days) > 1)
+    firsts, lasts = days[np.r_[0, breaks + 1]], days[np.r_[breaks, len(days) - 1]]
+    to_date = lambda day: str(np.datetime64(int(day), "D"))
+    return [[to_date(first), to_date(last)] for first, last in zip(firsts, lasts)]
+
+def plan_backfill(data, merge_within=7, recheck=False):
+    ''' returns the (start, end) date ranges to fetch to fill the gaps of data
+    
+    gaps less than merge_within days apart are fetched as one range, trading a few known days for fewer requests.
+    days a previous backfill found the API has no data for (data.attrs["unavailable"]) are not fetched again,
+    unless recheck=True
+    '''
+    gaps = check_market_chart(data).gaps
+    day_ns = 86400 * 10 ** 9
+    missing = _day_numbers([(start, end) for start, end in zip(gaps.start, gaps.end)])
+    if not recheck:
+        missing = np.setdiff1d(missing, _day_numbers(data.attrs.get("unavailable", [])))
+    
+    spans = []
+    for first, last in _day_spans(missing):
+        start, end = utc_timestamp(first), utc_timestamp(last)
+        if spans and (start - spans[-1][1]).days <= merge_within:
+            spans[-1] = (spans[-1][0], end)
+        else:
+            spans.append((start, end))
+    return spans
+
+def backfill_market_chart(coin, data, vs_currency="usd", merge_within=7, max_workers=4, client=None, recheck=False):
+    ''' fetches only the missing spans of data from the range endpoint and returns data on the daily grid with them filled
+    
+    days the API has no data for stay as nan rows and are recorded in the returned data's attrs["unavailable"], which
+    the cache keeps, so later backfills skip them (pass recheck=True to ask the API for them again)
+        ex. backfill_market_chart("bitcoin", CoinGeckoAPI().data)
+    '''
+    from concurrent.futures import ThreadPoolExecutor
+    
+    start = metrics.clock()
+    spans = plan_backfill(data, merge_within, recheck)
+    grid = to_daily_grid(data)
+    if not spans:
+        return grid
+    
+    client = client or cg
+    if isinstance(client, ThrottledClient):
+        client = client.with_priority(RateLimiter.BULK)
+    
+    def fetch(span):
+        # up to the end of the last missing day, in case its point is a little after midnight
+        return load_market_chart_range(coin, span[0], span[1] + pd.Timedelta(days=1) - pd.Timedelta(seconds=1),
+                                       vs_currency=vs_currency, granularity="daily", client=client)
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        frames = [frame for frame in pool.map(fetch, spans) if len(frame)]
+    if frames:
+        fetched = to_daily_grid(pd.concat(frames)).reindex(grid.index)
+        grid = grid.combine_first(fetched)[grid.columns]
+        grid["log_returns"] = np.log(grid.price / grid.price.shift(1))
+    
+    # the days of the fetched spans that are still empty are confirmed missing from the API
+    day_ns = 86400 * 10 ** 9
+    empty = grid.index[grid["price"].isna().to_numpy()].tz_localize(None).values.astype("datetime64[ns]").view("int64") // day_ns
+    fetched_days = _day_numbers([(span_start, span_end) for span_start, span_end in spans])
+    known = [] if recheck else data.attrs.get("unavailable", [])
+    grid.attrs["unavailable"] = _day_spans(np.union1d(np.intersect1d(empty, fetched_days), _day_numbers(known)))
+    if start:
+        metrics.record("stage", "backfill_market_chart", start, rows=sum(len(frame) for frame in frames))
+    return grid
+
+def repair_cache(cache=market_chart_cache, vs_currency=None, coins=None, merge_within=7, max_workers=8, client=None,
+                 recheck=False):
+    ''' checks every cached market chart (or the given coins) and backfills only the ones with problems, in place
+    
+    returns a pandas dataframe with one row per repaired coin: the gaps and missing days found, the days still missing
+    after the backfill (days the API has no data for) and the error if the backfill failed. coins whose only gaps
+    are days a previous repair found the API has no data for are skipped, unless recheck=True
+        ex. repair_cache(vs_currency="usd")
+    '''
+    from concurrent.futures import ThreadPoolExecutor
+    
+    keys = [key for key in cache.keys() if (vs_currency is None or key[0] == vs_currency) and (coins is None or key[1] in coins)]
+    
+    def repair(key):
+        data, age = cache.get(key)
+        if data is None:
+            return None
+        found = check_market_chart(data)
+        if found.ok or (not len(found.duplicates) and not found.out_of_order and not plan_backfill(data, merge_within, recheck)):
+            return None
+        row = {"vs_currency": key[0], "coin": key[1], "gaps": len(found.gaps), "missing_days": found.missing_days,
+               "duplicates": len(found.duplicates), "out_of_order": found.out_of_order, "still_missing": found.missing_days, "error": None}
+        try:
+            with cache.lock(key):
+                repaired = backfill_market_chart(key[1], data, key[0], merge_within, max_workers=1, client=client, recheck=recheck)
+                cache.set(key, repaired)
+            row["still_missing"] = check_market_chart(repaired).missing_days
+        except Exception as e:
+            row["error"] = repr(e)
+        return row
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        rows = [row for row in pool.map(repair, keys) if row is not None]
+    columns = ["vs_currency", "coin", "gaps", "missing_days", "duplicates", "out_of_order", "still_missing", "error"]
+    return pd.DataFrame(rows, columns=columns)
+
+# multi-currency data from one fetch per coin
+def align_rates(rates, index, tolerance=pd.Timedelta(days=1)):
+    ''' returns the rows of rates nearest to each date of index (within tolerance, nan otherwise) as a numpy array
+    '''
+    positions = rates.index.get_indexer(index, method="nearest", tolerance=tolerance)
+    aligned = rates.to_numpy(dtype="float64")[positions]
+    aligned[positions < 0] = np.nan
+    return aligned
+
+def fx_rates(currencies, base="usd", cache=market_chart_cache, refresh=False, client=None):
+    ''' returns daily exchange rates from base into each currency (units of the currency per unit of base), indexed by date
+    
+    the rates come from bitcoin's market chart in base and in each currency, so one cached chart per currency covers
+    every coin. btc is the inverse of bitcoin's price in base. results are cached for endpoint_ttl["fx_rates"] seconds
+        ex. fx_rates(["eur", "btc"])
+    '''
+    currencies = list(dict.fromkeys(currencies))
+    key = ("fx_rates", base, tuple(currencies))
+    if refresh:
+        conversion_cache.invalidate(key)
+    
+    def fetch():
+        anchor = load_market_chart("bitcoin", base, cache=cache, refresh=refresh, client=client).price
+        rates = {}
+        for currency in currencies:
+            if currency == base:
+                rates[currency] = np.ones(len(anchor))
+            elif currency == "btc":
+                rates[currency] = 1 / anchor.to_numpy()
+            else:
+                other = load_market_chart("bitcoin", currency, cache=cache, refresh=refresh, client=client).price
+                rates[currency] = align_rates(other, anchor.index) / anchor.to_numpy()
+        return pd.DataFrame(rates, index=anchor.index)
+    
+    return conversion_cache.get_or_set(key, endpoint_ttl["fx_rates"], fetch)
+
+def convert_market_chart(data, rates):
+    ''' converts a market chart dataframe quoted in one currency into every currency of rates (as returned by fx_rates)
+    
+    returns a dataframe with (currency, column) columns. the rate nearest to each date is used and log returns are
+    recomputed from the converted prices
+    '''
+    aligned = align_rates(rates, data.index)
+    values = data[["price", "market_cap", "total_volume"]].to_numpy(dtype="float64")
+    
+    # (dates, currencies, columns) in one broadcast multiplication
+    converted = values[:, None, :] * aligned[:, :, None]
+    log_returns = np.full(converted.shape[:2], np.nan)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_returns[1:] = np.log(converted[1:, :, 0] / converted[:-1, :, 0])
+    
+    columns = ["price", "log_returns", "market_cap", "total_volume"]
+    stacked = np.stack([converted[:, :, 0], log_returns, converted[:, :, 1], converted[:, :, 2]], axis=2)
+    return pd.DataFrame(stacked.reshape(len(data), -1), index=data.index,
+                        columns=pd.MultiIndex.from_product([rates.columns, columns], names=["currency", None]))
+
+def load_market_chart_multi(coin, currencies=("usd", "eur", "btc"), base="usd", cache=market_chart_cache, refresh=False, client=None):
+    ''' retrieves the market chart of one coin in several currencies, with (currency, column) columns
+    
+    only the base currency history is fetched for the coin, the other currencies are converted locally with fx_rates.
+    conversions are cached for endpoint_ttl["fx_rates"] seconds
+        ex. load_market_chart_multi("ethereum", ["usd", "eur", "btc"])["eur"].price
+    '''
+    currencies = list(dict.fromkeys(currencies))
+    data = load_market_chart(coin, base, cache=cache, refresh=refresh, client=client)
+    if len(data) == 0:
+        return convert_market_chart(data, pd.DataFrame(columns=currencies, dtype="float64"))
+    
+    # the key changes whenever the coin's data gets new points
+    key = ("conversion", coin, base, tuple(currencies), data.index[-1].value, len(data))
+    return conversion_cache.get_or_set(key, endpoint_ttl["fx_rates"],
+                                       lambda: convert_market_chart(data, fx_rates(currencies, base, cache, refresh, client)))
 
 # define CoinGeckoAPI class
 class CoinGeckoAPI(): 
@@ -12,20 +1146,54 @@ class CoinGeckoAPI():
     ==========
     coin: str
         id of coin (default is set to bitcoin)
+    vs_currency: str
+        currency the data is quoted in (default is set to usd)
+    cache: MarketChartCache
+        on-disk cache used by get_data (default is the shared market_chart_cache). pass None to always download the full history
+    start, end: str
+        date range of the data, e.g. "2024-01-01" (default is the full history up to now)
+    granularity: str
+        spacing of the data points, one of 5m, hourly or daily (default is set to daily). without a start date,
+        hourly data covers the last 90 days and 5m data the last day, the only day 5m data is available for
+    repair: bool
+        backfill missing days from the range endpoint whenever the daily history is downloaded, and return it on a
+        canonical daily grid: one row per day at midnight UTC, nan for days the API has no data for (default is False)
     
     Methods
     ==========
     get_data:
         retrieves daily prices, log returns, market caps and total volume data and transforms to pandas dataframe
         
-        to get pandas dataframe, use .data after initialization
+        to get pandas dataframe, use .data after initialization. the data is only downloaded on first access
             ex. CoinGeckoAPI().data
             
+    prefetch:
+        downloads the data straight away instead of on first access of .data
+            ex. CoinGeckoAPI("ethereum").prefetch()
+            
+    refresh:
+        fetches the days missing from the cached data and appends them, even if the cache is still fresh
+            ex. CoinGeckoAPI().refresh()
+            
+    invalidate:
+        removes the coin's cached data so the next get_data call downloads the full history
+            ex. CoinGeckoAPI().invalidate()
+            
+    get_data_multi:
+        retrieves the data in several currencies at once, with (currency, column) columns. only the vs_currency
+        history is downloaded, the other currencies are converted with exchange rates derived from bitcoin's charts
+            ex. CoinGeckoAPI("ethereum").get_data_multi(["usd", "eur", "btc"])["btc"]
+            
     get_top_100:
         retrieves id of top 100 cryptocurrencies on CoinGecko, organized by largest market cap (rank) in a pandas dataframe
         
         top 100 coins can be found using get_top_100 method on CoinGeckoAPI class
             ex. CoinGeckoAPI().get_top_100()
+        
+        pass n to get more (or fewer) coins
+            ex. CoinGeckoAPI().get_top_100(n=500)
+        
+        get_top_100 and get_coin_id results are shared by all instances and reused for the number of seconds in endpoint_ttl
             
     get_coin_id:
         retrieves coin id for all cryptocurrencies listed on CoinGecko in a pandas dataframe
@@ -42,98 +1210,253 @@ class CoinGeckoAPI():
         
         *if you know the name of the coin but not the ticker, the ticker can be found from the CoinGecko website
     
+    get_mkt_data:
+        retrieves current market data about the coin from a snapshot shared by all instances and refreshed every few minutes
+            ex. CoinGeckoAPI("ethereum").get_mkt_data()
+        
+        to get market data for several coins in a single request, use get_mkt_data_many
+            ex. get_mkt_data_many(["bitcoin", "ethereum"])
+    
         
             
             
     '''
     
-    def __init__(self, coin="bitcoin"):
+    def __init__(self, coin="bitcoin", vs_currency="usd", cache=market_chart_cache, start=None, end=None, granularity="daily", repair=False):
         self._coin = coin
+        self._vs_currency = vs_currency
+        self._cache = cache
+        self._start = start
+        self._end = end
+        self._granularity = granularity
+        self._repair = repair
         self.top_100 = None
         self.coin_id = None
-        
-        self.get_data()  
+        self._data = None
     
     def __repr__(self):
         return "CoinGeckoAPI(coin = {})".format(self._coin)
         
-    def get_data(self):
+    def get_data(self, refresh=False, start=None, end=None, vs_currency=None, granularity=None):
         ''' retrieves daily prices, log returns, market caps and total volume data and transforms to pandas dataframe
+        
+        start, end, vs_currency and granularity (5m, hourly or daily) replace the ones given at initialization.
+        without a start or end date the full daily history is loaded through the cache: fresh cached data is reused
+        and stale cached data only has its missing tail fetched. pass refresh=True to fetch the tail even if the
+        cached data is still fresh
         '''
-        data = cg.get_coin_market_chart_by_id(id=self._coin,vs_currency='usd',days='10000')
-        data = pd.DataFrame(data)
+        if start is not None:
+            self._start = start
+        if end is not None:
+            self._end = end
+        if vs_currency is not None:
+            self._vs_currency = vs_currency
+        if granularity is not None:
+            self._granularity = granularity
         
-        dates = []
-        for i, j in data.prices:
-            dates.append(i)
+        start = metrics.clock()
+        if self._start is None and self._end is None and self._granularity == "daily":
+            data = load_market_chart(self._coin, vs_currency=self._vs_currency, cache=self._cache, refresh=refresh, repair=self._repair)
+        else:
+            data = load_market_chart_range(self._coin, self._start, self._end, vs_currency=self._vs_currency, granularity=self._granularity)
+        if start:
+            metrics.record("stage", "get_data", start, rows=len(data))
+
+        self._data = data
     
-        prices = []
-        for i, j in data.prices:
-            prices.append(j)
+    def get_data_multi(self, currencies=("usd", "eur", "btc"), refresh=False):
+        ''' retrieves daily data in every currency of currencies from one download of the vs_currency history
+        
+        returns a pandas dataframe with (currency, column) columns, sliced to start and end if set. only daily
+        granularity is supported, since the exchange rates are daily
+        '''
+        if self._granularity != "daily":
+            raise ValueError("get_data_multi only supports daily granularity")
+        data = load_market_chart_multi(self._coin, currencies, base=self._vs_currency, cache=self._cache, refresh=refresh)
+        if self._start is not None or self._end is not None:
+            data = slice_dates(data, self._start, self._end)
+        return data
     
-        market_caps = []
-        for i, j in data.market_caps:
-            market_caps.append(j)
+    @property
+    def data(self):
+        ''' daily prices, log returns, market caps and total volume data, downloaded on first access
+        '''
+        if self._data is None:
+            self.get_data()
+        return self._data
     
-        total_volumes = []
-        for i, j in data.total_volumes:
-            total_volumes.append(j)
+    def prefetch(self):
+        ''' loads the data now instead of on first access of .data
+        '''
+        if self._data is None:
+            self.get_data()
+        return self
     
-        data["date"] = pd.DataFrame(dates)
-        data["price"] = pd.DataFrame(prices)
-        data["log_returns"] = np.log(data.price / data.price.shift(1))
-        data["market_cap"] = pd.DataFrame(market_caps)
-        data["total_volume"] = pd.DataFrame(total_volumes)
-        data["date"] = (pd.to_datetime(data["date"],unit='ms'))
-        data = data.drop(columns=["prices", "market_caps", "total_volumes"], axis=1)
-        data = data.set_index(data.date)
-        data = data.drop(columns="date", axis=1)
-
-        pd.set_option("display.float_format", lambda x: "%.3f" % x)
+    def refresh(self):
+        ''' fetches the missing tail of the cached data, even if the cached data is still fresh
+        '''
+        self.get_data(refresh=True)
+        return self.data
     
-        self.data = data
+    def invalidate(self):
+        ''' removes this coin's cached data, so the next get_data call downloads the full history again
+        '''
+        if self._cache:
+            self._cache.invalidate(self._coin, self._vs_currency)
         
-    def get_top_100(self):
-        ''' retrieves rank and id of the top 100 cryptocurrencies on CoinGecko, organized by market cap
+    def get_top_100(self, n=100):
+        ''' retrieves rank and id of the top n (default 100) cryptocurrencies on CoinGecko, organized by market cap
+        
+        more than 100 coins are fetched page by page (250 per page). results are cached for endpoint_ttl["coins_markets"] seconds,
+        in the shared cache too if one is in use (see top_coins)
         '''
-        top_100 = pd.DataFrame(cg.get_coins_markets(vs_currency="usd"))
-        top_100 = top_100.id, top_100.market_cap_rank
-        top_100 = pd.DataFrame(top_100).T.set_index(keys="market_cap_rank")
-        return top_100
-        self.top_100 = top_100
+        self.top_100 = top_coins(n).copy()
+        return self.top_100
     
     def get_coin_id(self):
         ''' retrieves coin id for all cryptocurrencies listed on CoinGecko 
+        
+        results are cached for endpoint_ttl["coins_list"] seconds, in the shared cache too if one is in use
         '''
-        coin_id = pd.DataFrame(cg.get_coins_list())
-        coin_id = coin_id.id, coin_id.symbol
-        coin_id = pd.DataFrame(coin_id).T.set_index(keys='symbol')
-        return coin_id
-        self.coin_id = coin_id
+        def fetch():
+            coin_id = pd.DataFrame(cg.get_coins_list(), columns=["id", "symbol"])
+            return coin_id.set_index(keys='symbol')
+        
+        key = ("coins_list",)
+        ttl = endpoint_ttl["coins_list"]
+        coin_id = response_cache.get_or_set(key, ttl, lambda: shared_fetch(key, ttl, fetch))
+        self.coin_id = coin_id.copy()
+        return self.coin_id
 
     def get_mkt_data(self):
-        """ retrieves market data about the coin
+        """ retrieves market data about the coin from the shared market snapshot
         """
-        mkt_data_df = pd.DataFrame(cg.get_coin_markets(vs_currency='usd'))
-        mkt_data_df = mkt_data_df.drop(columns=['name','image','roi','last_updated'], axis=1)
-        return mkt_data_df[mkt_data_df['id'] == self._coin]
+        return get_mkt_data_many([self._coin], vs_currency=self._vs_currency)
 
-# coin list for program
-def coin_list():
-    # turn the coin dataframe into strings
-    global all_coins_list
-    all_coins_list = []
+# coin registry
+class CoinRegistry():
+    ''' Indexed lookup of every coin listed on CoinGecko by id, symbol and name
     
-    for i in CoinGeckoAPI().get_coin_id().values.tolist():
-        for j in i:
-            all_coins_list.append(j)
-    return all_coins_list        
-coin_list()
+    Attributes
+    ==========
+    coins: list
+        coins as returned by get_coins_list, i.e. dicts with id, symbol and name
+        
+    Methods
+    ==========
+    resolve:
+        returns the ids matching an id, a ticker symbol or a name (case insensitive). several coins can share a symbol,
+        so this always returns a list
+            ex. CoinRegistry.load().resolve("eth")
+            
+    search:
+        returns the ids of all coins whose id, symbol or name starts with a prefix, using a sorted index
+            ex. CoinRegistry.load().search("bit")
+            
+    load:
+        builds the registry from the copy saved on disk, or from the API if that copy is missing or older than max_age
+            ex. CoinRegistry.load(max_age=24 * 60 * 60)
+    '''
+    
+    def __init__(self, coins=()):
+        self.coins = list(coins)
+        self.by_id = {}
+        self.by_symbol = {}
+        self.by_name = {}
+        keys = set()
+        
+        for coin in self.coins:
+            coin_id = coin["id"]
+            symbol = (coin.get("symbol") or "").lower()
+            name = (coin.get("name") or "").lower()
+            self.by_id[coin_id] = coin
+            self.by_symbol.setdefault(symbol, []).append(coin_id)
+            self.by_name.setdefault(name, []).append(coin_id)
+            keys.update([(coin_id.lower(), coin_id), (symbol, coin_id), (name, coin_id)])
+        
+        # (key, id) pairs sorted by key, so a prefix search is a bisect plus a scan over the matches only
+        self._index = sorted(keys)
+    
+    def __repr__(self):
+        return "CoinRegistry(coins = {})".format(len(self.coins))
+    
+    def __len__(self):
+        return len(self.coins)
+    
+    def __contains__(self, key):
+        return len(self.resolve(key)) > 0
+    
+    def resolve(self, key):
+        ''' returns the ids of the coins matching key as an id, a symbol or a name, in that order of preference
+        '''
+        if key in self.by_id:
+            return [key]
+        key = key.lower()
+        return list(self.by_symbol.get(key) or self.by_name.get(key) or [])
+    
+    def search(self, prefix, limit=None):
+        ''' returns the sorted ids of the coins whose id, symbol or name starts with prefix
+        '''
+        prefix = prefix.lower()
+        ids = set()
+        for key, coin_id in itertools.islice(self._index, bisect.bisect_left(self._index, (prefix,)), None):
+            if not key.startswith(prefix):
+                break
+            ids.add(coin_id)
+        ids = sorted(ids)
+        return ids[:limit] if limit is not None else ids
+    
+    def save(self, path):
+        ''' writes the coin list to path as json, together with the time it was fetched
+        '''
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"fetched_at": time.time(), "coins": self.coins}, f)
+        os.replace(tmp_path, path)
+    
+    @classmethod
+    def load(cls, path=None, max_age=24 * 60 * 60, client=None):
+        ''' returns the registry saved at path if it is younger than max_age seconds, otherwise fetches and saves a new one
+        
+        path defaults to coins_list.json in the market chart cache directory
+        '''
+        if path is None:
+            path = os.path.join(market_chart_cache.cache_dir, "coins_list.json")
+        try:
+            with open(path) as f:
+                saved = json.load(f)
+            if time.time() - saved["fetched_at"] < max_age:
+                return cls(saved["coins"])
+        except (OSError, ValueError, KeyError):
+            pass
+        
+        registry = cls((client or cg).get_coins_list())
+        registry.save(path)
+        return registry
 
-# delay print 
-import time
+# coin list for program, loaded on first use
+registry = None
 
-def delay_print(s, t):
+def coin_registry():
+    global registry
+    if registry is None:
+        registry = CoinRegistry.load()
+    return registry
+
+def coin_list():
+    # ids and symbols of every coin, kept for code that used the old flat list
+    return list(coin_registry().by_id) + list(coin_registry().by_symbol)
+
+# prompts are only typed out character by character when animate is on (python CoinGeckoAPI.py interactive --animate)
+animate = False
+
+# delay print 
+def delay_print(s, t=0.0325):
+    if not animate:
+        sys.stdout.write(s)
+        sys.stdout.flush()
+        return
     for c in s:
         sys.stdout.write(c)
         sys.stdout.flush()
@@ -141,10 +1464,8 @@ def delay_print(s, t):
 
 # test development 
 
-import sys
-import pyinputplus as pyip
-
 def launch_program():
+    import pyinputplus as pyip
     
     global coin_choice
     
@@ -154,11 +1475,16 @@ def launch_program():
         if response == "yes".lower() or response == "y".lower():
                 
                 coin_choice = input("Enter your coin here: \n")
-                if coin_choice in all_coins_list:
+                ids = coin_registry().resolve(coin_choice)
+                if len(ids) == 1:
                     
+                    coin_choice = ids[0]
                     data = CoinGeckoAPI(coin=coin_choice).data
                     print("Here is a snippet of the data for %s: \n" % (coin_choice))
                     return data
+                elif len(ids) > 1:
+                    print("'%s' matches several coins: %s. Please enter the id of the coin you want. \n" % (coin_choice, ", ".join(ids)))
+                    continue
                 else:
                     print("Error: Sorry, I couldn't find that coin in our list. Please verify and try again. \n")
                     continue
@@ -176,11 +1502,10 @@ def launch_program():
                         print("*All coins in the coingecko database that start with " + "'" + char + "'" + ": \n")
                         print("CoinGeckoAPI".center(50,"="))
                             
-                        # iterates through the list to find all coins that start with the user's character
-                        for i in all_coins_list:
-                            if i.startswith(char):
-                                print(i)
-                                print("".center(50, "-"))
+                        # looks up all coins that start with the user's character(s) in the sorted index
+                        for i in coin_registry().search(char):
+                            print(i)
+                            print("".center(50, "-"))
                         print("".center(50,"="))
                         print("*Note if you see an empty space, then the coin does not exist in the coingecko database. \n")
                         
@@ -198,11 +1523,16 @@ def launch_program():
 
                 # now, the user will input the name to get the data of the coin they were searching for
                 response = input("Please enter the name of your coin here: \n")
-                if response not in all_coins_list:
+                ids = coin_registry().resolve(response)
+                if len(ids) == 0:
                     print("Error: Sorry, I couldn't find that coin in our list. Please verify and try again. \n")
                     continue
+                elif len(ids) > 1:
+                    print("'%s' matches several coins: %s. Please enter the id of the coin you want. \n" % (response, ", ".join(ids)))
+                    continue
                     
                 else:
+                    response = ids[0]
                     coin_choice = response
                     print(f"Here is a snippet of the data for {coin_choice}: \n")
                     data = CoinGeckoAPI(coin=response).data
@@ -210,11 +1540,19 @@ def launch_program():
                     break
                     
 def slice_data(df):
+    df = validate_index(df)
+    first = df.index[0].normalize()
+    last = df.index[-1]
+    
     while True:
         print("The available data for " + coin_choice + " is from " + str(df.index[0])[0:10] + " to " + str(df.index[-1])[0:10] + ". \n")
         global timeframe_start
         timeframe_start = input("Where would you like your dataset to start? ('yyyy-mm-dd'): \n")
-        if timeframe_start in df.index:
+        try:
+            start = utc_timestamp(timeframe_start)
+        except ValueError:
+            start = None
+        if start is not None and first <= start <= last:
             break
         else:
             print("Sorry, you either inputted the date in the incorrect format or that timeframe isn't part of " + coin_choice + "'s dataset.\nPlease verify the start date and try again. \n")
@@ -222,8 +1560,12 @@ def slice_data(df):
     while True:
         global timeframe_end
         timeframe_end = input("Where would you like your dataset to end? ('yyyy-mm-dd'): \n")
-        if timeframe_end in df.index:
-            if (timeframe_end[0:4] > timeframe_start[0:4]) or (timeframe_end[0:4] == timeframe_start[0:4] and timeframe_end[5:7] == timeframe_start[5:7] and timeframe_end[8:] >= timeframe_start[8:]) or (timeframe_end[0:4] == timeframe_start[0:4] and timeframe_end[5:7] > timeframe_start[5:7]):
+        try:
+            end = utc_timestamp(timeframe_end)
+        except ValueError:
+            end = None
+        if end is not None and first <= end <= last:
+            if end >= start:
                 break
             else:
                 print("The end date you've entered is before the start date. Please try again. \n")
@@ -232,15 +1574,13 @@ def slice_data(df):
             print("Sorry, you either inputted the date in the incorrect format or that timeframe isn't part of " + coin_choice + "'s dataset.\nPlease verify the end date and try again. \n")
     
     global df_slice
-    df_slice = df.copy()
-    df_slice = df.loc[(df.index >= timeframe_start)&(df.index <= timeframe_end)]
+    df_slice = slice_dates(df, start, end, snap="nearest")
     print("Your sliced data has been saved in the variable df_slice. \n")
     return df_slice
-    print(df_slice)                    
-
-import matplotlib.pyplot as plt
 
 def plot_data(x):
+    import matplotlib.pyplot as plt
+    import pyinputplus as pyip
         
     choice = pyip.inputChoice(prompt="What plot would you like to visualize? (price, log returns, market cap, total volume)?: \n",
                          choices=["price", "log returns", "market cap", "total volume"])
@@ -282,6 +1622,7 @@ def plot_data(x):
     plt.show()
     
 def visualize_data():
+    import pyinputplus as pyip
     
     global timeframe_start_plot
     global timeframe_end_plot
@@ -312,44 +1653,177 @@ def visualize_data():
                 elif response == "no".lower() or response == "n".lower():
                     print("No problem. *Change this if necessary later.* \n")
 
-def export_data(x):
-
-    import pandas as pd
-
-    date = []
-    price = []
-    log_returns = []
-    market_cap = []
-    total_volume = []
-
-    # create dates
-    for i in x.index:
-        date.append(str(i)[0:10])
-
-    for i in x.price:
-        price.append(i)
+def date_unit(x):
+    ''' returns the unit dates of x are exported with: "D" for daily data (points a day or more apart, leaving aside
+    the intraday last point of the daily charts), otherwise "s" or "ms", whichever keeps every timestamp of the
+    hourly and 5 minute charts whole
+    '''
+    dates = x.index.get_level_values("date") if isinstance(x.index, pd.MultiIndex) else x.index
+    values = dates.values.astype("datetime64[ms]").view("int64")
+    day_ms = 86400 * 1000
+    if len(values) > 1:
+        daily = np.median(np.abs(np.diff(values))) >= day_ms
+    else:
+        daily = not (values % day_ms).any()
+    if daily:
+        return "D"
+    return "ms" if (values % 1000).any() else "s"
 
-    for i in x.log_returns:
-        log_returns.append(i)
+def export_data(x, unit=None):
+    
+    # multi-coin frames from load_many are indexed by (coin, date)
+    export_dict = {}
+    dates = x.index
+    if isinstance(x.index, pd.MultiIndex):
+        export_dict["coin"] = x.index.get_level_values("coin").to_numpy()
+        dates = x.index.get_level_values("date")
+    
+    # format all dates at once instead of calling str() on every timestamp. intraday data keeps its time of day
+    export_dict.update({
+        "date": np.datetime_as_string(dates.values, unit=unit or date_unit(x)),
+        "price": x.price.to_numpy(),
+        "log returns": x.log_returns.to_numpy(),
+        "market cap": x.market_cap.to_numpy(),
+        "total volume": x.total_volume.to_numpy()
+    })
 
-    for i in x.market_cap:
-        market_cap.append(i)
+    export_df = pd.DataFrame(export_dict)
+    return export_df                    
 
-    for i in x.total_volume:
-        total_volume.append(i)
+def export_chunks(frames, chunk_size=50000):
+    ''' yields export formatted chunks of at most chunk_size rows
+    
+    frames can be a dataframe, or an iterable (e.g. a generator) of dataframes or of (coin, dataframe) pairs.
+    the dates of a frame are all written with the same unit (see date_unit), whichever chunk they fall in
+    '''
+    if isinstance(frames, pd.DataFrame):
+        frames = [frames]
+    for frame in frames:
+        coin = None
+        if isinstance(frame, tuple):
+            coin, frame = frame
+        unit = date_unit(frame)
+        for start in range(0, len(frame), chunk_size):
+            chunk = export_data(frame.iloc[start:start + chunk_size], unit)
+            if coin is not None:
+                chunk.insert(0, "coin", coin)
+            yield chunk
 
-    export_dict = {
-        "date": date,
-        "price": price,
-        "log returns": log_returns,
-        "market cap": market_cap,
-        "total volume": total_volume
-    }
+def export_schema(columns):
+    ''' returns the arrow schema of export formatted columns: coin and date as strings, the values as float64
+    '''
+    import pyarrow as pa
+    return pa.schema([(column, pa.string() if column in ("coin", "date") else pa.float64()) for column in columns])
 
-    export_df = pd.DataFrame(export_dict)
-    return export_df                    
+def export_frames(frames, path, fmt=None, chunk_size=50000, compression=None, append=False):
+    ''' writes frames to path chunk by chunk, so only one chunk is ever copied into export format
+    
+    fmt is one of csv, parquet, feather or xlsx (default is taken from the file extension). compression is passed
+    on to parquet and feather (e.g. "snappy", "zstd", "lz4"). append=True adds the rows to an existing csv,
+    parquet or feather file instead of overwriting it. without any rows, the file is still written with the
+    export columns
+        ex. export_frames(df, "bitcoin.parquet", compression="zstd")
+            export_frames(((coin, CoinGeckoAPI(coin).data) for coin in ["bitcoin", "ethereum"]), "coins.csv")
+    '''
+    start = metrics.clock()
+    fmt = (fmt or os.path.splitext(path)[1].lstrip(".")).lower()
+    
+    written = [0]
+    def counted(chunks):
+        for chunk in chunks:
+            written[0] += len(chunk)
+            yield chunk
+    chunks = counted(export_chunks(frames, chunk_size))
+    
+    def empty():
+        # what an empty input is exported as (a single empty dataframe keeps its coin column if it has one)
+        if isinstance(frames, pd.DataFrame):
+            return export_data(frames.iloc[:0], "D")
+        return export_data(parse_market_chart({"prices": [], "market_caps": [], "total_volumes": []}), "D")
+    
+    if fmt == "csv":
+        write_header = not (append and os.path.exists(path) and os.path.getsize(path) > 0)
+        with open(path, "a" if append else "w", newline="") as f:
+            for chunk in chunks:
+                chunk.to_csv(f, header=write_header, index=False)
+                write_header = False
+            if write_header:
+                empty().to_csv(f, index=False)
+    
+    elif fmt in ("parquet", "feather", "arrow"):
+        import pyarrow as pa
+        
+        # arrow files cannot be extended in place, so appending copies the existing batches into a new file first
+        tmp_path = path + ".tmp"
+        existing = None
+        schema = None
+        if append and os.path.exists(path):
+            if fmt == "parquet":
+                import pyarrow.parquet as pq
+                source = pq.ParquetFile(path)
+                existing = (source.read_row_group(i) for i in range(source.num_row_groups))
+                schema = source.schema_arrow
+            else:
+                source = pa.ipc.open_file(path)
+                existing = (pa.Table.from_batches([source.get_batch(i)]) for i in range(source.num_record_batches))
+                schema = source.schema
+        
+        def open_writer(schema):
+            if fmt == "parquet":
+                import pyarrow.parquet as pq
+                return pq.ParquetWriter(tmp_path, schema, compression=compression or "snappy")
+            options = pa.ipc.IpcWriteOptions(compression=compression) if compression else None
+            return pa.ipc.new_file(tmp_path, schema, options=options)
+        
+        writer = None
+        try:
+            new = (pa.Table.from_pandas(chunk, schema=export_schema(chunk.columns), preserve_index=False) for chunk in chunks)
+            for table in itertools.chain(existing or [], new):
+                if writer is None:
+                    schema = schema or table.schema
+                    writer = open_writer(schema)
+                writer.write_table(table.cast(schema))
+            if writer is None:
+                # no rows, the file still gets the export columns
+                writer = open_writer(schema or export_schema(empty().columns))
+            writer.close()
+            writer = None
+            os.replace(tmp_path, path)
+        finally:
+            if writer is not None:
+                writer.close()
+            # a failed export leaves the previous file as it was and no partial file behind
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    
+    elif fmt == "xlsx":
+        if append:
+            raise ValueError("appending is not supported for xlsx files, use csv, parquet or feather instead")
+        from openpyxl import Workbook
+        
+        # write-only workbooks stream rows to disk instead of keeping every cell in memory
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet()
+        write_header = True
+        for chunk in chunks:
+            if write_header:
+                sheet.append(list(chunk.columns))
+                write_header = False
+            chunk = chunk.astype(object).where(chunk.notna(), None)
+            for row in chunk.itertuples(index=False, name=None):
+                sheet.append(row)
+        if write_header:
+            sheet.append(list(empty().columns))
+        workbook.save(path)
+    
+    else:
+        raise ValueError("unsupported export format: {}".format(fmt))
+    
+    if start:
+        metrics.record("stage", "export_" + fmt, start, rows=written[0], bytes=os.path.getsize(path))
                                      
 def csv_questions():
+    import pyinputplus as pyip
     response = pyip.inputChoice(prompt="For your CSV file(s), would you like to export the entire dataset, sliced dataset or both? (entire dataset, sliced dataset, both) \n",
                                     choices=["entire dataset", "sliced dataset", "both"])
     # export entire dataset
@@ -357,10 +1831,8 @@ def csv_questions():
         delay_print("What would you like to name your csv file (entire dataset): \n", 0.0325)
         csv_name_entire = input()
         delay_print("Okay. Please wait a moment as we export your data to csv format: \n",0.0325)
-        export_df = export_data(df)
         print("Exporting to CSV".center(30,"="))
-        time.sleep(1.5)
-        export_df.to_csv(csv_name_entire+".csv", index=False)
+        export_frames(df, csv_name_entire+".csv")
         delay_print(f"Your data has been saved as: {csv_name_entire}.csv \n",0.0325)
     
     # export sliced dataset
@@ -369,20 +1841,16 @@ def csv_questions():
         csv_name_sliced = input()
         try:
             delay_print("Okay. Please wait a moment as we export your data to csv format: \n",0.0325)
-            export_df_slice = export_data(df_slice)
             print("Exporting to CSV".center(30,"="))
-            time.sleep(1.5)
-            export_df_slice.to_csv(csv_name_sliced+".csv", index=False)
+            export_frames(df_slice, csv_name_sliced+".csv")
             delay_print(f"Your data has been saved as: {csv_name_sliced}.csv \n",0.0325)
         except NameError:
             response = pyip.inputYesNo("No sliced dataset exists. Would you like to create a sliced dataset to export (yes/no)?: \n")
             if response == "yes".lower() or response == "y".lower():
                 slice_data(df)
                 delay_print("Okay. Please wait a moment as we export your data to csv format: \n",0.0325)
-                export_df_slice = export_data(df_slice)
                 print("Exporting to CSV".center(30,"="))
-                time.sleep(1.5)
-                export_df_slice.to_csv(csv_name_sliced+".csv", index=False)
+                export_frames(df_slice, csv_name_sliced+".csv")
                 delay_print(f"Your data has been saved as: {csv_name_sliced}.csv \n",0.0325)
             elif response == "no".lower() or response == "n".lower():
                 response = pyip.inputYesNo("Would you like to export the entire dataset instead (yes/no)?: \n")
@@ -390,10 +1858,8 @@ def csv_questions():
                     delay_print("What would you like to name your csv file (entire dataset): \n", 0.0325)
                     csv_name_entire = input()
                     delay_print("Okay. Please wait a moment as we export your data to csv format: \n",0.0325)
-                    export_df = export_data(df)
                     print("Exporting to CSV".center(30,"="))
-                    time.sleep(1.5)
-                    export_df.to_csv(csv_name_entire+".csv", index=False)
+                    export_frames(df, csv_name_entire+".csv")
                     delay_print(f"Your data has been saved as: {csv_name_entire}.csv \n",0.0325)
                 elif response == "no".lower() or response == "n".lower():
                     print("No problem. Change this if necessary later. \n")
@@ -405,10 +1871,8 @@ def csv_questions():
         delay_print("What would you like to name your csv file (entire dataset): \n", 0.0325)
         csv_name_entire = input()
         delay_print("Okay. Please wait a moment as we export your data to csv format: \n",0.0325)
-        export_df = export_data(df)
         print("Exporting to CSV".center(30,"="))
-        time.sleep(1.5)
-        export_df.to_csv(csv_name_entire+".csv", index=False)
+        export_frames(df, csv_name_entire+".csv")
         delay_print(f"Your data has been saved as: {csv_name_entire}.csv \n",0.0325)
         
         # saving the sliced dataset
@@ -416,20 +1880,16 @@ def csv_questions():
         csv_name_sliced = input()
         try:
             delay_print("Okay. Please wait a moment as we export your data to csv format: \n",0.0325)
-            export_df_slice = export_data(df_slice)
             print("Exporting to CSV".center(30,"="))
-            export_df_slice.to_csv(csv_name_sliced+".csv", index=False)
-            time.sleep(1.5)
+            export_frames(df_slice, csv_name_sliced+".csv")
             delay_print(f"Your data has been saved as: {csv_name_sliced}.csv \n",0.0325)
         except NameError:
             response = pyip.inputYesNo("No sliced dataset exists. Would you like to create a sliced dataset to export (yes/no)?: \n")
             if response == "yes".lower() or response == "y".lower():
                 slice_data(df)
                 delay_print("Okay. Please wait a moment as we export your data to csv format: \n",0.0325)
-                export_df_slice = export_data(df_slice)
                 print("Exporting to CSV".center(30,"="))
-                time.sleep(1.5)
-                export_df_slice.to_csv(csv_name_sliced+".csv", index=False)
+                export_frames(df_slice, csv_name_sliced+".csv")
                 delay_print(f"Your data has been saved as: {csv_name_sliced}.csv \n",0.0325)
             elif response == "no".lower() or response == "n".lower():
                 response = pyip.inputYesNo("Would you like to export the entire dataset instead (yes/no)?: \n")
@@ -437,15 +1897,14 @@ def csv_questions():
                     delay_print("What would you like to name your csv file (entire dataset): \n", 0.0325)
                     csv_name_entire = input()
                     delay_print("Okay. Please wait a moment as we export your data to csv format: \n",0.0325)
-                    export_df = export_data(df)
                     print("Exporting to CSV".center(30,"="))
-                    time.sleep(1.5)
-                    export_df.to_csv(csv_name_entire+".csv", index=False)
+                    export_frames(df, csv_name_entire+".csv")
                     delay_print(f"Your data has been saved as: {csv_name_entire}.csv \n",0.0325)
                 elif response == "no".lower() or response == "n".lower():
                     print("No problem. Change this if necessary later. \n")
 
 def xlsx_questions():
+    import pyinputplus as pyip
     response = pyip.inputChoice(prompt="For your xlsx file(s), would you like to export the entire dataset, sliced dataset or both? (entire dataset, sliced dataset, both) \n",
                                     choices=["entire dataset", "sliced dataset", "both"])
     # export entire dataset
@@ -453,10 +1912,8 @@ def xlsx_questions():
         delay_print("What would you like to name your xlsx file (entire dataset): \n", 0.0325)
         xlsx_name_entire = input()
         delay_print("Okay. Please wait a moment as we export your data to xlsx format: \n",0.0325)
-        export_df = export_data(df)
         print("Exporting to XLSX".center(30,"="))
-        time.sleep(1.5)
-        export_df.to_excel(xlsx_name_entire+".xlsx", index=False)
+        export_frames(df, xlsx_name_entire+".xlsx")
         # remember to change it so the name is show: your data has been saved to 'filename.xlxs'
         delay_print(f"Your data has been saved as: {xlsx_name_entire}.xlsx \n",0.0325)
     
@@ -466,20 +1923,16 @@ def xlsx_questions():
         xlsx_name_sliced = input()
         try:
             delay_print("Okay. Please wait a moment as we export your data to xlsx format: \n",0.0325)
-            export_df_slice = export_data(df_slice)
             print("Exporting to XLSX".center(30,"="))
-            time.sleep(1.5)
-            export_df_slice.to_excel(xlsx_name_sliced+".xlsx", index=False)
+            export_frames(df_slice, xlsx_name_sliced+".xlsx")
             delay_print(f"Your data has been saved as: {xlsx_name_sliced}.xlsx \n",0.0325)
         except NameError:
             response = pyip.inputYesNo("No sliced dataset exists. Would you like to create a sliced dataset to export (yes/no)?: \n")
             if response == "yes".lower() or response == "y".lower():
                 slice_data(df)
                 delay_print("Okay. Please wait a moment as we export your data to xlsx format: \n",0.0325)
-                export_df_slice = export_data(df_slice)
                 print("Exporting to XLSX".center(30,"="))
-                time.sleep(1.5)
-                export_df_slice.to_excel(xlsx_name_sliced+".xlsx", index=False)
+                export_frames(df_slice, xlsx_name_sliced+".xlsx")
                 delay_print(f"Your data has been saved as: {xlsx_name_sliced}.xlsx \n",0.0325)
             elif response == "no".lower() or response == "n".lower():
                 response = pyip.inputYesNo("Would you like to export the entire dataset instead (yes/no)?: \n")
@@ -487,10 +1940,8 @@ def xlsx_questions():
                     delay_print("What would you like to name your xlsx file (entire dataset): \n", 0.0325)
                     xlsx_name_entire = input()
                     delay_print("Okay. Please wait a moment as we export your data to xlsx format: \n",0.0325)
-                    export_df = export_data(df)
                     print("Exporting to XLSX".center(30,"="))
-                    time.sleep(1.5)
-                    export_df.to_excel(xlsx_name_entire+".xlsx", index=False)
+                    export_frames(df, xlsx_name_entire+".xlsx")
                     # remember to change it so the name is show: your data has been saved to 'filename.xlxs'
                     delay_print(f"Your data has been saved as: {xlsx_name_entire}.xlsx \n",0.0325)
                 elif response == "no".lower() or response == "n".lower():
@@ -503,10 +1954,8 @@ def xlsx_questions():
         delay_print("What would you like to name your xlsx file (entire dataset): \n", 0.0325)
         xlsx_name_entire = input()
         delay_print("Okay. Please wait a moment as we export your data to xlsx format: \n",0.0325)
-        export_df = export_data(df)
         print("Exporting to XLSX".center(30,"="))
-        time.sleep(1.5)
-        export_df.to_excel(xlsx_name_entire+".xlsx", index=False)
+        export_frames(df, xlsx_name_entire+".xlsx")
         # remember to change it so the name is show: your data has been saved to 'filename.xlxs'
         delay_print(f"Your data has been saved as: {xlsx_name_entire}.xlsx \n",0.0325)
         
@@ -515,20 +1964,16 @@ def xlsx_questions():
         xlsx_name_sliced = input()
         try:
             delay_print("Okay. Please wait a moment as we export your data to xlsx format: \n",0.0325)
-            export_df_slice = export_data(df_slice)
             print("Exporting to XLSX".center(30,"="))
-            time.sleep(1.5)
-            export_df_slice.to_excel(xlsx_name_sliced+".xlsx", index=False)
+            export_frames(df_slice, xlsx_name_sliced+".xlsx")
             delay_print(f"Your data has been saved as: {xlsx_name_sliced}.xlsx \n",0.0325)
         except NameError:
             response = pyip.inputYesNo("No sliced dataset exists. Would you like to create a sliced dataset to export (yes/no)?: \n")
             if response == "yes".lower() or response == "y".lower():
                 slice_data(df)
                 delay_print("Okay. Please wait a moment as we export your data to xlsx format: \n",0.0325)
-                export_df_slice = export_data(df_slice)
                 print("Exporting to XLSX".center(30,"="))
-                time.sleep(1.5)
-                export_df_slice.to_excel(xlsx_name_sliced+".xlsx", index=False)
+                export_frames(df_slice, xlsx_name_sliced+".xlsx")
                 delay_print(f"Your data has been saved as: {xlsx_name_sliced}.xlsx \n",0.0325)
             elif response == "no".lower() or response == "n".lower():
                 response = pyip.inputYesNo("Would you like to export the entire dataset instead (yes/no)?: \n")
@@ -536,15 +1981,15 @@ def xlsx_questions():
                     delay_print("What would you like to name your xlsx file (entire dataset): \n", 0.0325)
                     csv_name_entire = input()
                     delay_print("Okay. Please wait a moment as we export your data to xlsx format: \n",0.0325)
-                    export_df = export_data(df)
                     print("Exporting to XLSX".center(30,"="))
-                    time.sleep(1.5)
-                    export_df.to_excel(xlsx_name_entire+".xlsx", index=False)
+                    export_frames(df, xlsx_name_entire+".xlsx")
                     delay_print(f"Your data has been saved as: {xlsx_name_entire}.xlsx \n",0.0325)
                 elif response == "no".lower() or response == "n".lower():
                     print("No problem. Change this if necessary later. \n")
 
 def export_data_questions():
+    import pyinputplus as pyip
+    
     global csv_name_entire
     global csv_name_sliced
     global xlsx_name_entire
@@ -566,40 +2011,203 @@ def export_data_questions():
     elif response == "no".lower() or response == "n".lower():
         delay_print("Okay, no problem. \n",0.0325)
 
-delay_print("Welcome to the CoinGecko API service!\n",0.0325)
-df = launch_program()
-print(df, '\n')
-print("Your data has been stored in the variable df for any further data analysis. \n")
+def interactive():
+    import pyinputplus as pyip
+    
+    global df
+    global df_slice
+    
+    # only the interactive program changes how pandas prints floats, the library leaves the option alone
+    pd.set_option("display.float_format", lambda x: "%.3f" % x)
+    
+    delay_print("Welcome to the CoinGecko API service!\n",0.0325)
+    df = launch_program()
+    print(df, '\n')
+    print("Your data has been stored in the variable df for any further data analysis. \n")
 
-while True:
-    response = pyip.inputYesNo(prompt="Would you like to perform additional operations on your data? (yes/no): \n")
-    if response == "yes".lower() or response == "y".lower():
-        response = pyip.inputChoice(prompt="What operation would you like to perform? (slice data, visualize data, close program): \n",
-                                    choices=["slice data", "visualize data", "close program"])
-        if response == "slice data":
-            df_slice = slice_data(df)
-        elif response == "visualize data":
-            visualize_data()
-        elif response == "close program":
+    while True:
+        response = pyip.inputYesNo(prompt="Would you like to perform additional operations on your data? (yes/no): \n")
+        if response == "yes".lower() or response == "y".lower():
+            response = pyip.inputChoice(prompt="What operation would you like to perform? (slice data, visualize data, close program): \n",
+                                        choices=["slice data", "visualize data", "close program"])
+            if response == "slice data":
+                df_slice = slice_data(df)
+            elif response == "visualize data":
+                visualize_data()
+            elif response == "close program":
+                delay_print("Please wait a few moments as we save your data: \n", 0.0325)
+                print("Saving Data".center(30,"="))
+                delay_print("Your data as been saved! \n", 0.0325)
+                export_data_questions()
+                delay_print("Please wait a few moments as we close the program: \n".center(20,"="),0.0325)
+                print("Closing Program".center(30,"="))
+                break
+            
+        # can add more logic here later when necessary
+        elif response == "no".lower() or response == "n".lower():
             delay_print("Please wait a few moments as we save your data: \n", 0.0325)
             print("Saving Data".center(30,"="))
-            time.sleep(3)
-            delay_print("Your data as been saved! \n", 0.0325)
+            delay_print("Your data has been saved! \n", 0.0325)
             export_data_questions()
             delay_print("Please wait a few moments as we close the program: \n".center(20,"="),0.0325)
             print("Closing Program".center(30,"="))
-            time.sleep(3)
             break
-            
-    # can add more logic here later when necessary
-    elif response == "no".lower() or response == "n".lower():
-        delay_print("Please wait a few moments as we save your data: \n", 0.0325)
-        print("Saving Data".center(30,"="))
-        time.sleep(3)
-        delay_print("Your data has been saved! \n", 0.0325)
-        export_data_questions()
-        delay_print("Please wait a few moments as we close the program: \n".center(20,"="),0.0325)
-        print("Closing Program".center(30,"="))
-        time.sleep(3)
-        break
-delay_print("Thank you for using the CoinGeckoApi program. Happy analyzing!",0.0325)
+    delay_print("Thank you for using the CoinGeckoApi program. Happy analyzing!",0.0325)
+
+# command line
+def resolve_coins(keys, client=None):
+    ''' resolves ids, symbols or names to coin ids. a symbol shared by several coins picks the one with the largest market cap
+    
+    with a client, the coin list and market caps come from it instead of the registry and snapshot shared by the process
+    '''
+    registry = coin_registry() if client is None else CoinRegistry(client.get_coins_list())
+    snapshot = get_market_snapshot() if client is None else MarketSnapshot(client=client)
+    ids = []
+    for key in keys:
+        matches = registry.resolve(key)
+        if len(matches) > 1:
+            market_caps = snapshot.get(matches).get("market_cap")
+            if market_caps is None or market_caps.dropna().empty:
+                raise ValueError("'{}' matches several coins: {}. Please use the id of the coin you want".format(key, ", ".join(matches)))
+            matches = [market_caps.idxmax()]
+            print("'{}' matches several coins, using {} (largest market cap)".format(key, matches[0]), file=sys.stderr)
+        elif not matches:
+            raise ValueError("couldn't find '{}' in the CoinGecko coin list".format(key))
+        ids.extend(matches)
+    return list(dict.fromkeys(ids))
+
+def parse_end(value):
+    ''' converts the --to argument to a timestamp. a date without a time (yyyy-mm-dd) covers that whole day
+    '''
+    if value is None:
+        return None
+    import datetime
+    end = utc_timestamp(value)
+    try:
+        datetime.date.fromisoformat(value.strip())
+    except ValueError:
+        return end
+    return end + pd.Timedelta(days=1) - pd.Timedelta(milliseconds=1)
+
+def fetch_command(args):
+    ''' fetches, slices and exports the coins given on the command line. returns the exit code
+    '''
+    # --api-url only applies to this command, later batch lines and library callers keep using cg
+    client = make_client(args.api_url) if args.api_url else cg
+    try:
+        end = parse_end(args.end)
+        if args.top:
+            ids = list(top_coins(args.top, client=client).id)
+        else:
+            ids = resolve_coins((key.strip() for key in args.coins.split(",") if key.strip()), client=None if client is cg else client)
+    except ValueError as e:
+        print("error: {}".format(e), file=sys.stderr)
+        return 2
+    cache = None if args.no_cache else market_chart_cache
+    
+    frames = {}
+    errors = {}
+    if args.granularity == "daily" and not args.refresh:
+        # the full history goes through the cache, so scheduled runs only fetch what is new
+        data, errors = load_many(ids, vs_currency=args.vs_currency, max_workers=args.workers, cache=cache, client=client)
+        for coin in ids:
+            if coin not in errors:
+                frames[coin] = slice_dates(data.loc[coin], args.start, end)
+    else:
+        for coin in ids:
+            try:
+                if args.granularity == "daily":
+                    data = load_market_chart(coin, vs_currency=args.vs_currency, cache=cache, refresh=True, client=client)
+                    frames[coin] = slice_dates(data, args.start, end)
+                else:
+                    frames[coin] = load_market_chart_range(coin, args.start, end, vs_currency=args.vs_currency,
+                                                           granularity=args.granularity, max_workers=args.workers, client=client)
+            except Exception as e:
+                errors[coin] = e
+    
+    for coin, error in errors.items():
+        print("error: {}: {}".format(coin, error), file=sys.stderr)
+    if not frames:
+        return 1
+    data = pd.concat(frames, names=["coin", "date"])
+    
+    if args.export:
+        path = args.output or "{}.{}".format(ids[0] if len(ids) == 1 else "coins", args.export)
+        export_frames(data, path, fmt=args.export, compression=args.compression, append=args.append)
+        if not args.quiet:
+            print("saved {} rows of {} coin(s) to {}".format(len(data), len(frames), path))
+    elif not args.quiet:
+        with pd.option_context("display.float_format", lambda x: "%.3f" % x):
+            print(data)
+    return 1 if errors else 0
+
+def batch_command(args):
+    ''' runs every line of a batch file as a fetch command. returns the highest exit code of the lines
+    '''
+    import shlex
+    parser = build_parser()
+    if args.file == "-":
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(args.file) as f:
+            lines = f.read().splitlines()
+    
+    status = 0
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        try:
+            job = parser.parse_args(["fetch"] + shlex.split(line))
+        except SystemExit:
+            print("error: line {}: {}".format(number, line), file=sys.stderr)
+            status = max(status, 2)
+            continue
+        status = max(status, fetch_command(job))
+    return status
+
+def build_parser():
+    import argparse
+    parser = argparse.ArgumentParser(prog="CoinGeckoAPI.py", description="Retrieve, slice and export CoinGecko market data")
+    commands = parser.add_subparsers(dest="command")
+    
+    prompts = commands.add_parser("interactive", help="guided interactive session (the default)")
+    prompts.add_argument("--animate", action="store_true", help="type prompts out character by character")
+    
+    fetch = commands.add_parser("fetch", help="fetch, slice and export without prompts",
+                                description="ex. python CoinGeckoAPI.py fetch --coins btc,eth --from 2024-01-01 --to 2024-06-30 --export parquet")
+    coins = fetch.add_mutually_exclusive_group(required=True)
+    coins.add_argument("--coins", help="comma separated ids, symbols or names")
+    coins.add_argument("--top", type=int, help="the top N coins by market cap")
+    fetch.add_argument("--from", dest="start", help="first date (yyyy-mm-dd), default is the start of the history")
+    fetch.add_argument("--to", dest="end", help="last date (yyyy-mm-dd, included), default is now")
+    fetch.add_argument("--vs-currency", default="usd")
+    fetch.add_argument("--granularity", choices=list(granularity_windows), default="daily")
+    fetch.add_argument("--export", choices=["csv", "parquet", "feather", "xlsx"], help="write the data instead of printing it")
+    fetch.add_argument("--output", help="file to export to (default is <coin>.<format>, or coins.<format> for several coins)")
+    fetch.add_argument("--compression", help="parquet / feather compression, e.g. zstd")
+    fetch.add_argument("--append", action="store_true", help="add the rows to an existing csv, parquet or feather file")
+    fetch.add_argument("--workers", type=int, default=8, help="coins fetched concurrently")
+    fetch.add_argument("--refresh", action="store_true", help="fetch the latest points even if the cache is fresh")
+    fetch.add_argument("--no-cache", action="store_true", help="neither read nor write the on-disk cache")
+    fetch.add_argument("--quiet", action="store_true")
+    fetch.add_argument("--api-url", help="base url of the API, e.g. the Pro API or a local mock server")
+    
+    batch = commands.add_parser("batch", help="run a file of fetch commands, one per line ('-' reads stdin)",
+                                description="every non-empty line not starting with # holds the arguments of one fetch command")
+    batch.add_argument("file")
+    return parser
+
+def main(argv=None):
+    global animate
+    args = build_parser().parse_args(argv)
+    if args.command == "fetch":
+        return fetch_command(args)
+    if args.command == "batch":
+        return batch_command(args)
+    animate = getattr(args, "animate", False)
+    interactive()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,199 @@
+# ANALYTICS
+# vectorized risk and return metrics over a wide (date x coin) price matrix
+import numpy as np, pandas as pd
+
+def price_matrix(data, column="price"):
+    ''' turns a (coin, date) frame from load_many into a wide dataframe with one column per coin
+        ex. data, errors = load_many(["bitcoin", "ethereum"])
+            prices = price_matrix(data)
+    '''
+    return data[column].unstack("coin").sort_index()
+
+def log_returns(prices, previous=None):
+    ''' returns the log returns of a wide price matrix. previous is the price row before the first row, if any
+    '''
+    values = prices.to_numpy(dtype="float64")
+    if previous is not None:
+        values = np.vstack([previous, values])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        returns = np.log(values[1:] / values[:-1])
+    if previous is None:
+        returns = np.vstack([np.full((1, values.shape[1]), np.nan), returns])
+    return pd.DataFrame(returns, index=prices.index, columns=prices.columns)
+
+class PriceAnalytics():
+    ''' Rolling volatility, drawdowns, Sharpe ratios, betas and correlations of many coins, computed in one pass
+
+    every metric is kept as running sums over the return matrix, so update only processes the appended rows
+
+    Attributes
+    ==========
+    prices: pandas dataframe
+        wide price matrix, one row per date and one column per coin
+    window: int
+        number of periods in the rolling volatility window (default is 30)
+    periods_per_year: int
+        used to annualize volatility and Sharpe ratios (default is 365, crypto trades every day)
+    benchmark: str
+        coin the betas are measured against (default is set to bitcoin)
+    risk_free: float
+        annual risk free rate subtracted in the Sharpe ratio (default is 0)
+
+    Methods
+    ==========
+    update:
+        appends new rows of prices and updates every metric from those rows only
+            ex. analytics.update(new_prices)
+
+    summary:
+        returns volatility, Sharpe ratio, beta, max drawdown and current drawdown per coin
+            ex. PriceAnalytics(prices).summary()
+
+    correlation:
+        returns the coin by coin correlation matrix of log returns, using the dates both coins have data for
+
+    rolling_volatility, drawdowns:
+        annualized rolling volatility and drawdown from the running peak, as dataframes shaped like prices
+    '''
+
+    def __init__(self, prices, window=30, periods_per_year=365, benchmark="bitcoin", risk_free=0.0):
+        self.window = window
+        self.periods_per_year = periods_per_year
+        self.benchmark = benchmark
+        self.risk_free = risk_free
+
+        self.prices = prices.iloc[:0].astype("float64")
+        self.returns = self.prices.copy()
+        self.rolling_volatility = self.prices.copy()
+        self.drawdowns = self.prices.copy()
+        self._reset_sums(self.prices.columns)
+        self.update(prices)
+
+    def __repr__(self):
+        return "PriceAnalytics(coins = {}, dates = {})".format(self.prices.shape[1], self.prices.shape[0])
+
+    def _reset_sums(self, columns):
+        n = len(columns)
+        # pairwise sums over the dates both coins have a return for: counts, sum of x, sum of x^2 and sum of x*y
+        self._n = np.zeros((n, n))
+        self._sx = np.zeros((n, n))
+        self._sxx = np.zeros((n, n))
+        self._sxy = np.zeros((n, n))
+        self._peak = np.full(n, np.nan)
+        self._max_drawdown = np.full(n, np.nan)
+
+    def _add_columns(self, columns):
+        # new coins start with empty sums, which is exactly their contribution so far
+        new = columns.difference(self.prices.columns, sort=False)
+        if len(new) == 0:
+            return
+        old = len(self.prices.columns)
+        size = old + len(new)
+        for name in ("_n", "_sx", "_sxx", "_sxy"):
+            grown = np.zeros((size, size))
+            grown[:old, :old] = getattr(self, name)
+            setattr(self, name, grown)
+        self._peak = np.concatenate([self._peak, np.full(len(new), np.nan)])
+        self._max_drawdown = np.concatenate([self._max_drawdown, np.full(len(new), np.nan)])
+
+        all_columns = self.prices.columns.append(new)
+        for name in ("prices", "returns", "rolling_volatility", "drawdowns"):
+            setattr(self, name, getattr(self, name).reindex(columns=all_columns))
+
+    def update(self, new_prices):
+        ''' appends rows of prices dated after the last row and updates every metric from those rows only
+        '''
+        if len(new_prices) == 0:
+            return self
+        if len(self.prices) and new_prices.index[0] <= self.prices.index[-1]:
+            raise ValueError("new prices must start after {}".format(self.prices.index[-1]))
+
+        self._add_columns(new_prices.columns)
+        new_prices = new_prices.reindex(columns=self.prices.columns).astype("float64")
+        previous = self.prices.iloc[-1].to_numpy() if len(self.prices) else None
+        new_returns = log_returns(new_prices, previous)
+
+        # running pairwise sums, missing returns count as absent rather than zero
+        r = new_returns.to_numpy()
+        present = (~np.isnan(r)).astype("float64")
+        r0 = np.nan_to_num(r)
+        self._n += present.T @ present
+        self._sx += r0.T @ present
+        self._sxx += (r0 * r0).T @ present
+        self._sxy += r0.T @ r0
+
+        # drawdowns from the running peak
+        values = new_prices.to_numpy()
+        peak = np.fmax.accumulate(np.vstack([self._peak, values]), axis=0)[1:]
+        drawdowns = values / peak - 1
+        self._peak = peak[-1]
+        self._max_drawdown = np.fmin(self._max_drawdown, np.fmin.reduce(drawdowns, axis=0))
+
+        # the rolling window only needs the last window - 1 known returns in front of the new ones
+        tail = pd.concat([self.returns.iloc[-(self.window - 1):] if self.window > 1 else self.returns.iloc[:0], new_returns])
+        volatility = tail.rolling(self.window).std().iloc[-len(new_returns):] * np.sqrt(self.periods_per_year)
+
+        self.prices = pd.concat([self.prices, new_prices]) if len(self.prices) else new_prices
+        self.returns = pd.concat([self.returns, new_returns]) if len(self.returns) else new_returns
+        self.rolling_volatility = pd.concat([self.rolling_volatility, volatility]) if len(self.rolling_volatility) else volatility
+        drawdowns = pd.DataFrame(drawdowns, index=new_prices.index, columns=new_prices.columns)
+        self.drawdowns = pd.concat([self.drawdowns, drawdowns]) if len(self.drawdowns) else drawdowns
+        return self
+
+    def correlation(self):
+        ''' returns the correlation matrix of log returns over the dates each pair of coins has in common
+        '''
+        n, sx, sxx, sxy = self._n, self._sx, self._sxx, self._sxy
+        with np.errstate(divide="ignore", invalid="ignore"):
+            corr = (n * sxy - sx * sx.T) / np.sqrt((n * sxx - sx ** 2) * (n * sxx.T - sx.T ** 2))
+        corr[n < 2] = np.nan
+        columns = self.prices.columns
+        return pd.DataFrame(corr, index=columns, columns=columns)
+
+    def beta(self):
+        ''' returns each coin's beta against the benchmark coin
+        '''
+        columns = self.prices.columns
+        if self.benchmark not in columns:
+            return pd.Series(np.nan, index=columns, name="beta")
+        b = columns.get_loc(self.benchmark)
+        # sums of each coin (x) and of the benchmark (y) over the dates they share
+        n, sx, sy, syy, sxy = self._n[:, b], self._sx[:, b], self._sx[b, :], self._sxx[b, :], self._sxy[:, b]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            beta = (n * sxy - sx * sy) / (n * syy - sy ** 2)
+        beta[n < 2] = np.nan
+        return pd.Series(beta, index=columns, name="beta")
+
+    def volatility(self):
+        ''' returns the annualized volatility of each coin's log returns over its whole history
+        '''
+        n, sx, sxx = np.diag(self._n), np.diag(self._sx), np.diag(self._sxx)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            variance = (sxx - sx ** 2 / n) / (n - 1)
+        return pd.Series(np.sqrt(variance * self.periods_per_year), index=self.prices.columns, name="volatility")
+
+    def sharpe(self):
+        ''' returns the annualized Sharpe ratio of each coin's log returns
+        '''
+        n, sx = np.diag(self._n), np.diag(self._sx)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean = sx / n * self.periods_per_year
+        sharpe = (mean - self.risk_free) / self.volatility().to_numpy()
+        return pd.Series(sharpe, index=self.prices.columns, name="sharpe")
+
+    def max_drawdown(self):
+        ''' returns the largest drop from a running peak of each coin (e.g. -0.8 is an 80% drawdown)
+        '''
+        return pd.Series(self._max_drawdown, index=self.prices.columns, name="max_drawdown")
+
+    def summary(self):
+        ''' returns volatility, Sharpe ratio, beta, max drawdown and current drawdown per coin
+        '''
+        current = self.drawdowns.iloc[-1] if len(self.drawdowns) else pd.Series(np.nan, index=self.prices.columns)
+        return pd.DataFrame({
+            "volatility": self.volatility(),
+            "sharpe": self.sharpe(),
+            "beta": self.beta(),
+            "max_drawdown": self.max_drawdown(),
+            "drawdown": current.rename("drawdown")
+        })
@@ -0,0 +1,625 @@
+# API CLIENT
+# rate limited CoinGecko client, metrics and the in-memory response cache. kept free of pandas and numpy, so lite.py
+# shares the rate budget with CoinGeckoAPI without importing either
+import heapq, itertools, operator, os, random, threading, time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# optional instrumentation
+class Profile():
+    ''' Events recorded inside a metrics.profile() block
+    
+    Attributes
+    ==========
+    events: list
+        every event recorded while the block ran, in order
+    seconds: float
+        wall time of the block
+    '''
+    
+    def __init__(self):
+        self.events = []
+        self.seconds = None
+    
+    def __repr__(self):
+        return "Profile(events = {}, seconds = {})".format(len(self.events), self.seconds)
+    
+    def summary(self):
+        ''' returns a pandas dataframe of the event totals per kind and name, with each one's share of the block's wall time
+        
+        stages nest (get_data includes the API call and parse_market_chart), so the shares do not add up to 1
+        '''
+        import numpy as np, pandas as pd
+        columns = ["count"] + list(Metrics.summed) + ["errors"]
+        rows = {}
+        for event in self.events:
+            row = rows.setdefault((event["kind"], event["name"]), dict.fromkeys(columns, 0))
+            row["count"] += 1
+            row["errors"] += int("error" in event)
+            for field in Metrics.summed:
+                row[field] += event.get(field, 0)
+        summary = pd.DataFrame([dict(kind=kind, name=name, **row) for (kind, name), row in rows.items()],
+                               columns=["kind", "name"] + columns).set_index(["kind", "name"])
+        summary["share"] = summary["seconds"] / self.seconds if self.seconds else np.nan
+        return summary.sort_values("seconds", ascending=False)
+
+class Metrics():
+    ''' Optional instrumentation of every API call, cache lookup and parse / transform stage
+    
+    disabled by default, in which case an instrumented call only pays for checking metrics.enabled. turn it on with
+    metrics.enable() (or the COINGECKO_METRICS environment variable), or for one block of code with metrics.profile()
+    
+    every event is a dict with a kind (api, stage or cache), a name (the endpoint, stage or cache) and, depending on
+    the kind: seconds, wait_seconds (rate limiting and backoff), bytes, retries, status, rows, hits, misses, error
+    
+    Attributes
+    ==========
+    enabled: bool
+        whether events are recorded
+    hooks: list
+        functions called with every event, e.g. to forward them to a logger or tracing system
+            ex. metrics.hooks.append(print)
+            
+    Methods
+    ==========
+    profile:
+        context manager recording the events of a block, even when metrics are disabled
+            ex. with metrics.profile() as profile:
+                    CoinGeckoAPI("ethereum").get_data()
+                print(profile.summary())
+    
+    prometheus:
+        returns the running totals in the Prometheus text exposition format
+    
+    reset:
+        clears the running totals
+    '''
+    
+    summed = ("seconds", "wait_seconds", "bytes", "retries", "rows", "hits", "misses")
+    latency_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+    
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.hooks = []
+        self._wanted = enabled
+        self._profiles = []
+        self._lock = threading.Lock()
+        self.reset()
+    
+    def __repr__(self):
+        return "Metrics(enabled = {}, hooks = {})".format(self.enabled, len(self.hooks))
+    
+    def enable(self):
+        self._wanted = True
+        self.enabled = True
+        return self
+    
+    def disable(self):
+        self._wanted = False
+        self.enabled = bool(self._profiles)
+        return self
+    
+    def reset(self):
+        ''' clears the running totals
+        '''
+        with self._lock:
+            self._totals = {}
+            self._latency = {}
+    
+    def clock(self):
+        ''' returns a start time for record, or 0 when disabled so callers can skip recording
+        '''
+        return time.perf_counter() if self.enabled else 0.0
+    
+    def record(self, kind, name, start=None, **fields):
+        ''' records one event. the time since start (from clock) is recorded as seconds
+        '''
+        if start:
+            fields["seconds"] = time.perf_counter() - start
+        event = dict(kind=kind, name=name, **fields)
+        with self._lock:
+            totals = self._totals.get((kind, name))
+            if totals is None:
+                totals = self._totals[(kind, name)] = dict.fromkeys(("count", "errors") + self.summed, 0)
+            totals["count"] += 1
+            totals["errors"] += int("error" in fields)
+            for field in self.summed:
+                if field in fields:
+                    totals[field] += fields[field]
+            if kind == "api" and "seconds" in fields:
+                buckets = self._latency.setdefault(name, [0] * len(self.latency_buckets))
+                for i, bound in enumerate(self.latency_buckets):
+                    if fields["seconds"] <= bound:
+                        buckets[i] += 1
+            for profile in self._profiles:
+                profile.events.append(event)
+        for hook in self.hooks:
+            hook(event)
+    
+    @contextmanager
+    def profile(self):
+        ''' records the events of the block into the Profile it yields, enabling metrics for the duration
+        '''
+        profile = Profile()
+        with self._lock:
+            self._profiles.append(profile)
+        self.enabled = True
+        start = time.perf_counter()
+        try:
+            yield profile
+        finally:
+            profile.seconds = time.perf_counter() - start
+            with self._lock:
+                self._profiles.remove(profile)
+            self.enabled = self._wanted or bool(self._profiles)
+    
+    def totals(self):
+        ''' returns the running totals as {(kind, name): {count, errors, seconds, ...}}
+        '''
+        with self._lock:
+            return {key: dict(value) for key, value in self._totals.items()}
+    
+    def prometheus(self, prefix="coingecko"):
+        ''' returns the running totals in the Prometheus text exposition format, e.g. for a /metrics endpoint
+        '''
+        with self._lock:
+            totals = {key: dict(value) for key, value in self._totals.items()}
+            latency = {key: list(value) for key, value in self._latency.items()}
+        
+        labels = {"api": "endpoint", "stage": "stage", "cache": "cache"}
+        series = [
+            ("api", "api_calls_total", "count", "Calls to the CoinGecko API"),
+            ("api", "api_errors_total", "errors", "Calls to the CoinGecko API that raised"),
+            ("api", "api_retries_total", "retries", "Retried attempts of CoinGecko API calls"),
+            ("api", "api_response_bytes_total", "bytes", "Bytes received from the CoinGecko API"),
+            ("api", "api_wait_seconds_total", "wait_seconds", "Seconds spent waiting on the rate limiter and backoff"),
+            ("stage", "stage_calls_total", "count", "Runs of each parse / transform stage"),
+            ("stage", "stage_seconds_total", "seconds", "Seconds spent in each parse / transform stage"),
+            ("stage", "stage_rows_total", "rows", "Rows produced by each parse / transform stage"),
+            ("cache", "cache_hits_total", "hits", "Lookups served from the cache"),
+            ("cache", "cache_misses_total", "misses", "Lookups that missed the cache")
+        ]
+        lines = []
+        for kind, metric, field, help_text in series:
+            name = "{}_{}".format(prefix, metric)
+            lines.append("# HELP {} {}".format(name, help_text))
+            lines.append("# TYPE {} counter".format(name))
+            for (event_kind, label), values in sorted(totals.items()):
+                if event_kind == kind:
+                    lines.append('{}{{{}="{}"}} {}'.format(name, labels[kind], label, values[field]))
+        
+        name = "{}_api_latency_seconds".format(prefix)
+        lines.append("# HELP {} Latency of CoinGecko API calls, including retries".format(name))
+        lines.append("# TYPE {} histogram".format(name))
+        for endpoint, buckets in sorted(latency.items()):
+            values = totals[("api", endpoint)]
+            for bound, count in zip(self.latency_buckets, buckets):
+                lines.append('{}_bucket{{endpoint="{}",le="{}"}} {}'.format(name, endpoint, bound, count))
+            lines.append('{}_bucket{{endpoint="{}",le="+Inf"}} {}'.format(name, endpoint, values["count"]))
+            lines.append('{}_sum{{endpoint="{}"}} {}'.format(name, endpoint, values["seconds"]))
+            lines.append('{}_count{{endpoint="{}"}} {}'.format(name, endpoint, values["count"]))
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics(enabled=bool(os.environ.get("COINGECKO_METRICS")))
+
+# client side rate limiting
+class RateLimiter():
+    ''' Token bucket shared by every call to the CoinGecko API, with retries and request priorities
+    
+    Attributes
+    ==========
+    calls_per_minute: float
+        number of calls allowed per minute (default is 30, the public API budget)
+    burst: int
+        number of calls that can be made back to back before throttling kicks in (default is 5)
+    max_retries: int
+        number of times a call is retried after a 429, a 5xx or a connection error (default is 5)
+    backoff: float
+        base delay in seconds of the exponential backoff, doubled on every retry and randomized with full jitter (default is 1)
+    max_backoff: float
+        upper bound of a single backoff delay in seconds (default is 60)
+    counters: dict
+        running totals of calls, throttled calls (had to wait for a token), retried calls and failed calls
+        
+    Methods
+    ==========
+    acquire:
+        blocks until a token is available. waiting INTERACTIVE requests are always served before BULK ones
+    
+    try_acquire:
+        takes a token if one is available without blocking, otherwise returns how long to wait before trying again.
+        lets callers that must not block (e.g. an asyncio event loop) share the budget and pauses of the blocking ones
+    
+    call:
+        calls a function once a token is available, retrying it with backoff. a Retry-After header pauses every caller
+    
+    count:
+        adds to one of the counters, for callers that retry on their own (e.g. the async client)
+            ex. rate_limiter.count("retried")
+    '''
+    
+    INTERACTIVE = 0
+    BULK = 1
+    
+    def __init__(self, calls_per_minute=30, burst=5, max_retries=5, backoff=1.0, max_backoff=60.0):
+        self.calls_per_minute = calls_per_minute
+        self.burst = burst
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.counters = {"calls": 0, "throttled": 0, "retried": 0, "failed": 0}
+        
+        self._tokens = float(burst)
+        self._last_refill = time.monotonic()
+        self._paused_until = 0.0
+        self._waiting = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+    
+    def __repr__(self):
+        return "RateLimiter(calls_per_minute = {}, burst = {})".format(self.calls_per_minute, self.burst)
+    
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.calls_per_minute / 60)
+        self._last_refill = now
+    
+    def acquire(self, priority=INTERACTIVE):
+        ''' blocks until a token is available, serving waiting callers by priority and then arrival order
+        '''
+        with self._cond:
+            ticket = (priority, next(self._seq))
+            heapq.heappush(self._waiting, ticket)
+            throttled = False
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if self._waiting[0] == ticket and self._tokens >= 1 and now >= self._paused_until:
+                    heapq.heappop(self._waiting)
+                    self._tokens -= 1
+                    break
+                
+                throttled = True
+                if self._waiting[0] == ticket:
+                    wait = max(self._paused_until - now, (1 - self._tokens) * 60 / self.calls_per_minute, 0.001)
+                else:
+                    # only the head of the queue polls, the rest are woken when it is served
+                    wait = None
+                self._cond.wait(wait)
+            
+            self.counters["calls"] += 1
+            if throttled:
+                self.counters["throttled"] += 1
+            self._cond.notify_all()
+    
+    def try_acquire(self, priority=INTERACTIVE, throttled=False):
+        ''' takes a token and returns 0 if one is available, otherwise returns the seconds to wait before trying again
+        
+        callers blocked in acquire with the same or a higher priority are served first. throttled tells whether the
+        caller already had to wait for this call, so it is counted like a throttled acquire
+        '''
+        with self._cond:
+            now = time.monotonic()
+            self._refill(now)
+            if self._waiting and self._waiting[0][0] <= priority:
+                return max(self._paused_until - now, 60 / self.calls_per_minute, 0.001)
+            if self._tokens < 1 or now < self._paused_until:
+                return max(self._paused_until - now, (1 - self._tokens) * 60 / self.calls_per_minute, 0.001)
+            self._tokens -= 1
+            self.counters["calls"] += 1
+            if throttled:
+                self.counters["throttled"] += 1
+            return 0
+    
+    def pause(self, seconds):
+        ''' stops handing out tokens for the given number of seconds (used for Retry-After)
+        '''
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+    
+    def count(self, name, n=1):
+        ''' adds n to counters[name], under the lock every other counter update takes
+        '''
+        with self._cond:
+            self.counters[name] += n
+    
+    def retry_delay(self, attempt, response=None):
+        ''' returns the number of seconds to wait before the given retry attempt, honouring Retry-After if present
+        '''
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after:
+            try:
+                return max(0.0, float(retry_after))
+            except ValueError:
+                from email.utils import parsedate_to_datetime
+                try:
+                    return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+                except (TypeError, ValueError):
+                    pass
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+    
+    def call(self, func, *args, priority=INTERACTIVE, last_response=None, **kwargs):
+        ''' calls func(*args, **kwargs) once a token is available, retrying on 429s, 5xxs and connection errors
+        
+        last_response is an optional function returning the http response of the latest attempt, used to read
+        its status code and Retry-After header
+        '''
+        attempt = 0
+        while True:
+            self.acquire(priority)
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                response = last_response() if last_response else getattr(e, "response", None)
+                status = getattr(response, "status_code", None)
+                import requests
+                retryable = status == 429 or (status is not None and status >= 500) or \
+                    isinstance(e, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+                if not retryable or attempt >= self.max_retries:
+                    self.count("failed")
+                    raise
+                
+                delay = self.retry_delay(attempt, response)
+                if status == 429:
+                    # every caller is over the budget, not just this one
+                    self.pause(delay)
+                self.count("retried")
+                time.sleep(delay)
+                attempt += 1
+
+class ThrottledClient():
+    ''' Wraps a pycoingecko client so every endpoint call goes through a RateLimiter
+    
+    the wrapped endpoints keep their pycoingecko names and arguments
+        ex. cg.get_coins_list()
+    
+    use with_priority to get a view of the same client for bulk work
+        ex. cg.with_priority(RateLimiter.BULK).get_coin_market_chart_by_id(...)
+    
+    if client is None, a pycoingecko client is created (and pycoingecko imported) on first use
+    '''
+    
+    def __init__(self, client, limiter, priority=RateLimiter.INTERACTIVE, _shared=None):
+        self._limiter = limiter
+        self._priority = priority
+        
+        # views made by with_priority share the wrapped client
+        if _shared is None:
+            _shared = {"client": None, "local": threading.local(), "lock": threading.Lock()}
+        self._shared = _shared
+        if client is not None:
+            _shared["client"] = self._remember_responses(client)
+    
+    def __repr__(self):
+        return "ThrottledClient({}, priority = {})".format(self._limiter, self._priority)
+    
+    @property
+    def limiter(self):
+        return self._limiter
+    
+    @property
+    def client(self):
+        ''' the wrapped pycoingecko client
+        '''
+        shared = self._shared
+        if shared["client"] is None:
+            with shared["lock"]:
+                if shared["client"] is None:
+                    import pycoingecko
+                    shared["client"] = self._remember_responses(pycoingecko.CoinGeckoAPI())
+        return shared["client"]
+    
+    def _remember_responses(self, client):
+        # remember the latest response per thread, pycoingecko does not keep it on the errors it raises
+        local = self._shared["local"]
+        def remember_response(response, *args, **kwargs):
+            local.response = response
+        client.session.hooks["response"].append(remember_response)
+        return client
+    
+    def with_priority(self, priority):
+        ''' returns a view of this client whose calls are queued with the given priority
+        '''
+        return ThrottledClient(None, self._limiter, priority, _shared=self._shared)
+    
+    def _last_response(self):
+        return getattr(self._shared["local"], "response", None)
+    
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        attr = getattr(self.client, name)
+        if not callable(attr) or not name.startswith("get_"):
+            return attr
+        
+        def throttled(*args, **kwargs):
+            self._shared["local"].response = None
+            if metrics.enabled:
+                return self._instrumented_call(name, attr, args, kwargs)
+            return self._limiter.call(attr, *args, priority=self._priority, last_response=self._last_response, **kwargs)
+        return throttled
+    
+    def _instrumented_call(self, name, func, args, kwargs):
+        # times every attempt, so the time spent waiting on the limiter and backoff can be told apart from the requests
+        attempts = []
+        def attempt(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                attempts.append(time.perf_counter() - start)
+        
+        fields = {}
+        start = time.perf_counter()
+        try:
+            return self._limiter.call(attempt, *args, priority=self._priority, last_response=self._last_response, **kwargs)
+        except Exception as e:
+            fields["error"] = type(e).__name__
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            response = self._last_response()
+            if response is not None:
+                fields["status"] = response.status_code
+                fields["bytes"] = len(response.content)
+            metrics.record("api", name, seconds=seconds, wait_seconds=seconds - sum(attempts),
+                           retries=max(len(attempts) - 1, 0), **fields)
+
+rate_limiter = RateLimiter()
+cg = ThrottledClient(None, rate_limiter)
+
+def market_pages(n, max_per_page=250):
+    ''' returns the (page, per_page) requests to coins/markets covering the top n coins
+    
+    raises ValueError if n is not a positive integer
+    '''
+    try:
+        n = operator.index(n)
+    except TypeError:
+        n = None
+    if n is None or n < 1:
+        raise ValueError("n must be a positive integer")
+    per_page = min(n, max_per_page)
+    return [(page, per_page) for page in range(1, -(-n // per_page) + 1)]
+
+def top_markets(n, get_page):
+    ''' returns the coins/markets rows of the top n coins by market cap, calling get_page(page, per_page) for
+    each page until one comes back short
+        ex. top_markets(100, lambda page, per_page: cg.get_coins_markets(vs_currency="usd", per_page=per_page, page=page))
+    '''
+    markets = []
+    for page, per_page in market_pages(n):
+        rows = get_page(page, per_page)
+        markets.extend(rows)
+        if len(rows) < per_page:
+            break
+    return markets[:n]
+
+def make_client(api_base_url=None, limiter=rate_limiter):
+    ''' returns a new rate limited pycoingecko client, optionally pointed at another base url (e.g. a local stub server)
+        ex. make_client("http://127.0.0.1:8000/")
+    
+    by default the new client shares the module wide rate limiter with cg
+    '''
+    import pycoingecko
+    client = pycoingecko.CoinGeckoAPI()
+    if api_base_url:
+        client.api_base_url = api_base_url
+    return ThrottledClient(client, limiter)
+
+# in-memory response cache
+class TTLCache():
+    ''' Thread safe least recently used cache whose entries expire after a time to live
+    
+    Attributes
+    ==========
+    maxsize: int
+        number of entries kept before the least recently used one is evicted (default is 128)
+    name: str
+        name the cache's hits and misses are recorded under in metrics (default is response)
+    hits, misses: int
+        running totals of lookups served from the cache and lookups that had to call the API
+    
+    Methods
+    ==========
+    get_or_set:
+        returns the cached value for key if it has not expired, otherwise calls func and caches its result for ttl seconds.
+        threads missing the same key at once call func only once between them
+            ex. response_cache.get_or_set(("coins_list",), 60, cg.get_coins_list)
+            
+    get, peek, set:
+        the steps of get_or_set, for callers that cannot fetch through a plain function (e.g. coroutines). peek reads
+        without counting a lookup
+            
+    invalidate:
+        removes one key, or every key if none is given
+    '''
+    
+    def __init__(self, maxsize=128, name="response"):
+        self.maxsize = maxsize
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # {key: [lock, number of threads using it]} of the keys being fetched
+        self._fetching = {}
+    
+    def __repr__(self):
+        return "TTLCache(maxsize = {}, entries = {})".format(self.maxsize, len(self._entries))
+    
+    def __len__(self):
+        return len(self._entries)
+    
+    def get(self, key, default=None):
+        ''' returns the value cached for key, or default if it is missing or expired
+        '''
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                hit = True
+            else:
+                self.misses += 1
+                hit = False
+        if metrics.enabled:
+            metrics.record("cache", self.name, hits=int(hit), misses=int(not hit))
+        return entry[0] if hit else default
+    
+    def peek(self, key, default=None):
+        ''' returns the value cached for key like get, without counting a hit or a miss
+        '''
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry[0] if entry is not None and entry[1] > time.monotonic() else default
+    
+    def set(self, key, value, ttl):
+        ''' caches value for key for ttl seconds, evicting the least recently used entries beyond maxsize
+        '''
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+    
+    def get_or_set(self, key, ttl, func):
+        ''' returns the value cached for key, calling func and caching its result for ttl seconds on a miss
+        '''
+        missing = object()
+        value = self.get(key, missing)
+        if value is not missing:
+            return value
+        
+        # call the API under a lock of its own key only, so other keys are not blocked behind it
+        with self._lock:
+            fetching = self._fetching.setdefault(key, [threading.Lock(), 0])
+            fetching[1] += 1
+        try:
+            with fetching[0]:
+                # a thread that waited uses what the first one fetched
+                value = self.peek(key, missing)
+                if value is missing:
+                    value = func()
+                    self.set(key, value, ttl)
+        finally:
+            with self._lock:
+                fetching[1] -= 1
+                if not fetching[1]:
+                    del self._fetching[key]
+        return value
+    
+    def invalidate(self, key=None):
+        ''' removes key from the cache, or every entry if key is None
+        '''
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+# seconds each endpoint's responses are reused for, shared by every CoinGeckoAPI instance
+endpoint_ttl = {
+    "coins_markets": 5 * 60,
+    "coins_list": 60 * 60,
+    "fx_rates": 60 * 60
+}
@@ -0,0 +1,235 @@
+# COLUMNAR ARCHIVE
+# parquet dataset of many coins' daily histories, partitioned by coin bucket and by date so queries only read the files they need
+import json, os, shutil, zlib
+import pandas as pd
+
+import CoinGeckoAPI as api
+
+# format of the date partition values, which sort like the dates they stand for
+date_partitions = {"year": "%Y", "month": "%Y-%m", "day": "%Y-%m-%d"}
+
+def coin_bucket(coin, buckets):
+    ''' returns the bucket coin is stored in, the same on every run and machine
+    '''
+    return zlib.crc32(coin.encode()) % buckets
+
+class ChartArchive():
+    ''' Parquet dataset of daily market charts for the whole CoinGecko universe
+
+    the dataset is hive partitioned by coin bucket (a hash of the coin id) and then by date, e.g.
+    bucket=7/month=2024-01/part-0.parquet. rows are on the daily grid and sorted by coin and date inside each file,
+    with small row groups, so reads push their filters down twice: a date range only opens the files of its
+    partitions, and a set of coins only opens its buckets and skips the row groups of other coins by their statistics.
+    both "every coin on one date" and "one coin on every date" read a small part of the archive
+        ex. archive = ChartArchive("archive")
+            archive.build()
+            archive.on_date("2024-01-01")
+            archive.read(["bitcoin"], start="2020-01-01")
+
+    Attributes
+    ==========
+    path: str
+        directory of the dataset. settings of an existing archive are read from its _archive.json and take
+        precedence over the ones passed in
+    vs_currency: str
+        currency the data is quoted in (default is set to usd)
+    buckets: int
+        number of coin buckets (default is 32)
+    partition: str
+        size of the date partitions, one of year, month or day (default is month). day partitions make single date
+        reads cheapest, at the cost of one file per bucket and day
+    row_group_size: int
+        maximum number of rows per parquet row group (default is 16384)
+
+    Methods
+    ==========
+    build:
+        downloads coins (default is every coin from get_coin_id) and writes them, one bucket at a time. coins that
+        fail are returned as {coin: exception} and keep the data archived for them before
+            ex. errors = archive.build(skip_existing=True)
+
+    read:
+        returns the data of coins between start and end, indexed by (coin, date) like load_many
+            ex. archive.read(["bitcoin", "ethereum"], start="2024-01-01", columns=["price"])
+
+    on_date:
+        returns every archived coin's row on one date, indexed by coin
+            ex. archive.on_date("2024-01-01").price
+    '''
+
+    columns = ["price", "log_returns", "market_cap", "total_volume"]
+
+    def __init__(self, path, vs_currency="usd", buckets=32, partition="month", row_group_size=16384):
+        if partition not in date_partitions:
+            raise ValueError("partition must be one of {}".format(", ".join(date_partitions)))
+        self.path = path
+        self.vs_currency = vs_currency
+        self.buckets = buckets
+        self.partition = partition
+        self.row_group_size = row_group_size
+        self._built = {}
+
+        os.makedirs(path, exist_ok=True)
+        try:
+            with open(os.path.join(path, "_archive.json")) as f:
+                saved = json.load(f)
+            self.vs_currency = saved["vs_currency"]
+            self.buckets = saved["buckets"]
+            self.partition = saved["partition"]
+            self._built = saved["coins"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def __repr__(self):
+        return "ChartArchive(path = {}, buckets = {}, partition = {}, coins = {})".format(
+            self.path, self.buckets, self.partition, len(self))
+
+    def __len__(self):
+        return sum(len(coins) for coins in self._built.values())
+
+    def __contains__(self, coin):
+        return coin in self._built.get(str(coin_bucket(coin, self.buckets)), ())
+
+    @property
+    def coins(self):
+        return sorted(coin for coins in self._built.values() for coin in coins)
+
+    def _save_meta(self):
+        tmp_path = os.path.join(self.path, "_archive.json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({"vs_currency": self.vs_currency, "buckets": self.buckets, "partition": self.partition,
+                       "coins": self._built}, f)
+        os.replace(tmp_path, os.path.join(self.path, "_archive.json"))
+
+    def _bucket_dir(self, bucket, prefix=""):
+        return os.path.join(self.path, "{}bucket={}".format(prefix, bucket))
+
+    def _schema(self):
+        import pyarrow as pa
+        return pa.schema([("coin", pa.string()), ("date", pa.timestamp("ns", tz="UTC"))] +
+                         [(column, pa.float64()) for column in self.columns])
+
+    def _partitioning(self, *fields):
+        import pyarrow as pa, pyarrow.dataset as ds
+        types = {"bucket": pa.int32(), self.partition: pa.string()}
+        return ds.partitioning(pa.schema([(field, types[field]) for field in fields]), flavor="hive")
+
+    def _to_table(self, data):
+        import pyarrow as pa
+        frames = []
+        for coin, chart in data.groupby(level="coin", sort=False):
+            # days the API has no data for are left out rather than stored as nan rows
+            chart = api.to_daily_grid(chart.droplevel("coin")).dropna(subset=["price", "market_cap", "total_volume"], how="all")
+            frames.append(chart.reset_index().assign(coin=coin))
+        if not frames:
+            return self._schema().empty_table()
+        return pa.Table.from_pandas(pd.concat(frames, ignore_index=True), schema=self._schema(), preserve_index=False)
+
+    def _write_bucket(self, bucket, data, replaced):
+        import pyarrow as pa, pyarrow.compute as pc, pyarrow.dataset as ds
+
+        tables = [self._to_table(data)]
+        if os.path.isdir(self._bucket_dir(bucket)):
+            # coins of the bucket that were not rebuilt are carried over
+            existing = ds.dataset(self._bucket_dir(bucket), format="parquet", partitioning=self._partitioning(self.partition))
+            tables.append(existing.to_table(columns=self._schema().names, filter=~ds.field("coin").isin(replaced)).cast(self._schema()))
+        table = pa.concat_tables(tables).sort_by([("coin", "ascending"), ("date", "ascending")])
+        # formatting every row is slow, so only the distinct days are formatted
+        days = pc.divide(table["date"].cast(pa.int64()), 86400 * 10 ** 9).combine_chunks().dictionary_encode()
+        labels = pc.strftime(days.dictionary.cast(pa.int32()).cast(pa.date32()), format=date_partitions[self.partition])
+        table = table.append_column(self.partition, pc.take(labels, days.indices))
+
+        # the bucket is written aside and swapped in, so readers never see it half written (only briefly missing)
+        tmp_dir, old_dir = self._bucket_dir(bucket, ".tmp-"), self._bucket_dir(bucket, ".old-")
+        for path in (tmp_dir, old_dir):
+            shutil.rmtree(path, ignore_errors=True)
+        ds.write_dataset(table, tmp_dir, format="parquet", partitioning=self._partitioning(self.partition),
+                         basename_template="part-{i}.parquet", preserve_order=True,
+                         min_rows_per_group=min(self.row_group_size, 1024), max_rows_per_group=self.row_group_size)
+        if os.path.isdir(self._bucket_dir(bucket)):
+            os.replace(self._bucket_dir(bucket), old_dir)
+        os.replace(tmp_dir, self._bucket_dir(bucket))
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+        self._built[str(bucket)] = pc.unique(table["coin"]).to_pylist()
+        self._save_meta()
+        return table.num_rows
+
+    def build(self, coins=None, skip_existing=False, max_workers=8, cache=api.market_chart_cache, client=None):
+        ''' downloads coins and writes them to the archive, returns {coin: exception} for the coins that failed
+
+        coins default to every coin listed by get_coin_id. only one bucket of coins is held in memory at a time and
+        each bucket is saved as soon as it is written, so an interrupted build can be picked up with
+        skip_existing=True, which also only adds newly listed coins to a complete archive. the charts go through
+        cache, so rebuilding coins whose cached data is fresh costs no API calls
+        '''
+        if coins is None:
+            coins = api.CoinGeckoAPI().get_coin_id().id
+        by_bucket = {}
+        for coin in dict.fromkeys(coins):
+            by_bucket.setdefault(coin_bucket(coin, self.buckets), []).append(coin)
+
+        errors = {}
+        for bucket in sorted(by_bucket):
+            wanted = by_bucket[bucket]
+            if skip_existing:
+                wanted = [coin for coin in wanted if coin not in self]
+            if not wanted:
+                continue
+            start = api.metrics.clock()
+            data, failed = api.load_many(wanted, vs_currency=self.vs_currency, max_workers=max_workers, cache=cache, client=client)
+            errors.update(failed)
+            loaded = [coin for coin in wanted if coin not in failed]
+            if not loaded:
+                continue
+            rows = self._write_bucket(bucket, data, loaded)
+            if start:
+                api.metrics.record("stage", "build_archive", start, rows=rows)
+        return errors
+
+    def _filter(self, coins, start, end):
+        import pyarrow as pa, pyarrow.dataset as ds
+        conditions = []
+        if coins is not None:
+            conditions.append(ds.field("bucket").isin(sorted({coin_bucket(coin, self.buckets) for coin in coins})))
+            conditions.append(ds.field("coin").isin(coins))
+        date_format = date_partitions[self.partition]
+        if start is not None:
+            conditions.append(ds.field(self.partition) >= start.strftime(date_format))
+            conditions.append(ds.field("date") >= pa.scalar(start, type=pa.timestamp("ns", tz="UTC")))
+        if end is not None:
+            conditions.append(ds.field(self.partition) <= end.strftime(date_format))
+            conditions.append(ds.field("date") <= pa.scalar(end, type=pa.timestamp("ns", tz="UTC")))
+        expression = None
+        for condition in conditions:
+            expression = condition if expression is None else expression & condition
+        return expression
+
+    def read(self, coins=None, start=None, end=None, columns=None):
+        ''' returns a pandas dataframe indexed by (coin, date) of coins (default is every coin) between start and end
+
+        only the files of the partitions the filters select are opened, and only the row groups whose statistics
+        can match them are read
+        '''
+        import pyarrow.dataset as ds
+        timer = api.metrics.clock()
+        coins = None if coins is None else list(coins)
+        start = None if start is None else api.utc_timestamp(start)
+        end = None if end is None else api.utc_timestamp(end)
+        columns = list(columns or self.columns)
+
+        if self._built:
+            dataset = ds.dataset(self.path, format="parquet", partitioning=self._partitioning("bucket", self.partition))
+            table = dataset.to_table(columns=["coin", "date"] + columns, filter=self._filter(coins, start, end))
+        else:
+            table = self._schema().empty_table().select(["coin", "date"] + columns)
+        data = table.to_pandas().set_index(["coin", "date"]).sort_index()
+        if timer:
+            api.metrics.record("stage", "read_archive", timer, rows=len(data))
+        return data
+
+    def on_date(self, date, coins=None, columns=None):
+        ''' returns the row of every coin (or of coins) on date as a pandas dataframe indexed by coin
+        '''
+        date = api.utc_timestamp(date).floor("D")
+        return self.read(coins, start=date, end=date, columns=columns).droplevel("date")
@@ -0,0 +1,430 @@
+# ASYNC CLIENT
+# asyncio counterpart of CoinGeckoAPI, on a pooled keep-alive http session (needs httpx, h2 for HTTP/2)
+import asyncio, importlib.util, time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+import pandas as pd
+
+import CoinGeckoAPI as api
+from CoinGeckoAPI import (RateLimiter, append_market_chart, endpoint_ttl, get_market_snapshot, market_chart_cache, market_pages,
+                          metrics, parse_market_chart, rate_limiter, response_cache, utc_timestamp)
+
+API_BASE_URL = "https://api.coingecko.com/api/v3/"
+
+# metrics record the pycoingecko method names, so sync and async calls add up under the same endpoint
+endpoint_names = {
+    "coins/list": "get_coins_list",
+    "coins/markets": "get_coins_markets",
+    "coins/{id}/market_chart": "get_coin_market_chart_by_id",
+    "coins/{id}/market_chart/range": "get_coin_market_chart_range_by_id"
+}
+
+def endpoint_name(path):
+    ''' returns the name an API path is recorded under in metrics, e.g. get_coin_market_chart_by_id for coins/bitcoin/market_chart
+    '''
+    parts = path.strip("/").split("/")
+    if len(parts) >= 3 and parts[0] == "coins":
+        parts[1] = "{id}"
+    path = "/".join(parts)
+    return endpoint_names.get(path, path)
+
+class AsyncClient():
+    ''' Pooled asyncio http client for the CoinGecko API, rate limited like the synchronous cg client
+
+    Attributes
+    ==========
+    base_url: str
+        root of the API (default is the public CoinGecko API). point it at a local mock server for testing
+            ex. AsyncClient("http://127.0.0.1:8000/")
+    headers: dict
+        extra headers sent with every request, e.g. {"x-cg-demo-api-key": "..."}
+    limiter: RateLimiter
+        holds the calls per minute budget, retry settings and counters (default is the rate_limiter of the cg client,
+        so sync and async calls share one budget and both back off when either gets a 429)
+    priority: int
+        priority of the calls against the sync callers waiting on the same limiter (default is RateLimiter.INTERACTIVE)
+    max_connections: int
+        size of the connection pool. connections are kept alive and reused between requests (default is 10)
+    http2: bool
+        use HTTP/2 (default is to use it if the h2 package is installed)
+
+    Methods
+    ==========
+    get:
+        requests an API path and returns the decoded json, retrying 429s, 5xxs and connection errors with backoff
+            ex. await client.get("coins/list")
+    
+    get_coins_list, get_coins_markets, get_coin_market_chart_by_id:
+        the pycoingecko calls used by CoinGeckoAPI, as coroutines
+            ex. await client.get_coin_market_chart_by_id(id="bitcoin", vs_currency="usd", days="10000")
+
+    aclose:
+        closes the pooled connections. the client can also be used as an async context manager
+    '''
+
+    def __init__(self, base_url=API_BASE_URL, headers=None, limiter=None, max_connections=10, timeout=30.0, http2=None,
+                 priority=RateLimiter.INTERACTIVE):
+        self.base_url = base_url
+        self.headers = headers or {}
+        self.limiter = limiter or rate_limiter
+        self.priority = priority
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.http2 = importlib.util.find_spec("h2") is not None if http2 is None else http2
+        self._session = None
+        self._lock = None
+
+    def __repr__(self):
+        return "AsyncClient(base_url = {}, http2 = {})".format(self.base_url, self.http2)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    def _get_session(self):
+        if self._session is None:
+            import httpx
+            self._session = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=self.headers,
+                http2=self.http2,
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections)
+            )
+        return self._session
+
+    async def aclose(self):
+        if self._session is not None:
+            await self._session.aclose()
+            self._session = None
+
+    async def _acquire(self):
+        # tokens come from the shared limiter without blocking the event loop. the lock is fair, so the coroutines
+        # of this client are served in arrival order
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            throttled = False
+            while True:
+                wait = self.limiter.try_acquire(self.priority, throttled)
+                if not wait:
+                    return
+                throttled = True
+                await asyncio.sleep(wait)
+
+    async def get(self, path, **params):
+        ''' requests path with params and returns the decoded json response
+        '''
+        if not metrics.enabled:
+            return await self._get(path, params)
+        
+        stats = {"attempts": [], "response": None}
+        fields = {}
+        start = time.perf_counter()
+        try:
+            return await self._get(path, params, stats)
+        except Exception as e:
+            fields["error"] = type(e).__name__
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            response = stats["response"]
+            if response is not None:
+                fields["status"] = response.status_code
+                fields["bytes"] = len(response.content)
+            metrics.record("api", endpoint_name(path), seconds=seconds, wait_seconds=seconds - sum(stats["attempts"]),
+                           retries=max(len(stats["attempts"]) - 1, 0), **fields)
+    
+    async def _get(self, path, params, stats=None):
+        import httpx
+        session = self._get_session()
+        attempt = 0
+        while True:
+            await self._acquire()
+            response = None
+            sent = time.perf_counter()
+            try:
+                response = await session.get(path, params=params)
+                if stats is not None:
+                    stats["attempts"].append(time.perf_counter() - sent)
+                    stats["response"] = response
+                if response.status_code < 400:
+                    return response.json()
+                retryable = response.status_code == 429 or response.status_code >= 500
+            except (httpx.TransportError, httpx.TimeoutException):
+                if stats is not None:
+                    stats["attempts"].append(time.perf_counter() - sent)
+                retryable = True
+                if attempt >= self.limiter.max_retries:
+                    self.limiter.count("failed")
+                    raise
+
+            if not retryable or attempt >= self.limiter.max_retries:
+                self.limiter.count("failed")
+                # same error as the pycoingecko client raises
+                try:
+                    content = response.json()
+                except ValueError:
+                    response.raise_for_status()
+                raise ValueError(content)
+
+            delay = self.limiter.retry_delay(attempt, response)
+            if response is not None and response.status_code == 429:
+                # every caller of the limiter is over the budget, sync ones included
+                self.limiter.pause(delay)
+            self.limiter.count("retried")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def get_coins_list(self, **params):
+        return await self.get("coins/list", **params)
+
+    async def get_coins_markets(self, vs_currency, **params):
+        return await self.get("coins/markets", vs_currency=vs_currency, **params)
+
+    async def get_coin_market_chart_by_id(self, id, vs_currency, days, **params):
+        return await self.get("coins/{}/market_chart".format(id), vs_currency=vs_currency, days=days, **params)
+
+# {(loop, key): [asyncio lock, number of coroutines using it]} of the keys being fetched
+_fetching = {}
+
+@asynccontextmanager
+async def key_lock(key):
+    ''' holds a lock of key shared by the coroutines of the running event loop, so they fetch a key once between them
+    '''
+    name = (asyncio.get_running_loop(), key)
+    fetching = _fetching.setdefault(name, [asyncio.Lock(), 0])
+    fetching[1] += 1
+    try:
+        async with fetching[0]:
+            yield
+    finally:
+        fetching[1] -= 1
+        if not fetching[1]:
+            del _fetching[name]
+
+@asynccontextmanager
+async def held(lock):
+    ''' holds a cache backend lock without blocking the event loop
+    
+    the lock is taken and released by one worker thread of its own (SQLiteCache locks go through the connection of the
+    thread that took them), and the coroutine only awaits those two steps. a lock taken after the coroutine was
+    cancelled is released right away
+    '''
+    executor = ThreadPoolExecutor(max_workers=1)
+    entered = executor.submit(lock.__enter__)
+
+    def release():
+        # runs after __enter__, on the same thread
+        if not entered.cancelled() and entered.exception() is None:
+            lock.__exit__(None, None, None)
+
+    try:
+        await asyncio.wrap_future(entered)
+        yield
+    finally:
+        released = executor.submit(release)
+        executor.shutdown(wait=False)
+        await asyncio.wrap_future(released)
+
+async def get_or_fetch(cache, key, max_age, fetch, refresh=False):
+    ''' asyncio counterpart of CacheBackend.get_or_fetch, where fetch(stale_value) is a coroutine. returns (value, fetched)
+    
+    only the reads, writes and locking of the cache run in worker threads. the fetch runs on the event loop, under
+    the key's lock in the backend (for other processes and threads) and in the loop (for other coroutines)
+    '''
+    value, age = await asyncio.to_thread(cache.get, key)
+    if value is not None and not refresh and age < max_age:
+        return value, False
+
+    requested = time.time()
+    async with key_lock((id(cache),) + key), held(cache.lock(key)):
+        age = await asyncio.to_thread(cache.age, key)
+        if age is not None and age < time.time() - requested:
+            value, age = await asyncio.to_thread(cache.get, key)
+            if value is not None:
+                return value, False
+        value = await fetch(value)
+        await asyncio.to_thread(cache.set, key, value)
+    return value, True
+
+async def shared_fetch(key, ttl, fetch):
+    ''' asyncio counterpart of CoinGeckoAPI.shared_fetch: awaits fetch() through the shared cache, or directly if there is none
+    '''
+    if api.shared_cache is None:
+        return await fetch()
+    return (await get_or_fetch(api.shared_cache, key, ttl, lambda stale: fetch()))[0]
+
+async def cached_response(key, ttl, fetch):
+    ''' returns the value of key in response_cache, awaiting fetch() through the shared cache and caching it on a miss.
+    coroutines missing the same key at once fetch it once between them
+    '''
+    missing = object()
+    value = response_cache.get(key, missing)
+    if value is not missing:
+        return value
+    async with key_lock(("response",) + key):
+        value = response_cache.peek(key, missing)
+        if value is missing:
+            value = await shared_fetch(key, ttl, fetch)
+            response_cache.set(key, value, ttl)
+    return value
+
+async def update_market_chart(coin, cached=None, vs_currency="usd", days="10000", client=None):
+    ''' asyncio counterpart of CoinGeckoAPI.update_market_chart
+    '''
+    client = client or get_default_client()
+    if cached is not None and len(cached):
+        tail_days = (utc_timestamp() - cached.index[-1]).days + 2
+        tail = await client.get_coin_market_chart_by_id(id=coin, vs_currency=vs_currency, days=str(tail_days), interval="daily")
+        return append_market_chart(cached, parse_market_chart(tail))
+    return parse_market_chart(await client.get_coin_market_chart_by_id(id=coin, vs_currency=vs_currency, days=days))
+
+async def load_market_chart(coin, vs_currency="usd", cache=market_chart_cache, refresh=False, client=None, max_age=None):
+    ''' asyncio counterpart of CoinGeckoAPI.load_market_chart for the full history, through the same cache
+    '''
+    client = client or get_default_client()
+
+    async def fetch(cached):
+        return await update_market_chart(coin, cached, vs_currency, client=client)
+
+    if not cache:
+        return await fetch(None)
+    max_age = cache.max_age if max_age is None else max_age
+    data, fetched = await get_or_fetch(cache, (vs_currency, coin), max_age, fetch, refresh)
+    if metrics.enabled:
+        metrics.record("cache", "market_chart", hits=int(not fetched), misses=int(fetched))
+    return data
+
+async def fetch_market_snapshot(snapshot, bucket, ids, client):
+    # same requests as MarketSnapshot._fetch and _fetch_shared, awaited
+    async def fetch(ids):
+        rows = []
+        for start in range(0, len(ids), snapshot.batch_size):
+            batch = ids[start:start + snapshot.batch_size]
+            rows.extend(await client.get_coins_markets(vs_currency=snapshot.vs_currency, ids=",".join(batch), per_page=len(batch)))
+        return pd.DataFrame(rows).set_index("id") if rows else None
+
+    shared_cache = api.shared_cache
+    if shared_cache is None:
+        return await fetch(ids)
+    key = ("market_snapshot", snapshot.vs_currency, str(bucket))
+    frame, age = await asyncio.to_thread(shared_cache.get, key)
+    if frame is not None and all(i in frame.index for i in ids):
+        return frame
+    async with held(shared_cache.lock(key)):
+        frame, age = await asyncio.to_thread(shared_cache.get, key)
+        wanted = [i for i in ids if frame is None or i not in frame.index]
+        fetched = await fetch(wanted) if wanted else None
+        if fetched is not None:
+            frame = fetched if frame is None else pd.concat([frame, fetched])
+            await asyncio.to_thread(shared_cache.set, key, frame)
+            await asyncio.to_thread(shared_cache.delete, ("market_snapshot", snapshot.vs_currency, str(bucket - 1)))
+    return frame
+
+async def get_mkt_data_many(ids, vs_currency="usd", client=None):
+    ''' asyncio counterpart of CoinGeckoAPI.get_mkt_data_many, filling the same shared market snapshot
+    '''
+    client = client or get_default_client()
+    snapshot = get_market_snapshot(vs_currency)
+    bucket, wanted = snapshot.missing(ids)
+    if wanted:
+        async with key_lock(("market_snapshot", vs_currency)):
+            # another coroutine may have fetched them meanwhile
+            bucket, wanted = snapshot.missing(ids, count=False)
+            if wanted:
+                snapshot.add(bucket, wanted, await fetch_market_snapshot(snapshot, bucket, wanted, client))
+    mkt_data_df = snapshot.select(ids).reset_index()
+    return mkt_data_df.drop(columns=['name','image','roi','last_updated'], errors="ignore")
+
+
+
+default_client = None
+
+def get_default_client():
+    ''' returns the client shared by every AsyncCoinGeckoAPI created without one
+    '''
+    global default_client
+    if default_client is None:
+        default_client = AsyncClient()
+    return default_client
+
+class AsyncCoinGeckoAPI():
+    ''' Asyncio counterpart of CoinGeckoAPI, for use inside aiohttp / FastAPI services
+
+    every method is a coroutine and the data is returned rather than loaded lazily
+        ex. data = await AsyncCoinGeckoAPI("ethereum").get_data()
+
+    Attributes
+    ==========
+    coin: str
+        id of coin (default is set to bitcoin)
+    vs_currency: str
+        currency the data is quoted in (default is set to usd)
+    cache: MarketChartCache
+        on-disk cache shared with CoinGeckoAPI (default is the shared market_chart_cache). pass None to disable it
+    client: AsyncClient
+        pooled http client (default is one client shared by all instances)
+    '''
+
+    def __init__(self, coin="bitcoin", vs_currency="usd", cache=market_chart_cache, client=None):
+        self._coin = coin
+        self._vs_currency = vs_currency
+        self._cache = cache
+        self._client = client or get_default_client()
+        self.data = None
+        self.top_100 = None
+        self.coin_id = None
+
+    def __repr__(self):
+        return "AsyncCoinGeckoAPI(coin = {})".format(self._coin)
+
+    async def get_data(self, refresh=False):
+        ''' retrieves daily prices, log returns, market caps and total volume data and transforms to pandas dataframe
+
+        shares the cache and its fetch coalescing with CoinGeckoAPI: fresh cached data is reused, stale cached data only
+        has its missing tail fetched, and a coin is fetched once however many callers (sync, async or in other
+        processes) ask for it at the same time
+        '''
+        self.data = await load_market_chart(self._coin, self._vs_currency, cache=self._cache, refresh=refresh, client=self._client)
+        return self.data
+
+    async def get_top_100(self, n=100):
+        ''' retrieves rank and id of the top n (default 100) cryptocurrencies on CoinGecko, organized by market cap
+
+        cached like CoinGeckoAPI.get_top_100, in the shared cache too if one is in use
+        '''
+        pages = market_pages(n)
+
+        async def fetch():
+            # the pages of top_markets, awaited
+            markets = []
+            for page, per_page in pages:
+                rows = await self._client.get_coins_markets(vs_currency="usd", per_page=per_page, page=page)
+                markets.extend(rows)
+                if len(rows) < per_page:
+                    break
+            return pd.DataFrame(markets[:n], columns=["id", "market_cap_rank"]).set_index(keys="market_cap_rank")
+
+        top_100 = await cached_response(("coins_markets", "usd", str(n)), endpoint_ttl["coins_markets"], fetch)
+        self.top_100 = top_100.copy()
+        return self.top_100
+
+    async def get_coin_id(self):
+        ''' retrieves coin id for all cryptocurrencies listed on CoinGecko
+
+        cached like CoinGeckoAPI.get_coin_id, in the shared cache too if one is in use
+        '''
+        async def fetch():
+            return pd.DataFrame(await self._client.get_coins_list(), columns=["id", "symbol"]).set_index(keys="symbol")
+
+        coin_id = await cached_response(("coins_list",), endpoint_ttl["coins_list"], fetch)
+        self.coin_id = coin_id.copy()
+        return self.coin_id
+
+    async def get_mkt_data(self):
+        ''' retrieves market data about the coin from the market snapshot shared with CoinGeckoAPI
+        '''
+        return await get_mkt_data_many([self._coin], vs_currency=self._vs_currency, client=self._client)
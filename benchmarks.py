@@ -0,0 +1,448 @@
+# BENCHMARKS
+# run with: python benchmarks.py (python benchmarks.py --help for the replay suite options)
+import argparse, io, json, os, platform, shutil, subprocess, sys, tempfile, time, timeit, tracemalloc
+from contextlib import contextmanager
+import numpy as np, pandas as pd
+
+from CoinGeckoAPI import parse_market_chart, export_data
+
+def make_market_chart(n=10000, seed=0):
+    ''' builds a synthetic market chart response with n daily [timestamp, value] pairs
+    '''
+    rng = np.random.default_rng(seed)
+    timestamps = 1367107200000 + np.arange(n) * 86400000
+    prices = rng.random(n) * 100 + 1
+    return {
+        "prices": [[int(t), float(v)] for t, v in zip(timestamps, prices)],
+        "market_caps": [[int(t), float(v * 1e6)] for t, v in zip(timestamps, prices)],
+        "total_volumes": [[int(t), float(v * 1e3)] for t, v in zip(timestamps, prices)]
+    }
+
+# previous implementations, kept for comparison
+def parse_market_chart_loops(data):
+    data = pd.DataFrame(data)
+    dates = []
+    for i, j in data.prices:
+        dates.append(i)
+    prices = []
+    for i, j in data.prices:
+        prices.append(j)
+    market_caps = []
+    for i, j in data.market_caps:
+        market_caps.append(j)
+    total_volumes = []
+    for i, j in data.total_volumes:
+        total_volumes.append(j)
+    data["date"] = pd.DataFrame(dates)
+    data["price"] = pd.DataFrame(prices)
+    data["log_returns"] = np.log(data.price / data.price.shift(1))
+    data["market_cap"] = pd.DataFrame(market_caps)
+    data["total_volume"] = pd.DataFrame(total_volumes)
+    data["date"] = (pd.to_datetime(data["date"],unit='ms'))
+    data = data.drop(columns=["prices", "market_caps", "total_volumes"])
+    data = data.set_index(data.date)
+    return data.drop(columns="date")
+
+def export_data_loops(x):
+    date = []
+    for i in x.index:
+        date.append(str(i)[0:10])
+    return pd.DataFrame({
+        "date": date,
+        "price": list(x.price),
+        "log returns": list(x.log_returns),
+        "market cap": list(x.market_cap),
+        "total volume": list(x.total_volume)
+    })
+
+def report(name, func, number):
+    ''' prints the best time per call (in ms) out of 5 repeats
+    '''
+    best = min(timeit.repeat(func, number=number, repeat=5)) / number
+    print("{:<40}{:>10.3f} ms".format(name, best * 1000))
+    return best
+
+def bench_parse(n=10000, number=20):
+    print("parse_market_chart ({} rows)".format(n).center(52, "="))
+    raw = make_market_chart(n)
+    old = report("loops", lambda: parse_market_chart_loops(raw), number)
+    new = report("vectorized", lambda: parse_market_chart(raw), number)
+    print("speedup: {:.1f}x \n".format(old / new))
+
+def bench_export(n=10000, number=20):
+    print("export_data ({} rows)".format(n).center(52, "="))
+    df = parse_market_chart(make_market_chart(n))
+    old = report("loops", lambda: export_data_loops(df), number)
+    new = report("vectorized", lambda: export_data(df), number)
+    print("speedup: {:.1f}x \n".format(old / new))
+
+def make_frame(n=3650, seed=0):
+    ''' builds a dataframe shaped like CoinGeckoAPI.data with n daily rows
+    '''
+    rng = np.random.default_rng(seed)
+    price = np.exp(np.cumsum(rng.normal(0, 0.03, n)))
+    index = pd.date_range("2014-01-01", periods=n, freq="D", tz="UTC", name="date")
+    return pd.DataFrame({
+        "price": price,
+        "log_returns": np.r_[np.nan, np.log(price[1:] / price[:-1])],
+        "market_cap": price * 1e6,
+        "total_volume": price * 1e3
+    }, index=index)
+
+def traced_memory(build):
+    ''' returns the memory (in bytes) still held by what build() returns, and the object itself
+    '''
+    tracemalloc.start()
+    result = build()
+    current = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return current, result
+
+def bench_memory(n_coins=200, days=3650):
+    from store import CompactStore
+    print("memory ({} coins x {} days)".format(n_coins, days).center(52, "="))
+    
+    def frames():
+        return [make_frame(days, seed) for seed in range(n_coins)]
+    
+    def compact(path=None, dtype="float32"):
+        store = CompactStore(path, dtype=dtype)
+        for seed in range(n_coins):
+            store.add("coin-{}".format(seed), make_frame(days, seed))
+        return store
+    
+    base, _ = traced_memory(frames)
+    print("{:<40}{:>10.1f} MB".format("per-coin dataframes (float64)", base / 1e6))
+    for name, build in [("compact store (float64)", lambda: compact(dtype="float64")),
+                        ("compact store (float32)", compact)]:
+        used, _ = traced_memory(build)
+        print("{:<40}{:>10.1f} MB  ({:.1f}x smaller)".format(name, used / 1e6, base / used))
+    
+    with tempfile.TemporaryDirectory() as path:
+        compact(path)
+        used, store = traced_memory(lambda: CompactStore(path))
+        print("{:<40}{:>10.1f} MB  (coins paged in on read)".format("memory mapped store (float32)", used / 1e6))
+        used, _ = traced_memory(lambda: [store.get(coin).price.iloc[-1] for coin in store.coins[:10]])
+        print("{:<40}{:>10.1f} MB".format("  after reading 10 coins", used / 1e6))
+        del store
+    print("")
+
+IMPORT_SNIPPET = """
+import sys, time
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+print(",".join(m for m in ("pycoingecko", "requests", "matplotlib", "pyinputplus") if m in sys.modules))
+"""
+
+def time_import(module, repeat=5):
+    ''' imports module in fresh interpreters and returns the best import time in seconds and the heavy modules it pulled in
+    '''
+    here = os.path.dirname(os.path.abspath(__file__))
+    times = []
+    for i in range(repeat):
+        out = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET.format(module=module)],
+                             cwd=here, capture_output=True, text=True, check=True).stdout.split("\n")
+        times.append(float(out[0]))
+    return min(times), out[1]
+
+def bench_import(budget=0.1):
+    print("import CoinGeckoAPI".center(52, "="))
+    base, _ = time_import("numpy, pandas")
+    total, loaded = time_import("CoinGeckoAPI")
+    print("{:<40}{:>10.3f} ms".format("numpy + pandas", base * 1000))
+    print("{:<40}{:>10.3f} ms".format("CoinGeckoAPI", total * 1000))
+    print("{:<40}{:>10.3f} ms".format("CoinGeckoAPI on top of its dependencies", (total - base) * 1000))
+    print("heavy modules imported: {}".format(loaded or "none"))
+    if total - base > budget or loaded:
+        print("WARNING: import is over the {:.0f} ms budget or imports heavy modules \n".format(budget * 1000))
+    else:
+        print("")
+
+# replay suite: the whole pipeline against recorded responses served by a local mock server
+@contextmanager
+def replay(server):
+    ''' points the module wide cg client at server for the duration of the block, with an unlimited rate budget
+    '''
+    import CoinGeckoAPI as api
+    saved = api.cg
+    api.cg = api.make_client(server.url, limiter=api.RateLimiter(calls_per_minute=1e9, burst=1e9))
+    api.response_cache.invalidate()
+    api.market_snapshots.clear()
+    try:
+        yield api
+    finally:
+        api.cg = saved
+        api.response_cache.invalidate()
+        api.market_snapshots.clear()
+
+def measure(func, runs=20, setup=None, items=1, warmup=1):
+    ''' times func over runs calls and returns latency percentiles (ms), throughput (items per second) and the peak
+    memory (MB) allocated by one call. setup() runs before every call, outside the timing, and its result is passed to func
+    '''
+    setup = setup or (lambda: None)
+    for i in range(warmup):
+        func(setup())
+    times = []
+    for i in range(runs):
+        arg = setup()
+        start = time.perf_counter()
+        func(arg)
+        times.append(time.perf_counter() - start)
+    arg = setup()
+    tracemalloc.start()
+    func(arg)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    times = np.array(times) * 1000
+    return {
+        "runs": runs,
+        "mean_ms": float(times.mean()),
+        "p50_ms": float(np.percentile(times, 50)),
+        "p95_ms": float(np.percentile(times, 95)),
+        "p99_ms": float(np.percentile(times, 99)),
+        "throughput": float(items / times.mean() * 1000),
+        "peak_mb": float(peak / 1e6)
+    }
+
+def print_result(name, result, unit):
+    print("{:<28}{:>9.2f}{:>9.2f}{:>9.2f}{:>11.1f} {:<8}{:>8.1f}".format(
+        name, result["p50_ms"], result["p95_ms"], result["p99_ms"], result["throughput"], unit, result["peak_mb"]))
+
+def bench_replay(recordings=None, runs=20, n_coins=50, latency=0.0):
+    ''' runs the get_data, bulk loading, export, slicing and plotting cases against the mock server and returns
+    {case: result} as returned by measure()
+    '''
+    from mock_server import MockCoinGeckoServer, Recordings
+
+    results = {}
+    print("replay suite".center(90, "="))
+    print("{:<28}{:>9}{:>9}{:>9}{:>20}{:>8}".format("case", "p50 ms", "p95 ms", "p99 ms", "throughput", "peak MB"))
+
+    def run(name, func, unit, runs=runs, **kwargs):
+        results[name] = measure(func, runs=runs, **kwargs)
+        print_result(name, results[name], unit)
+
+    workdir = tempfile.mkdtemp(prefix="coingecko_bench_")
+    with MockCoinGeckoServer(Recordings(recordings), latency=latency) as server, replay(server) as api:
+        def fresh_cache(max_age=6 * 60 * 60):
+            return api.MarketChartCache(tempfile.mkdtemp(dir=workdir), max_age=max_age)
+
+        warm = fresh_cache()
+        api.load_market_chart("bitcoin", cache=warm)
+        stale = fresh_cache(max_age=0)
+        api.load_market_chart("bitcoin", cache=stale)
+
+        run("get_data (cold)", lambda cache: api.CoinGeckoAPI("bitcoin", cache=cache).get_data(), "calls/s",
+            setup=fresh_cache)
+        run("get_data (cached)", lambda cache: api.CoinGeckoAPI("bitcoin", cache=cache).get_data(), "calls/s",
+            setup=lambda: warm)
+        run("get_data (stale, tail)", lambda cache: api.CoinGeckoAPI("bitcoin", cache=cache).get_data(), "calls/s",
+            setup=lambda: stale)
+
+        def uncached():
+            api.response_cache.invalidate()
+            api.market_snapshots.clear()
+        run("get_coin_id", lambda _: api.CoinGeckoAPI().get_coin_id(), "calls/s", setup=uncached)
+        run("get_top_100 (n=250)", lambda _: api.CoinGeckoAPI().get_top_100(250), "calls/s", setup=uncached)
+
+        coins = ["bitcoin", "ethereum"] + ["coin-{}".format(i) for i in range(n_coins - 2)]
+        run("get_mkt_data_many", lambda _: api.get_mkt_data_many(coins), "coins/s", setup=uncached, items=n_coins)
+        run("load_many (cold)", lambda cache: api.load_many(coins, cache=cache), "coins/s", runs=max(3, runs // 4),
+            setup=fresh_cache, items=n_coins)
+        bulk_cache = fresh_cache()
+        data, errors = api.load_many(coins, cache=bulk_cache)
+        run("load_many (cached)", lambda cache: api.load_many(coins, cache=cache), "coins/s", runs=max(3, runs // 4),
+            setup=lambda: bulk_cache, items=n_coins)
+
+        rows = len(data)
+        for fmt in ("csv", "parquet"):
+            path = os.path.join(workdir, "export." + fmt)
+            run("export {}".format(fmt), lambda _: api.export_frames(data, path, fmt=fmt), "rows/s",
+                runs=max(3, runs // 4), items=rows)
+
+        single = data.loc["bitcoin"]
+        bounds = np.random.default_rng(0).integers(0, len(single), size=(runs * 10 + 10, 2))
+        windows = iter([tuple(single.index[np.sort(b)]) for b in bounds])
+        run("slice_dates", lambda window: api.slice_dates(single, *window, snap="nearest"), "calls/s",
+            runs=runs * 10, setup=lambda: next(windows))
+
+        try:
+            import matplotlib
+            matplotlib.use("Agg")
+            import matplotlib.pyplot as plt
+        except ImportError:
+            plt = None
+        if plt is not None:
+            def plot(_):
+                fig = plt.figure(figsize=(8, 5), dpi=80)
+                plt.plot(single.price, label="price")
+                plt.legend(loc="upper left")
+                plt.xticks(rotation=45)
+                fig.savefig(io.BytesIO(), format="png")
+                plt.close(fig)
+            run("plot (agg, png)", plot, "plots/s", runs=max(3, runs // 4))
+
+        requests = dict(server.requests)
+    shutil.rmtree(workdir, ignore_errors=True)
+    print("requests served: {} \n".format(", ".join("{} {}".format(n, e) for e, n in sorted(requests.items()))))
+    return results
+
+# lightweight mode: cold start and per-call overhead of lite.py against CoinGeckoAPI
+COLD_START_SNIPPET = """
+import sys, time
+start = time.perf_counter()
+{setup}
+imported = time.perf_counter()
+{call}
+print(imported - start)
+print(time.perf_counter() - imported)
+print(",".join(m for m in ("numpy", "pandas") if m in sys.modules))
+"""
+
+COLD_START_CASES = {
+    "CoinGeckoAPI": ("import CoinGeckoAPI as api\n"
+                     "api.cg = api.make_client({url!r}, limiter=api.RateLimiter(1e9, 1e9))",
+                     "api.CoinGeckoAPI('ethereum').get_mkt_data()"),
+    "lite": ("import api_client, lite\n"
+             "client = api_client.make_client({url!r}, limiter=api_client.RateLimiter(1e9, 1e9))",
+             "lite.LiteCoinGeckoAPI('ethereum', client=client).get_mkt_data()")
+}
+
+def cold_start(name, url, repeat=5):
+    ''' runs the first get_mkt_data call of a fresh interpreter and returns the best import and first call times in
+    seconds, and the heavy modules that were loaded
+    '''
+    here = os.path.dirname(os.path.abspath(__file__))
+    setup, call = COLD_START_CASES[name]
+    snippet = COLD_START_SNIPPET.format(setup=setup.format(url=url), call=call)
+    runs = []
+    for i in range(repeat):
+        out = subprocess.run([sys.executable, "-c", snippet], cwd=here, capture_output=True, text=True, check=True).stdout.split("\n")
+        runs.append((float(out[0]), float(out[1]), out[2]))
+    return min(runs, key=lambda run: run[0] + run[1])
+
+def bench_lite(runs=20, latency=0.0):
+    ''' compares lite.py with CoinGeckoAPI: cold start of a fresh interpreter up to its first result, then the
+    per-call overhead of the same lookups in a warm process. returns {case: result} as returned by measure()
+    '''
+    import lite
+    from mock_server import MockCoinGeckoServer
+
+    results = {}
+    with MockCoinGeckoServer(latency=latency) as server, replay(server) as api:
+        print("lite: cold start".center(90, "="))
+        print("{:<28}{:>12}{:>14}{:>12}   {}".format("", "import ms", "first call ms", "total ms", "loaded"))
+        for name in COLD_START_CASES:
+            imported, first_call, loaded = cold_start(name, server.url)
+            print("{:<28}{:>12.1f}{:>14.1f}{:>12.1f}   {}".format(
+                name, imported * 1000, first_call * 1000, (imported + first_call) * 1000, loaded or "none"))
+        print("")
+
+        print("lite: per call".center(90, "="))
+        print("{:<28}{:>9}{:>9}{:>9}{:>20}{:>8}".format("case", "p50 ms", "p95 ms", "p99 ms", "throughput", "peak MB"))
+        def run(name, func, unit, runs=runs, **kwargs):
+            results[name] = measure(func, runs=runs, **kwargs)
+            print_result(name, results[name], unit)
+
+        def uncached():
+            api.response_cache.invalidate()
+            api.market_snapshots.clear()
+            lite.lite_cache.invalidate()
+        client = api.cg
+        run("get_mkt_data", lambda _: api.CoinGeckoAPI("ethereum").get_mkt_data(), "calls/s", setup=uncached)
+        run("get_mkt_data (lite)", lambda _: lite.LiteCoinGeckoAPI("ethereum", client=client).get_mkt_data(), "calls/s",
+            setup=uncached)
+        run("get_mkt_data cached", lambda _: api.CoinGeckoAPI("ethereum").get_mkt_data(), "calls/s")
+        run("get_mkt_data cached (lite)", lambda _: lite.LiteCoinGeckoAPI("ethereum", client=client).get_mkt_data(), "calls/s")
+        run("coin id lookup", lambda _: "ethereum" in api.CoinGeckoAPI().get_coin_id().id.values, "calls/s", setup=uncached)
+        run("coin id lookup (lite)", lambda _: "ethereum" in lite.LiteCoinGeckoAPI(client=client).get_coin_id(), "calls/s",
+            setup=uncached)
+        run("get_data", lambda _: api.CoinGeckoAPI("bitcoin", cache=None).get_data(), "calls/s")
+        run("get_data (lite)", lambda _: lite.LiteCoinGeckoAPI("bitcoin", client=client).get_data(), "calls/s")
+        raw = make_market_chart(3650)
+        run("parse_market_chart", lambda _: parse_market_chart(raw), "calls/s", runs=runs * 5)
+        run("parse_market_chart (lite)", lambda _: lite.parse_market_chart(raw), "calls/s", runs=runs * 5)
+    print("")
+    return results
+
+def environment():
+    ''' describes what the results were measured on, so saved results from different commits can be told apart
+    '''
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "machine": platform.machine(),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    }
+
+def compare(results, baseline, threshold=0.1):
+    ''' prints the change in p50 latency and throughput against a saved run and returns the regressed cases
+    '''
+    print("compared to {} ({})".format(baseline["environment"].get("commit") or "baseline", baseline["environment"].get("date")).center(90, "="))
+    regressed = []
+    for name, result in results.items():
+        old = baseline["results"].get(name)
+        if old is None:
+            continue
+        change = result["p50_ms"] / old["p50_ms"] - 1
+        flag = ""
+        if change > threshold:
+            flag = "REGRESSION"
+            regressed.append(name)
+        print("{:<28}{:>9.2f} -> {:>9.2f} ms {:>+8.1%}  {}".format(name, old["p50_ms"], result["p50_ms"], change, flag))
+    print("")
+    return regressed
+
+def main():
+    parser = argparse.ArgumentParser(description="CoinGeckoAPI benchmarks")
+    parser.add_argument("--suite", choices=["micro", "replay", "lite", "all"], default="all")
+    parser.add_argument("--recordings", default="bench_data",
+                        help="directory of recorded responses, synthetic responses are used for anything not recorded")
+    parser.add_argument("--record", action="store_true", help="record real API responses into --recordings and exit")
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--coins", type=int, default=50, help="number of coins in the bulk cases")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every mock server response")
+    parser.add_argument("--output", help="save the replay and lite results as json")
+    parser.add_argument("--compare", help="json saved by --output to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1, help="p50 slowdown reported as a regression")
+    args = parser.parse_args()
+
+    if args.record:
+        from mock_server import record
+        record(args.recordings)
+        return
+
+    if args.suite in ("micro", "all"):
+        bench_import()
+        bench_parse()
+        bench_export()
+        bench_memory()
+
+    results = {}
+    if args.suite in ("replay", "all"):
+        recordings = args.recordings if os.path.isdir(args.recordings) else None
+        results.update(bench_replay(recordings, runs=args.runs, n_coins=args.coins, latency=args.latency))
+    if args.suite in ("lite", "all"):
+        results.update(bench_lite(runs=args.runs, latency=args.latency))
+
+    if results:
+        saved = {"environment": environment(), "parameters": vars(args), "results": results}
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(saved, f, indent=2)
+        if args.compare:
+            with open(args.compare) as f:
+                if compare(results, json.load(f), args.threshold):
+                    sys.exit(1)
+
+if __name__ == "__main__":
+    main()
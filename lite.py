@@ -0,0 +1,266 @@
+# LIGHTWEIGHT MODE
+# CoinGeckoAPI without pandas: results are plain records and numpy structured arrays, converted to dataframes on demand
+import itertools
+
+import api_client
+from api_client import TTLCache, endpoint_ttl, metrics, top_markets
+
+# cache of the coin list, top coins and market data records, kept apart from the dataframes of CoinGeckoAPI.response_cache
+lite_cache = TTLCache(maxsize=4096, name="lite")
+
+class Record():
+    ''' Base of the lightweight result types: a fixed set of fields in __slots__, no per instance dict
+    '''
+
+    __slots__ = ()
+
+    def __init__(self, *args, **kwargs):
+        for field, value in itertools.chain(zip(self.__slots__, args), kwargs.items()):
+            setattr(self, field, value)
+
+    def __repr__(self):
+        return "{}({})".format(type(self).__name__, ", ".join("{} = {!r}".format(field, getattr(self, field)) for field in self.__slots__))
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.to_tuple() == other.to_tuple()
+
+    @classmethod
+    def from_json(cls, row):
+        ''' builds a record from an API response row, ignoring fields the record does not have
+        '''
+        record = cls.__new__(cls)
+        for field in cls.__slots__:
+            setattr(record, field, row.get(field))
+        return record
+
+    def to_tuple(self):
+        return tuple(getattr(self, field) for field in self.__slots__)
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.__slots__}
+
+class Coin(Record):
+    ''' A coin listed on CoinGecko
+    '''
+
+    __slots__ = ("id", "symbol", "name")
+
+class MarketData(Record):
+    ''' Market data of one coin, the fields CoinGeckoAPI.get_mkt_data returns
+    '''
+
+    __slots__ = ("id", "symbol", "current_price", "market_cap", "market_cap_rank", "fully_diluted_valuation", "total_volume",
+                 "high_24h", "low_24h", "price_change_24h", "price_change_percentage_24h", "market_cap_change_24h",
+                 "market_cap_change_percentage_24h", "circulating_supply", "total_supply", "max_supply", "ath",
+                 "ath_change_percentage", "ath_date", "atl", "atl_change_percentage", "atl_date")
+
+class CoinList():
+    ''' Every coin listed on CoinGecko, indexed by id and by symbol
+
+    Methods
+    ==========
+    lookup:
+        returns the ids of the coins with a ticker symbol, in listing order
+            ex. LiteCoinGeckoAPI().get_coin_id().lookup("eth")
+
+    "ethereum" in coin_list checks an id, coin_list["ethereum"] returns its Coin
+    '''
+
+    __slots__ = ("ids", "symbols", "names", "_by_id", "_by_symbol")
+
+    def __init__(self, rows):
+        # kept as columns, Coin records are only made for the coins that are looked at
+        self.ids = [row["id"] for row in rows]
+        self.symbols = [row["symbol"] for row in rows]
+        self.names = [row.get("name") for row in rows]
+        self._by_id = dict(zip(self.ids, range(len(self.ids))))
+        self._by_symbol = None
+
+    def __repr__(self):
+        return "CoinList(coins = {})".format(len(self.ids))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return map(Coin, self.ids, self.symbols, self.names)
+
+    def __contains__(self, coin_id):
+        return coin_id in self._by_id
+
+    def __getitem__(self, coin_id):
+        i = self._by_id[coin_id]
+        return Coin(self.ids[i], self.symbols[i], self.names[i])
+
+    def lookup(self, symbol):
+        if self._by_symbol is None:
+            by_symbol = {}
+            for coin_id, coin_symbol in zip(self.ids, self.symbols):
+                by_symbol.setdefault(coin_symbol, []).append(coin_id)
+            self._by_symbol = by_symbol
+        return list(self._by_symbol.get(symbol.lower(), ()))
+
+    def to_frame(self):
+        ''' returns the pandas dataframe CoinGeckoAPI.get_coin_id returns: ids indexed by symbol
+        '''
+        import pandas as pd
+        coin_id = pd.DataFrame({"id": self.ids, "symbol": self.symbols})
+        return coin_id.set_index(keys="symbol")
+
+class TopCoins(list):
+    ''' The top coins by market cap, a list of MarketData ordered by rank
+    '''
+
+    __slots__ = ()
+
+    def to_frame(self):
+        ''' returns the pandas dataframe CoinGeckoAPI.get_top_100 returns: ids indexed by market_cap_rank
+        '''
+        import pandas as pd
+        top = pd.DataFrame([(record.id, record.market_cap_rank) for record in self], columns=["id", "market_cap_rank"])
+        return top.set_index(keys="market_cap_rank")
+
+def chart_dtype():
+    ''' returns the numpy dtype of market charts: date (datetime64[ms], UTC), price, log_returns, market_cap, total_volume
+    '''
+    import numpy as np
+    return np.dtype([("date", "datetime64[ms]"), ("price", "f8"), ("log_returns", "f8"), ("market_cap", "f8"), ("total_volume", "f8")])
+
+def parse_market_chart(data):
+    ''' transforms a raw market chart response into a numpy structured array of chart_dtype, one row per point
+    '''
+    import numpy as np
+    from parsing import chart_columns
+    start = metrics.clock()
+    columns = chart_columns(data)
+    chart = np.empty(len(columns["date"]), dtype=chart_dtype())
+    for name, column in columns.items():
+        chart[name] = column
+    if start:
+        metrics.record("stage", "parse_market_chart_lite", start, rows=len(chart))
+    return chart
+
+def to_frame(result):
+    ''' converts a lightweight result to the pandas dataframe the matching CoinGeckoAPI method returns
+
+    a market chart becomes a frame indexed by UTC date like CoinGeckoAPI.data, TopCoins a frame of ids indexed by
+    market_cap_rank like get_top_100, any other list of MarketData one row per coin like get_mkt_data_many (with every
+    MarketData field, None where the API sent none), and a CoinList a frame of ids indexed by symbol like get_coin_id
+    '''
+    import pandas as pd
+    if isinstance(result, (CoinList, TopCoins)):
+        return result.to_frame()
+    if isinstance(result, Record):
+        result = [result]
+    if isinstance(result, list):
+        fields = type(result[0]).__slots__ if result else MarketData.__slots__
+        return pd.DataFrame([record.to_tuple() for record in result], columns=list(fields))
+
+    dates = pd.DatetimeIndex(pd.to_datetime(result["date"].astype("int64"), unit="ms", utc=True), name="date")
+    return pd.DataFrame({column: result[column] for column in result.dtype.names if column != "date"}, index=dates)
+
+def get_mkt_data_many(ids, vs_currency="usd", batch_size=250, client=None):
+    ''' retrieves market data about several coins at once as a list of MarketData, skipping ids without market data
+        ex. get_mkt_data_many(["bitcoin", "ethereum"])
+    '''
+    client = client or api_client.cg
+    ids = list(dict.fromkeys(ids))
+    records = {}
+    wanted = []
+    for coin in ids:
+        record = lite_cache.get(("coin_markets", vs_currency, coin))
+        if record is None:
+            wanted.append(coin)
+        else:
+            records[coin] = record
+    for start in range(0, len(wanted), batch_size):
+        batch = wanted[start:start + batch_size]
+        for row in client.get_coins_markets(vs_currency=vs_currency, ids=",".join(batch), per_page=len(batch)):
+            record = MarketData.from_json(row)
+            records[record.id] = record
+            lite_cache.set(("coin_markets", vs_currency, record.id), record, endpoint_ttl["coins_markets"])
+    return [records[coin] for coin in ids if coin in records]
+
+class LiteCoinGeckoAPI():
+    ''' Counterpart of CoinGeckoAPI for latency sensitive callers, which never imports pandas
+
+    the same calls return plain records and numpy structured arrays instead of dataframes (numpy is only imported
+    for market charts). pass any result to to_frame to get the dataframe CoinGeckoAPI would have returned.
+    the client and its rate budget are shared with CoinGeckoAPI
+        ex. LiteCoinGeckoAPI("ethereum").get_mkt_data().current_price
+            "ethereum" in LiteCoinGeckoAPI().get_coin_id()
+
+    Attributes
+    ==========
+    coin: str
+        id of coin (default is set to bitcoin)
+    vs_currency: str
+        currency the data is quoted in (default is set to usd)
+    client: ThrottledClient
+        client the API is called with (default is cg, looked up on every call)
+
+    Methods
+    ==========
+    get_data:
+        retrieves the market chart as a numpy structured array with date, price, log_returns, market_cap and
+        total_volume fields. the chart is not cached on disk, use CoinGeckoAPI for that
+            ex. LiteCoinGeckoAPI().data["price"][-1]
+
+    get_top_100:
+        retrieves the market data of the top n (default 100) coins by market cap as TopCoins, a list of MarketData
+
+    get_coin_id:
+        retrieves every listed coin as a CoinList
+            ex. LiteCoinGeckoAPI().get_coin_id().lookup("eth")
+
+    get_mkt_data:
+        retrieves current market data about the coin as a MarketData, or None if CoinGecko has none
+    '''
+
+    def __init__(self, coin="bitcoin", vs_currency="usd", client=None):
+        self._coin = coin
+        self._vs_currency = vs_currency
+        self._client = client
+        self._data = None
+
+    def __repr__(self):
+        return "LiteCoinGeckoAPI(coin = {})".format(self._coin)
+
+    @property
+    def client(self):
+        return self._client or api_client.cg
+
+    def get_data(self, days="10000"):
+        ''' retrieves the market chart over the last days (default is the full history) as a numpy structured array
+        '''
+        self._data = parse_market_chart(self.client.get_coin_market_chart_by_id(id=self._coin, vs_currency=self._vs_currency, days=days))
+        return self._data
+
+    @property
+    def data(self):
+        ''' the full market chart, downloaded on first access
+        '''
+        if self._data is None:
+            self.get_data()
+        return self._data
+
+    def get_top_100(self, n=100):
+        ''' retrieves the market data of the top n coins by market cap, ordered by rank
+        '''
+        def fetch():
+            rows = top_markets(n, lambda page, per_page: self.client.get_coins_markets(vs_currency="usd", per_page=per_page, page=page))
+            return [MarketData.from_json(row) for row in rows]
+        return TopCoins(lite_cache.get_or_set(("coins_markets", "usd", str(n)), endpoint_ttl["coins_markets"], fetch))
+
+    def get_coin_id(self):
+        ''' retrieves every coin listed on CoinGecko as a CoinList
+        '''
+        def fetch():
+            return CoinList(self.client.get_coins_list())
+        return lite_cache.get_or_set(("coins_list",), endpoint_ttl["coins_list"], fetch)
+
+    def get_mkt_data(self):
+        ''' retrieves market data about the coin, shared for endpoint_ttl["coins_markets"] seconds
+        '''
+        records = get_mkt_data_many([self._coin], vs_currency=self._vs_currency, client=self._client)
+        return records[0] if records else None
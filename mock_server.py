@@ -0,0 +1,212 @@
+# MOCK SERVER
+# serves recorded (or synthetic) CoinGecko responses from a local http server, for benchmarks and testing
+import json, os, threading, time, zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import numpy as np
+
+DAY_MS = 86400000
+
+def synthetic_market_chart(coin, days=3650, now=None):
+    ''' builds a market chart response for coin with days daily points plus an intraday last point, like the real API
+
+    the values only depend on the coin id, so every run replays the same data
+    '''
+    rng = np.random.default_rng(zlib.crc32(coin.encode()))
+    now = int((now or time.time()) * 1000)
+    timestamps = np.r_[now // DAY_MS * DAY_MS - np.arange(days - 1, -1, -1) * DAY_MS, now]
+    prices = 100 * np.exp(np.cumsum(rng.normal(0, 0.03, len(timestamps))))
+    return {
+        "prices": [[int(t), float(v)] for t, v in zip(timestamps, prices)],
+        "market_caps": [[int(t), float(v * 1.9e7)] for t, v in zip(timestamps, prices)],
+        "total_volumes": [[int(t), float(v * 3.1e5)] for t, v in zip(timestamps, prices)]
+    }
+
+def synthetic_coins_list(n=13000):
+    ''' builds a coins/list response with n coins, starting with bitcoin and ethereum
+    '''
+    coins = [{"id": "bitcoin", "symbol": "btc", "name": "Bitcoin"}, {"id": "ethereum", "symbol": "eth", "name": "Ethereum"}]
+    coins += [{"id": "coin-{}".format(i), "symbol": "c{}".format(i % 5000), "name": "Coin {}".format(i)} for i in range(n - 2)]
+    return coins
+
+def synthetic_coins_markets(coins_list):
+    ''' builds a coins/markets response for every coin in coins_list, ranked in list order
+    '''
+    return [{
+        "id": coin["id"], "symbol": coin["symbol"], "name": coin["name"], "image": "", "roi": None, "last_updated": "",
+        "current_price": 100.0 / rank, "market_cap": 1e12 / rank, "market_cap_rank": rank, "total_volume": 1e10 / rank
+    } for rank, coin in enumerate(coins_list, 1)]
+
+class Recordings():
+    ''' Recorded CoinGecko responses, read from a directory or generated when nothing was recorded
+
+    the directory holds coins_list.json, coins_markets.json and market_chart/<coin>.json, as written by record()
+
+    Attributes
+    ==========
+    path: str
+        directory of the recordings (default is None, which replays synthetic responses only)
+    '''
+
+    def __init__(self, path=None):
+        self.path = path
+        self._charts = {}
+        self._lock = threading.Lock()
+        self.coins_list = self._read("coins_list.json") or synthetic_coins_list()
+        self.coins_markets = self._read("coins_markets.json") or synthetic_coins_markets(self.coins_list)
+
+    def __repr__(self):
+        return "Recordings(path = {})".format(self.path)
+
+    def _read(self, name):
+        if self.path is None:
+            return None
+        try:
+            with open(os.path.join(self.path, name)) as f:
+                return json.load(f)
+        except OSError:
+            return None
+
+    def market_chart(self, coin):
+        ''' returns the recorded market chart of coin, or a synthetic one if it was not recorded
+        '''
+        with self._lock:
+            if coin not in self._charts:
+                self._charts[coin] = self._read(os.path.join("market_chart", coin + ".json")) or synthetic_market_chart(coin)
+            return self._charts[coin]
+
+def record(path, coins=("bitcoin", "ethereum"), client=None):
+    ''' saves real API responses for the coins list, the first page of coins/markets and the market charts of coins
+        ex. record("bench_data", coins=["bitcoin", "ethereum", "solana"])
+    '''
+    from CoinGeckoAPI import cg
+    client = client or cg
+    os.makedirs(os.path.join(path, "market_chart"), exist_ok=True)
+    responses = {
+        "coins_list.json": client.get_coins_list(),
+        "coins_markets.json": client.get_coins_markets(vs_currency="usd", per_page=250)
+    }
+    for coin in coins:
+        responses[os.path.join("market_chart", coin + ".json")] = client.get_coin_market_chart_by_id(id=coin, vs_currency="usd", days="10000")
+    for name, response in responses.items():
+        with open(os.path.join(path, name), "w") as f:
+            json.dump(response, f)
+
+def _filter_chart(chart, start_ms, end_ms):
+    keep = lambda series: [point for point in series if start_ms <= point[0] <= end_ms]
+    return {key: keep(series) for key, series in chart.items()}
+
+class _Handler(BaseHTTPRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body):
+        data = body if isinstance(body, bytes) else json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        server = self.server.mock
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        parts = url.path.strip("/").split("/")
+        if server.latency:
+            time.sleep(server.latency)
+
+        try:
+            endpoint, body = self._route(server, parts, params)
+        except (KeyError, ValueError):
+            endpoint, body = "bad request", None
+        with server.lock:
+            server.requests[endpoint] = server.requests.get(endpoint, 0) + 1
+        if body is None:
+            self._send(400 if endpoint == "bad request" else 404, {"error": endpoint})
+        else:
+            self._send(200, body)
+
+    def _route(self, server, parts, params):
+        if parts[-2:] == ["coins", "list"]:
+            endpoint, body = "coins/list", server.recordings.coins_list
+        elif parts[-2:] == ["coins", "markets"]:
+            endpoint, body = "coins/markets", server.recordings.coins_markets
+            if "ids" in params:
+                ids = set(params["ids"].split(","))
+                body = [row for row in body if row["id"] in ids]
+            else:
+                per_page = int(params.get("per_page", 100))
+                page = int(params.get("page", 1))
+                body = body[(page - 1) * per_page:page * per_page]
+        elif "market_chart" in parts:
+            coin = parts[parts.index("market_chart") - 1]
+            chart = server.recordings.market_chart(coin)
+            if parts[-1] == "range":
+                endpoint = "market_chart/range"
+                body = _filter_chart(chart, int(params["from"]) * 1000, int(params["to"]) * 1000)
+            else:
+                endpoint = "market_chart"
+                days = params.get("days", "10000")
+                if days in ("10000", "max"):
+                    body = chart
+                else:
+                    end_ms = chart["prices"][-1][0] if chart["prices"] else 0
+                    body = _filter_chart(chart, end_ms - float(days) * DAY_MS, end_ms)
+        else:
+            endpoint, body = "unknown endpoint", None
+        return endpoint, body
+
+class MockCoinGeckoServer():
+    ''' Local http server answering the market_chart, market_chart/range, coins/list and coins/markets endpoints
+
+    Attributes
+    ==========
+    recordings: Recordings
+        responses to replay (default is synthetic responses)
+    latency: float
+        seconds every request is delayed by, to mimic the network (default is 0)
+    requests: dict
+        number of requests served per endpoint
+
+    Methods
+    ==========
+    start, stop:
+        runs the server in a background thread. the server can also be used as a context manager
+            ex. with MockCoinGeckoServer() as server:
+                    client = make_client(server.url)
+    '''
+
+    def __init__(self, recordings=None, latency=0.0, host="127.0.0.1", port=0):
+        self.recordings = recordings or Recordings()
+        self.latency = latency
+        self.requests = {}
+        self.lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.mock = self
+        self._thread = None
+
+    def __repr__(self):
+        return "MockCoinGeckoServer(url = {})".format(self.url)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return "http://{}:{}/".format(host, port)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
@@ -0,0 +1,30 @@
+# MARKET CHART PARSING
+# turns raw market chart responses into numpy columns. needs numpy only, so CoinGeckoAPI and the pandas-free lite.py
+# parse the same way
+import itertools
+import numpy as np
+
+def pairs_to_array(pairs):
+    ''' converts a list of [timestamp, value] pairs into an (n, 2) float array
+    '''
+    try:
+        # flattening into fromiter avoids numpy inspecting every inner list
+        return np.fromiter(itertools.chain.from_iterable(pairs), dtype="float64", count=2 * len(pairs)).reshape(-1, 2)
+    except (TypeError, ValueError):
+        # missing values come through as None, which asarray turns into nan
+        return np.asarray(pairs, dtype="float64").reshape(-1, 2)
+
+def chart_columns(data):
+    ''' returns the columns of a raw market chart response as a dict of numpy arrays: date (int64 ms since the epoch, UTC),
+    price, log_returns, market_cap and total_volume
+    '''
+    prices = pairs_to_array(data["prices"])
+    log_returns = np.full(len(prices), np.nan)
+    log_returns[1:] = np.log(prices[1:, 1] / prices[:-1, 1])
+    return {
+        "date": prices[:, 0].astype("int64"),
+        "price": prices[:, 1],
+        "log_returns": log_returns,
+        "market_cap": pairs_to_array(data["market_caps"])[:, 1],
+        "total_volume": pairs_to_array(data["total_volumes"])[:, 1]
+    }
@@ -0,0 +1,348 @@
+# BACKGROUND REFRESHER
+# keeps the market charts of a watchlist (or the top coins) current in a background thread, so readers never wait on the API
+import heapq, threading, time
+from types import MappingProxyType
+import pandas as pd
+
+import CoinGeckoAPI as api
+
+class Clock():
+    ''' Time source of a Refresher: monotonic seconds, and waits that end early when an event is set
+    '''
+
+    def time(self):
+        return time.monotonic()
+
+    def wait(self, event, seconds):
+        ''' waits up to seconds for event, returns whether it is set
+        '''
+        return event.wait(max(seconds, 0))
+
+class FakeClock(Clock):
+    ''' Clock that only moves when advanced, for testing a Refresher without waiting for real time to pass
+        ex. clock = FakeClock()
+            refresher = Refresher(["bitcoin"], client=stub, clock=clock)
+            refresher.run_pending()
+            clock.advance(300)
+
+    Attributes
+    ==========
+    now: float
+        current time in seconds (default is 0)
+    '''
+
+    def __init__(self, now=0.0):
+        self.now = now
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "FakeClock(now = {})".format(self.now)
+
+    def time(self):
+        return self.now
+
+    def advance(self, seconds):
+        with self._lock:
+            self.now += seconds
+
+    def wait(self, event, seconds):
+        # blocks until another thread advances the clock past the deadline (or the event is set)
+        deadline = self.now + seconds
+        while self.now < deadline and not event.is_set():
+            event.wait(0.001)
+        return event.is_set()
+
+class ChartSnapshot():
+    ''' Immutable set of market charts published by a Refresher
+
+    a snapshot never changes once published, so readers can hold on to one for as long as they like without locks.
+    the dataframes are shared with later snapshots and must be treated as read only
+
+    Attributes
+    ==========
+    version: int
+        number of snapshots published before this one
+    updated: pandas Timestamp
+        time the snapshot was published
+    data: mapping
+        {coin: dataframe} of the coins loaded so far, shaped like CoinGeckoAPI.data
+    refreshed: mapping
+        {coin: time its data was last refreshed}
+    errors: mapping
+        {coin: exception} of the coins whose last refresh failed. their previous data is kept in data
+    '''
+
+    __slots__ = ("version", "updated", "data", "refreshed", "errors")
+
+    def __init__(self, version=0, updated=None, data=None, refreshed=None, errors=None):
+        self.version = version
+        self.updated = updated
+        self.data = MappingProxyType(dict(data or {}))
+        self.refreshed = MappingProxyType(dict(refreshed or {}))
+        self.errors = MappingProxyType(dict(errors or {}))
+
+    def __repr__(self):
+        return "ChartSnapshot(version = {}, coins = {}, errors = {})".format(self.version, len(self.data), len(self.errors))
+
+    def __len__(self):
+        return len(self.data)
+
+    def __contains__(self, coin):
+        return coin in self.data
+
+    def __getitem__(self, coin):
+        return self.data[coin]
+
+    def get(self, coin, default=None):
+        return self.data.get(coin, default)
+
+    def latest(self):
+        ''' returns the last row of every coin's data as a pandas dataframe indexed by coin, with the date of that row
+        '''
+        coins = [coin for coin, data in self.data.items() if len(data)]
+        latest = pd.DataFrame([self.data[coin].iloc[-1] for coin in coins], index=pd.Index(coins, name="coin"))
+        latest.insert(0, "date", [self.data[coin].index[-1] for coin in coins])
+        return latest
+
+class Refresher():
+    ''' Keeps the market charts of a set of coins fresh from a background thread and publishes them as snapshots
+
+    every coin's tail is fetched again every interval seconds, through the rate limited client at BULK priority so
+    interactive calls are served first. the refreshes are spread over the interval (new coins are first loaded one
+    after the other over one interval, call refresh to load one at once) and the interval is stretched if the coins
+    could not all be refreshed within the budget share of the rate limit. readers take snapshot, which
+    is replaced (never modified) after every refresh
+        ex. with Refresher(["bitcoin", "ethereum"], interval=300) as refresher:
+                refresher.snapshot["bitcoin"].price.iloc[-1]
+
+    Attributes
+    ==========
+    coins: list or function
+        coin ids to keep fresh, or a function returning them, called every watchlist_interval seconds
+        (default is None, which follows the top_n coins by market cap, fetched with client like the charts)
+    vs_currency: str
+        currency the data is quoted in (default is set to usd)
+    interval: float
+        seconds between two refreshes of a coin (default is 300)
+    budget: float
+        share of the rate limiter's calls per minute the refreshes may use (default is 0.5)
+    top_n: int
+        number of top coins followed when coins is None (default is 100)
+    watchlist_interval: float
+        seconds between two updates of the set of coins when coins is None or a function (default is 3600)
+    cache: MarketChartCache
+        cache the charts are loaded from and saved to, shared with CoinGeckoAPI (default is the shared
+        market_chart_cache). pass None to keep the histories in memory only
+    client: ThrottledClient
+        client the charts are fetched with (default is cg, looked up on every refresh)
+    clock: Clock
+        time source (default is the real clock). pass a FakeClock to step through time in tests
+
+    Methods
+    ==========
+    start, stop:
+        runs the refresher in a daemon thread. stop lets the refresh in progress finish, then returns. the
+        refresher can also be used as a context manager
+
+    run_pending:
+        refreshes every coin that is due and returns the number refreshed, without starting a thread
+            ex. refresher.run_pending()
+
+    watch, unwatch:
+        adds coins to (or removes them from) a watchlist while running
+            ex. refresher.watch(["solana"])
+    '''
+
+    def __init__(self, coins=None, vs_currency="usd", interval=300.0, budget=0.5, top_n=100, watchlist_interval=3600.0,
+                 cache=api.market_chart_cache, client=None, clock=None):
+        self.coins = coins
+        self.vs_currency = vs_currency
+        self.interval = interval
+        self.budget = budget
+        self.top_n = top_n
+        self.watchlist_interval = watchlist_interval
+        self.cache = cache
+        self.client = client
+        self.clock = clock or Clock()
+        self.snapshot = ChartSnapshot()
+
+        self._due = []
+        self._scheduled = {}
+        self._watchlist_due = None
+        self._lock = threading.RLock()
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread = None
+
+    def __repr__(self):
+        return "Refresher(coins = {}, interval = {})".format(len(self._scheduled), self.interval)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _client(self):
+        client = self.client or api.cg
+        if isinstance(client, api.ThrottledClient):
+            client = client.with_priority(api.RateLimiter.BULK)
+        return client
+
+    @property
+    def effective_interval(self):
+        ''' seconds between two refreshes of a coin, stretched so one round of refreshes stays within the budget
+        '''
+        limiter = getattr(self.client or api.cg, "limiter", None)
+        if limiter is None or not self._scheduled:
+            return self.interval
+        return max(self.interval, len(self._scheduled) * 60 / (limiter.calls_per_minute * self.budget))
+
+    def _watchlist(self):
+        if self.coins is None:
+            # through the refresher's own client, so the watchlist update is bulk work like the refreshes
+            return list(api.top_coins(self.top_n, client=self._client()).id)
+        if callable(self.coins):
+            return list(self.coins())
+        return list(self.coins)
+
+    def _update_watchlist(self, now):
+        if self._watchlist_due is not None and (now < self._watchlist_due or not (self.coins is None or callable(self.coins))):
+            return
+        self._watchlist_due = now + self.watchlist_interval
+        try:
+            coins = self._watchlist()
+        except Exception:
+            # keep following the current coins until the next update
+            return
+        with self._lock:
+            keep = set(coins)
+            self.unwatch([coin for coin in self._scheduled if coin not in keep])
+            self.watch(coins)
+
+    def watch(self, coins):
+        ''' adds coins to the refreshed set. the new coins are first loaded spread over one interval, the first one on
+        the next pass, so their refreshes stay spread out rather than coming due all at once
+        '''
+        with self._lock:
+            now = self.clock.time()
+            new = [coin for coin in dict.fromkeys(coins) if coin not in self._scheduled]
+            for coin in new:
+                self._scheduled[coin] = now
+            # the interval is stretched for the coins just added
+            interval = self.effective_interval
+            for i, coin in enumerate(new):
+                self._scheduled[coin] = now + i * interval / len(new)
+                heapq.heappush(self._due, (self._scheduled[coin], coin))
+        self._wake.set()
+
+    def unwatch(self, coins):
+        ''' stops refreshing coins and drops them from the next snapshot
+        '''
+        with self._lock:
+            coins = [coin for coin in coins if coin in self._scheduled]
+            for coin in coins:
+                # the heap entry is skipped once it comes up
+                del self._scheduled[coin]
+            if coins:
+                snapshot = self.snapshot
+                self._publish({c: d for c, d in snapshot.data.items() if c not in coins},
+                              {c: t for c, t in snapshot.refreshed.items() if c not in coins},
+                              {c: e for c, e in snapshot.errors.items() if c not in coins})
+
+    def _publish(self, data, refreshed, errors):
+        # readers only ever see a complete snapshot: the new one is built aside and swapped in with one assignment
+        self.snapshot = ChartSnapshot(self.snapshot.version + 1, api.utc_timestamp(), data, refreshed, errors)
+
+    def _next_due(self):
+        with self._lock:
+            while self._due and self._scheduled.get(self._due[0][1]) != self._due[0][0]:
+                heapq.heappop(self._due)
+            return self._due[0] if self._due else None
+
+    def refresh(self, coin):
+        ''' fetches the missing tail of a watched coin now and publishes a snapshot with it
+        '''
+        start = api.metrics.clock()
+        previous = self.snapshot.get(coin)
+        error = None
+        try:
+            if self.cache:
+                # a coin another process sharing the cache refreshed less than half an interval ago is not fetched again
+                data = api.load_market_chart(coin, vs_currency=self.vs_currency, cache=self.cache, client=self._client(),
+                                             max_age=self.effective_interval / 2)
+            else:
+                data = api.update_market_chart(coin, previous, vs_currency=self.vs_currency, client=self._client())
+        except Exception as e:
+            data, error = previous, e
+
+        with self._lock:
+            if coin not in self._scheduled:
+                return
+            snapshot = self.snapshot
+            data_map, refreshed, errors = dict(snapshot.data), dict(snapshot.refreshed), dict(snapshot.errors)
+            if error is None:
+                data_map[coin] = data
+                refreshed[coin] = api.utc_timestamp()
+                errors.pop(coin, None)
+            else:
+                errors[coin] = error
+            self._publish(data_map, refreshed, errors)
+        if start and error is None:
+            api.metrics.record("stage", "refresh", start, rows=len(data))
+
+    def run_pending(self):
+        ''' refreshes every coin whose refresh is due, returns how many were refreshed
+        '''
+        self._update_watchlist(self.clock.time())
+        count = 0
+        while not self._stopping:
+            now = self.clock.time()
+            with self._lock:
+                due = self._next_due()
+                if due is None or due[0] > now:
+                    break
+                coin = due[1]
+                # reschedule before refreshing, so a coin removed meanwhile is not put back
+                heapq.heappop(self._due)
+                self._scheduled[coin] = now + self.effective_interval
+                heapq.heappush(self._due, (self._scheduled[coin], coin))
+            self.refresh(coin)
+            count += 1
+        return count
+
+    def _run(self):
+        while not self._stopping:
+            self.run_pending()
+            due = self._next_due()
+            now = self.clock.time()
+            wait = self.watchlist_interval if due is None else due[0] - now
+            if self._watchlist_due is not None and (self.coins is None or callable(self.coins)):
+                wait = min(wait, self._watchlist_due - now)
+            self.clock.wait(self._wake, wait)
+            self._wake.clear()
+
+    def start(self):
+        ''' starts refreshing in a daemon thread
+        '''
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="coingecko-refresher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        ''' stops the thread once the refresh in progress is done, returns whether it stopped within timeout
+        '''
+        self._stopping = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                return False
+            self._thread = None
+        return True
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
@@ -0,0 +1,188 @@
+# COMPACT STORE
+# keeps many coins' daily histories on one shared date axis, downcast and optionally memory mapped from disk
+import json, os, threading
+from collections import OrderedDict
+import numpy as np, pandas as pd
+
+from CoinGeckoAPI import validate_index
+
+EPOCH = pd.Timestamp(0, tz="UTC")
+DAY = pd.Timedelta(days=1)
+
+class CompactStore():
+    ''' Compact store of daily market charts for many coins
+
+    every coin is kept as one array per column on a shared daily date axis, so a coin costs its values and nothing
+    else: no per-coin index, no float64 unless asked for, and log returns are recomputed from the price on read.
+    points are snapped to their day (the last, intraday point of a CoinGecko chart becomes that day's row) and
+    missing days are stored as nan
+
+    Attributes
+    ==========
+    path: str
+        directory the per-coin column files are written to. coins are memory mapped from there on demand, so only
+        the pages that are read take up memory. pass None to keep every array in memory instead (default is None)
+    dtype: str
+        dtype the columns are stored as (default is float32)
+    max_open: int
+        number of memory mapped coins kept open before the least recently used one is closed (default is 256)
+
+    Methods
+    ==========
+    add:
+        stores a coin's dataframe (e.g. CoinGeckoAPI(coin).data), replacing what was stored for it
+            ex. store.add("bitcoin", CoinGeckoAPI("bitcoin").data)
+
+    get:
+        returns a coin's data as a pandas dataframe shaped like CoinGeckoAPI.data, built on the stored arrays
+            ex. store.get("bitcoin")
+
+    drop:
+        removes a coin from the store
+    '''
+
+    columns = ["price", "market_cap", "total_volume"]
+
+    def __init__(self, path=None, dtype="float32", max_open=256):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.max_open = max_open
+        self._meta = {}
+        self._arrays = OrderedDict()
+        self._axis = pd.DatetimeIndex([], tz="UTC", name="date")
+        self._axis_start = 0
+        self._lock = threading.Lock()
+
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+            try:
+                with open(os.path.join(path, "index.json")) as f:
+                    saved = json.load(f)
+                self.dtype = np.dtype(saved["dtype"])
+                self._meta = saved["coins"]
+            except (OSError, ValueError, KeyError):
+                pass
+            self._rebuild_axis()
+
+    def __repr__(self):
+        return "CompactStore(path = {}, dtype = {}, coins = {})".format(self.path, self.dtype, len(self._meta))
+
+    def __len__(self):
+        return len(self._meta)
+
+    def __contains__(self, coin):
+        return coin in self._meta
+
+    @property
+    def coins(self):
+        return list(self._meta)
+
+    @property
+    def dates(self):
+        ''' the shared date axis, covering every stored coin
+        '''
+        return self._axis
+
+    def _rebuild_axis(self):
+        if not self._meta:
+            return
+        start = min(m["start"] for m in self._meta.values())
+        end = max(m["start"] + m["length"] for m in self._meta.values())
+        if len(self._axis) and self._axis_start <= start and self._axis_start + len(self._axis) >= end:
+            return
+        self._axis_start = start
+        self._axis = pd.date_range(EPOCH + start * DAY, periods=end - start, freq="D", name="date")
+
+    def _save_meta(self):
+        if self.path is None:
+            return
+        tmp_path = os.path.join(self.path, "index.json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({"dtype": self.dtype.name, "coins": self._meta}, f)
+        os.replace(tmp_path, os.path.join(self.path, "index.json"))
+
+    def _coin_dir(self, coin):
+        return os.path.join(self.path, coin)
+
+    def add(self, coin, data):
+        ''' stores data for coin on the shared daily axis, replacing anything stored for it before
+        '''
+        data = validate_index(data)
+        days = np.asarray((data.index - EPOCH) // DAY, dtype="int64")
+
+        # keep the last point of each day
+        last = np.r_[days[1:] != days[:-1], True] if len(days) else np.array([], dtype=bool)
+        days = days[last]
+        start = int(days[0]) if len(days) else 0
+        length = int(days[-1] - start + 1) if len(days) else 0
+
+        arrays = {}
+        for column in self.columns:
+            values = np.full(length, np.nan, dtype=self.dtype)
+            values[days - start] = data[column].to_numpy()[last]
+            arrays[column] = values
+
+        with self._lock:
+            if self.path is not None:
+                os.makedirs(self._coin_dir(coin), exist_ok=True)
+                for column, values in arrays.items():
+                    np.save(os.path.join(self._coin_dir(coin), column + ".npy"), values)
+                # reopen lazily as memory maps
+                self._arrays.pop(coin, None)
+            else:
+                self._arrays[coin] = arrays
+            self._meta[coin] = {"start": start, "length": length}
+            self._rebuild_axis()
+            self._save_meta()
+
+    def _open(self, coin):
+        arrays = self._arrays.get(coin)
+        if arrays is not None:
+            self._arrays.move_to_end(coin)
+            return arrays
+
+        arrays = {column: np.load(os.path.join(self._coin_dir(coin), column + ".npy"), mmap_mode="r") for column in self.columns}
+        self._arrays[coin] = arrays
+        while len(self._arrays) > self.max_open:
+            self._arrays.popitem(last=False)
+        return arrays
+
+    def get(self, coin):
+        ''' returns the data of coin as a dataframe with price, log returns, market cap and total volume columns
+
+        the columns are the stored (or memory mapped) arrays, not copies, apart from the recomputed log returns
+        '''
+        with self._lock:
+            if coin not in self._meta:
+                raise KeyError(coin)
+            meta = self._meta[coin]
+            arrays = self._open(coin)
+
+        offset = meta["start"] - self._axis_start
+        index = self._axis[offset:offset + meta["length"]]
+        price = arrays["price"]
+
+        log_returns = np.full(len(price), np.nan, dtype=self.dtype)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            log_returns[1:] = np.log(price[1:] / price[:-1])
+
+        return pd.DataFrame({
+            "price": price,
+            "log_returns": log_returns,
+            "market_cap": arrays["market_cap"],
+            "total_volume": arrays["total_volume"]
+        }, index=index, copy=False)
+
+    def drop(self, coin):
+        ''' removes coin from the store
+        '''
+        with self._lock:
+            self._meta.pop(coin, None)
+            self._arrays.pop(coin, None)
+            if self.path is not None:
+                for column in self.columns:
+                    try:
+                        os.remove(os.path.join(self._coin_dir(coin), column + ".npy"))
+                    except OSError:
+                        pass
+            self._save_meta()
@@ -0,0 +1,46 @@
+import os, sys
+
+import pytest
+
+# the modules live at the root of the repository, next to this directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import CoinGeckoAPI as api
+from mock_server import MockCoinGeckoServer, Recordings
+
+class FailingRecordings(Recordings):
+    ''' Synthetic responses, except that the market charts of the coins in fail are answered with a 400
+    '''
+
+    def __init__(self, fail=()):
+        super().__init__()
+        self.fail = set(fail)
+
+    def market_chart(self, coin):
+        if coin in self.fail:
+            raise KeyError(coin)
+        return super().market_chart(coin)
+
+@pytest.fixture
+def server():
+    with MockCoinGeckoServer(FailingRecordings(fail=["broken-coin"])) as server:
+        yield server
+
+@pytest.fixture
+def limiter():
+    # fast enough that the tests never wait for a token
+    return api.RateLimiter(calls_per_minute=60000, burst=1000, max_retries=0)
+
+@pytest.fixture
+def client(server, limiter):
+    return api.make_client(server.url, limiter=limiter)
+
+@pytest.fixture
+def cache(tmp_path):
+    return api.MarketChartCache(cache_dir=str(tmp_path / "charts"))
+
+@pytest.fixture(autouse=True)
+def empty_response_cache():
+    api.response_cache.invalidate()
+    yield
+    api.response_cache.invalidate()
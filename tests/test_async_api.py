@@ -0,0 +1,102 @@
+import asyncio, threading
+
+import pytest
+
+pytest.importorskip("httpx")
+
+import CoinGeckoAPI as api
+from async_api import AsyncClient, AsyncCoinGeckoAPI, endpoint_name, get_mkt_data_many
+
+def run(server, limiter, coroutine):
+    async def main():
+        async with AsyncClient(server.url, limiter=limiter, http2=False) as client:
+            return await coroutine(client)
+    return asyncio.run(main())
+
+def test_endpoint_name():
+    assert endpoint_name("coins/bitcoin/market_chart") == "get_coin_market_chart_by_id"
+    assert endpoint_name("/coins/list") == "get_coins_list"
+
+def test_get_data_matches_the_sync_api(server, limiter, client, cache):
+    data = run(server, limiter, lambda client: AsyncCoinGeckoAPI("ethereum", cache=cache, client=client).get_data())
+    expected = api.load_market_chart("ethereum", cache=None, client=client)
+    assert data.equals(expected)
+
+def test_concurrent_get_data_fetches_a_coin_once(server, limiter, cache):
+    async def gather(client):
+        return await asyncio.gather(*[AsyncCoinGeckoAPI("bitcoin", cache=cache, client=client).get_data() for _ in range(5)])
+    frames = run(server, limiter, gather)
+    assert len({len(frame) for frame in frames}) == 1
+    assert server.requests == {"market_chart": 1}
+
+def test_get_data_shares_the_cache_with_the_sync_api(server, limiter, client, cache):
+    api.load_market_chart("bitcoin", cache=cache, client=client)
+    data = run(server, limiter, lambda client: AsyncCoinGeckoAPI("bitcoin", cache=cache, client=client).get_data())
+    assert len(data)
+    assert server.requests == {"market_chart": 1}
+
+def test_get_top_100_and_get_coin_id(server, limiter):
+    async def calls(client):
+        top = await asyncio.gather(*[AsyncCoinGeckoAPI(client=client).get_top_100(10) for _ in range(3)])
+        return top, await AsyncCoinGeckoAPI(client=client).get_coin_id()
+    top, coin_id = run(server, limiter, calls)
+    assert list(top[0].id[:2]) == ["bitcoin", "ethereum"]
+    assert len(top[0]) == 10
+    assert coin_id.loc["btc", "id"] == "bitcoin"
+    assert server.requests["coins/list"] == 1
+
+def test_errors_are_raised(server, limiter, cache):
+    with pytest.raises(ValueError):
+        run(server, limiter, lambda client: AsyncCoinGeckoAPI("broken-coin", cache=cache, client=client).get_data())
+    assert limiter.counters["failed"] == 1
+
+def test_sync_and_async_calls_share_the_limiter(server, limiter, client):
+    client.get_coins_list()
+    run(server, limiter, lambda client: client.get("coins/list"))
+    assert limiter.counters["calls"] == 2
+
+
+def test_limiter_counts_are_not_lost_between_threads():
+    limiter = api.RateLimiter()
+    threads = [threading.Thread(target=lambda: [limiter.count("retried") for _ in range(1000)]) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert limiter.counters["retried"] == 8000
+
+@pytest.fixture
+def snapshots():
+    api.market_snapshots.clear()
+    yield
+    api.market_snapshots.clear()
+
+def test_get_mkt_data_reuses_the_market_snapshot(server, limiter, snapshots):
+    async def calls(client):
+        many = await get_mkt_data_many(["bitcoin", "ethereum"], client=client)
+        one = await asyncio.gather(*[AsyncCoinGeckoAPI(coin, client=client).get_mkt_data() for coin in ["bitcoin", "ethereum"] * 3])
+        return many, one
+    many, one = run(server, limiter, calls)
+    assert list(many.id) == ["bitcoin", "ethereum"]
+    assert list(one[1].id) == ["ethereum"]
+    assert server.requests == {"coins/markets": 1}
+    # the sync api reads the same snapshot
+    assert list(api.get_mkt_data_many(["ethereum"]).id) == ["ethereum"]
+    assert server.requests == {"coins/markets": 1}
+
+def test_a_response_cache_miss_is_counted_once(server, limiter):
+    misses = api.response_cache.misses
+    run(server, limiter, lambda client: AsyncCoinGeckoAPI(client=client).get_coin_id())
+    assert api.response_cache.misses == misses + 1
+
+@pytest.mark.parametrize("kind", ["file", "sqlite"])
+def test_concurrent_get_data_through_a_backend(server, limiter, tmp_path, kind):
+    backend = api.FileCache(str(tmp_path / "files")) if kind == "file" else api.SQLiteCache(str(tmp_path / "cache.sqlite"))
+    cache = api.MarketChartCache(backend=backend)
+    async def gather(client):
+        return await asyncio.gather(*[AsyncCoinGeckoAPI(coin, cache=cache, client=client).get_data() for coin in ["bitcoin", "ethereum"] * 4])
+    frames = run(server, limiter, gather)
+    assert frames[0].equals(frames[2])
+    assert server.requests == {"market_chart": 2}
+    # the locks were released
+    assert backend.get_or_fetch(("usd", "bitcoin"), 0, lambda stale: stale)[1]
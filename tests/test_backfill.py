@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+
+import CoinGeckoAPI as api
+
+class EmptyRangeClient():
+    ''' Range endpoint that has no data for any day
+    '''
+
+    def __init__(self):
+        self.calls = 0
+
+    def get_coin_market_chart_range_by_id(self, **params):
+        self.calls += 1
+        return {"prices": [], "market_caps": [], "total_volumes": []}
+
+def chart_with_gap():
+    # 2024-01-21 to 2024-01-30 are missing
+    days = pd.date_range("2024-01-01", periods=60, freq="D", tz="UTC").as_unit("ms").asi8
+    pairs = [[int(days[i]), 100.0 + i] for i in np.r_[0:20, 30:60]]
+    return api.parse_market_chart({"prices": pairs, "market_caps": pairs, "total_volumes": pairs})
+
+def test_check_and_plan():
+    data = chart_with_gap()
+    found = api.check_market_chart(data)
+    assert (len(found.gaps), found.missing_days) == (1, 10)
+    assert api.plan_backfill(data) == [(pd.Timestamp("2024-01-21", tz="UTC"), pd.Timestamp("2024-01-30", tz="UTC"))]
+
+def test_backfill_fills_the_gaps(client):
+    data = chart_with_gap()
+    filled = api.backfill_market_chart("bitcoin", data, client=client)
+    assert len(filled) == 60
+    assert filled.price.notna().all()
+    assert filled.attrs.get("unavailable", []) == []
+
+def test_unavailable_days_are_not_fetched_again(cache):
+    cache.save("bitcoin", "usd", chart_with_gap())
+    client = EmptyRangeClient()
+
+    report = api.repair_cache(cache=cache, client=client)
+    assert list(report.still_missing) == [10]
+    assert client.calls == 1
+    data = cache.load("bitcoin", "usd")[0]
+    assert data.attrs["unavailable"] == [["2024-01-21", "2024-01-30"]]
+    assert api.plan_backfill(data) == []
+
+    assert len(api.repair_cache(cache=cache, client=client)) == 0
+    assert client.calls == 1
+    assert len(api.repair_cache(cache=cache, client=client, recheck=True)) == 1
+    assert client.calls == 2
+
+def test_appending_a_tail_keeps_the_unavailable_days():
+    data = chart_with_gap()
+    data.attrs["unavailable"] = [["2024-01-21", "2024-01-30"]]
+    tail = data.iloc[-2:].copy()
+    tail.attrs = {}
+    assert api.append_market_chart(data, tail).attrs == data.attrs
+
+def test_repair_applies_to_fresh_cached_data(server, client, cache):
+    cache.save("bitcoin", "usd", chart_with_gap())
+    repaired = api.load_market_chart("bitcoin", cache=cache, client=client, repair=True)
+    assert len(repaired) == 60
+    assert repaired.price.notna().all()
+    assert api.check_market_chart(repaired).ok
+    # the plain chart was fresh, only the missing days were fetched
+    assert server.requests == {"market_chart/range": 1}
+
+    api.load_market_chart("bitcoin", cache=cache, client=client, repair=True)
+    assert server.requests == {"market_chart/range": 1}
+
+def test_plain_reads_after_a_repaired_read_get_the_plain_chart(client, cache):
+    data = chart_with_gap()
+    cache.save("bitcoin", "usd", data)
+    api.load_market_chart("bitcoin", cache=cache, client=client, repair=True)
+    plain = api.load_market_chart("bitcoin", cache=cache, client=client)
+    assert plain.equals(data)
+    assert api.check_market_chart(plain).missing_days == 10
+    assert cache.keys() == [("usd", "bitcoin")]
@@ -0,0 +1,75 @@
+import threading, time
+
+import pytest
+
+import CoinGeckoAPI as api
+
+def backends(tmp_path):
+    return {"file": api.FileCache(str(tmp_path / "files")), "sqlite": api.SQLiteCache(str(tmp_path / "cache.sqlite"))}
+
+@pytest.mark.parametrize("kind", ["file", "sqlite"])
+def test_get_or_fetch_coalesces_concurrent_fetches(tmp_path, kind):
+    cache = backends(tmp_path)[kind]
+    calls = []
+
+    def fetch(stale):
+        calls.append(stale)
+        time.sleep(0.2)
+        return {"value": len(calls)}
+
+    results = []
+    def worker():
+        results.append(cache.get_or_fetch(("coins_list",), 60, fetch))
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert [value for value, fetched in results] == [{"value": 1}] * 8
+    assert sum(fetched for value, fetched in results) == 1
+
+@pytest.mark.parametrize("kind", ["file", "sqlite"])
+def test_get_or_fetch_refetches_stale_values(tmp_path, kind):
+    cache = backends(tmp_path)[kind]
+    cache.set(("coins_list",), {"value": 0})
+
+    value, fetched = cache.get_or_fetch(("coins_list",), 60, lambda stale: {"value": 1})
+    assert (value, fetched) == ({"value": 0}, False)
+
+    value, fetched = cache.get_or_fetch(("coins_list",), 0, lambda stale: {"value": stale["value"] + 1})
+    assert (value, fetched) == ({"value": 1}, True)
+    assert cache.get(("coins_list",))[0] == {"value": 1}
+
+def test_load_market_chart_fetches_a_coin_once(server, client, cache):
+    frames = []
+    threads = [threading.Thread(target=lambda: frames.append(api.load_market_chart("bitcoin", cache=cache, client=client)))
+               for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(frames) == 6
+    assert server.requests == {"market_chart": 1}
+
+def test_sqlite_lock_is_kept_by_a_fetch_slower_than_lock_timeout(tmp_path):
+    cache = api.SQLiteCache(str(tmp_path / "cache.sqlite"), lock_timeout=0.3, poll_interval=0.01)
+    held = threading.Event()
+    events = []
+
+    def slow_fetch():
+        with cache.lock(("coins_list",)):
+            held.set()
+            time.sleep(1.0)
+            events.append("released")
+
+    thread = threading.Thread(target=slow_fetch)
+    thread.start()
+    held.wait()
+    with cache.lock(("coins_list",)):
+        events.append("taken")
+    thread.join()
+    assert events == ["released", "taken"]
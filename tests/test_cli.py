@@ -0,0 +1,45 @@
+import pandas as pd
+
+import CoinGeckoAPI as api
+from mock_server import DAY_MS, MockCoinGeckoServer, Recordings
+
+class HourlyRecordings(Recordings):
+    ''' Synthetic responses with hourly market charts over the last ten days
+    '''
+
+    def market_chart(self, coin):
+        end = pd.Timestamp.now(tz="UTC").floor("D").value // 10**6
+        timestamps = range(end - 10 * DAY_MS, end, DAY_MS // 24)
+        points = [[t, 100.0 + i] for i, t in enumerate(timestamps)]
+        return {"prices": points, "market_caps": points, "total_volumes": points}
+
+def read(path):
+    return pd.read_csv(path, index_col=["coin", "date"], parse_dates=["date"])  # dates read back without a timezone
+
+def test_parse_end():
+    assert api.parse_end(None) is None
+    assert api.parse_end("2024-03-01") == pd.Timestamp("2024-03-01 23:59:59.999", tz="UTC")
+    assert api.parse_end("2024-03-01 12:00") == pd.Timestamp("2024-03-01 12:00", tz="UTC")
+
+def test_a_date_only_to_includes_that_whole_day(tmp_path):
+    day = pd.Timestamp.now(tz="UTC").floor("D").tz_localize(None) - pd.Timedelta(days=3)
+    output = tmp_path / "hourly.csv"
+    with MockCoinGeckoServer(HourlyRecordings()) as server:
+        status = api.main(["fetch", "--coins", "bitcoin", "--from", str((day - pd.Timedelta(days=2)).date()),
+                           "--to", str(day.date()), "--granularity", "hourly", "--api-url", server.url, "--no-cache",
+                           "--export", "csv", "--output", str(output), "--quiet"])
+    assert status == 0
+    dates = read(output).loc["bitcoin"].index
+    assert dates.max() == day + pd.Timedelta(hours=23)
+    assert (dates < day + pd.Timedelta(days=1)).all()
+
+def test_api_url_does_not_replace_the_shared_client(server, tmp_path):
+    cg = api.cg
+    batch = tmp_path / "jobs.txt"
+    batch.write_text("--coins bitcoin --api-url {} --no-cache --export csv --output {} --quiet\n"
+                     "--top 3 --api-url {} --no-cache --export csv --output {} --quiet\n".format(
+                         server.url, tmp_path / "btc.csv", server.url, tmp_path / "top.csv"))
+    assert api.main(["batch", str(batch)]) == 0
+    assert api.cg is cg
+    assert list(read(tmp_path / "top.csv").index.get_level_values("coin").unique()) == ["bitcoin", "ethereum", "coin-0"]
+    assert server.requests["market_chart"] == 4
@@ -0,0 +1,60 @@
+import os
+
+import pandas as pd
+import pytest
+
+import CoinGeckoAPI as api
+from mock_server import synthetic_market_chart
+
+def chart(step_ms, points, start_ms=1704067200000):
+    pairs = [[start_ms + i * step_ms, 100.0 + i] for i in range(points)]
+    return api.parse_market_chart({"prices": pairs, "market_caps": pairs, "total_volumes": pairs})
+
+def read(path):
+    fmt = os.path.splitext(path)[1]
+    return {".csv": pd.read_csv, ".parquet": pd.read_parquet, ".feather": pd.read_feather, ".xlsx": pd.read_excel}[fmt](path)
+
+def test_daily_data_is_exported_as_dates():
+    data = api.parse_market_chart(synthetic_market_chart("bitcoin", 30))
+    dates = api.export_data(data).date
+    assert dates.str.len().eq(10).all()
+
+def test_intraday_data_keeps_its_time():
+    assert list(api.export_data(chart(3600 * 1000, 3)).date) == ["2024-01-01T00:00:00", "2024-01-01T01:00:00", "2024-01-01T02:00:00"]
+    assert api.export_data(chart(300 * 1000, 2, 1704067200123)).date[0] == "2024-01-01T00:00:00.123"
+
+def test_every_chunk_uses_the_same_unit(tmp_path):
+    path = str(tmp_path / "hourly.csv")
+    api.export_frames(chart(3600 * 1000, 48), path, chunk_size=24)
+    assert read(path).date[24] == "2024-01-02T00:00:00"
+
+@pytest.mark.parametrize("fmt", ["csv", "parquet", "feather", "xlsx"])
+def test_empty_exports_have_the_export_columns(tmp_path, fmt):
+    pytest.importorskip("openpyxl" if fmt == "xlsx" else "pyarrow")
+    path = str(tmp_path / ("empty." + fmt))
+    api.export_frames(iter([]), path)
+    exported = read(path)
+    assert len(exported) == 0
+    assert list(exported.columns) == ["date", "price", "log returns", "market cap", "total volume"]
+
+def test_failed_exports_leave_no_temporary_file(tmp_path):
+    pytest.importorskip("pyarrow")
+    path = str(tmp_path / "coins.parquet")
+    data = chart(86400 * 1000, 10)
+    api.export_frames(data, path)
+
+    def frames():
+        yield data
+        raise RuntimeError("fetch failed")
+
+    with pytest.raises(RuntimeError):
+        api.export_frames(frames(), path)
+    assert os.listdir(str(tmp_path)) == ["coins.parquet"]
+    assert len(read(path)) == 10
+
+def test_append_to_an_empty_export(tmp_path):
+    pytest.importorskip("pyarrow")
+    path = str(tmp_path / "coins.parquet")
+    api.export_frames(iter([]), path)
+    api.export_frames(chart(86400 * 1000, 10), path, append=True)
+    assert len(read(path)) == 10
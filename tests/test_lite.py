@@ -0,0 +1,50 @@
+import os, subprocess, sys
+
+import pytest
+
+import CoinGeckoAPI as api
+import lite
+from lite import LiteCoinGeckoAPI, to_frame
+
+@pytest.fixture
+def lite_cache():
+    lite.lite_cache.invalidate()
+    api.market_snapshots.clear()
+    yield
+    lite.lite_cache.invalidate()
+    api.market_snapshots.clear()
+
+@pytest.fixture
+def shared_client(client, monkeypatch):
+    # CoinGeckoAPI's methods call the module's cg
+    monkeypatch.setattr(api, "cg", client)
+    return client
+
+def test_chart_to_frame_matches_the_pandas_api(client, lite_cache):
+    chart = LiteCoinGeckoAPI("bitcoin", client=client).get_data()
+    assert to_frame(chart).equals(api.load_market_chart("bitcoin", cache=None, client=client))
+
+def test_top_coins_to_frame_matches_the_pandas_api(client, lite_cache):
+    top = LiteCoinGeckoAPI(client=client).get_top_100(10)
+    assert isinstance(top, lite.TopCoins) and isinstance(top[0], lite.MarketData)
+    assert to_frame(top).equals(api.top_coins(10, client=client))
+
+def test_coin_list_to_frame_matches_the_pandas_api(shared_client, lite_cache):
+    coins = LiteCoinGeckoAPI(client=shared_client).get_coin_id()
+    assert to_frame(coins).equals(api.CoinGeckoAPI().get_coin_id())
+
+def test_market_data_to_frame_matches_the_pandas_api(shared_client, lite_cache):
+    records = lite.get_mkt_data_many(["bitcoin", "ethereum"], client=shared_client)
+    frame, expected = to_frame(records), api.get_mkt_data_many(["bitcoin", "ethereum"])
+    columns = [column for column in expected.columns if column in frame.columns]
+    assert "current_price" in columns
+    assert frame[columns].equals(expected[columns])
+
+def test_lite_parses_charts_without_pandas():
+    code = ("import sys, lite; "
+            "chart = lite.parse_market_chart({'prices': [[0, 1.0], [86400000, 2.0]], 'market_caps': [[0, 1.0], [86400000, 2.0]], "
+            "'total_volumes': [[0, 1.0], [86400000, 2.0]]}); "
+            "assert 'pandas' not in sys.modules; print(chart['log_returns'][1])")
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(api.__file__)).stdout
+    assert float(output) == pytest.approx(0.6931, abs=1e-4)
@@ -0,0 +1,22 @@
+import CoinGeckoAPI as api
+
+def test_load_many(client, cache):
+    data, errors = api.load_many(["bitcoin", "ethereum"], cache=cache, client=client)
+    assert errors == {}
+    assert list(data.index.names) == ["coin", "date"]
+    assert sorted(data.index.get_level_values("coin").unique()) == ["bitcoin", "ethereum"]
+    assert len(data.loc["bitcoin"]) == len(api.load_market_chart("bitcoin", cache=cache, client=client))
+
+def test_load_many_keeps_going_after_a_coin_fails(server, client, cache):
+    data, errors = api.load_many(["bitcoin", "broken-coin", "ethereum"], max_workers=2, cache=cache, client=client)
+    assert list(errors) == ["broken-coin"]
+    assert isinstance(errors["broken-coin"], Exception)
+    assert sorted(data.index.get_level_values("coin").unique()) == ["bitcoin", "ethereum"]
+    # the failed coin is not cached, the others are
+    assert cache.load("broken-coin", "usd")[0] is None
+    assert cache.load("bitcoin", "usd")[0] is not None
+
+def test_load_many_when_every_coin_fails(client, cache):
+    data, errors = api.load_many(["broken-coin"], cache=cache, client=client)
+    assert list(errors) == ["broken-coin"]
+    assert len(data) == 0
@@ -0,0 +1,40 @@
+import pandas as pd
+import pytest
+
+import CoinGeckoAPI as api
+
+class RecordingClient():
+    ''' Range endpoint answering with one point per hour of every requested window
+    '''
+
+    def __init__(self):
+        self.windows = []
+
+    def get_coin_market_chart_range_by_id(self, id, vs_currency, from_timestamp, to_timestamp, **params):
+        self.windows.append((pd.Timestamp(from_timestamp, unit="s", tz="UTC"), pd.Timestamp(to_timestamp, unit="s", tz="UTC")))
+        hours = range(-(-from_timestamp // 3600) * 3600, to_timestamp + 1, 3600)
+        pairs = [[hour * 1000, 1.0] for hour in hours]
+        return {"prices": pairs, "market_caps": pairs, "total_volumes": pairs}
+
+@pytest.mark.parametrize("days", [0.5, 1, 30, 90, 90.5, 100, 181])
+def test_hourly_windows_stay_hourly(days):
+    client = RecordingClient()
+    end = pd.Timestamp("2026-01-01", tz="UTC")
+    start = end - pd.Timedelta(days=days)
+    data = api.load_market_chart_range("bitcoin", start, end, granularity="hourly", client=client)
+    for window_start, window_end in client.windows:
+        assert pd.Timedelta(days=1) < window_end - window_start <= pd.Timedelta(days=90)
+    assert client.windows[-1][1] == end
+    assert data.index[0] >= start and data.index[-1] == end
+    assert not data.index.duplicated().any()
+    assert data.index.to_series().diff().dropna().eq(pd.Timedelta(hours=1)).all()
+
+def test_5m_older_than_a_day_is_refused():
+    with pytest.raises(ValueError):
+        api.load_market_chart_range("bitcoin", "2024-01-01", granularity="5m", client=RecordingClient())
+
+def test_default_start_is_the_granularity_window():
+    client = RecordingClient()
+    end = pd.Timestamp("2026-01-01", tz="UTC")
+    api.load_market_chart_range("bitcoin", end=end, granularity="hourly", client=client)
+    assert client.windows == [(end - pd.Timedelta(days=90), end)]
@@ -0,0 +1,77 @@
+import pytest
+
+from refresher import ChartSnapshot, FakeClock, Refresher
+
+def make_refresher(client, coins=("bitcoin", "ethereum", "solana", "cardano"), interval=100):
+    return Refresher(list(coins), interval=interval, cache=None, client=client, clock=FakeClock())
+
+def test_run_pending_spreads_the_first_refreshes(client):
+    refresher = make_refresher(client)
+    counts = []
+    for _ in range(4):
+        counts.append(refresher.run_pending())
+        refresher.clock.advance(25)
+    assert counts == [1, 1, 1, 1]
+    assert sorted(refresher.snapshot.data) == ["bitcoin", "cardano", "ethereum", "solana"]
+
+def test_run_pending_refreshes_again_after_the_interval(server, client):
+    refresher = make_refresher(client, coins=["bitcoin"])
+    assert refresher.run_pending() == 1
+    assert refresher.run_pending() == 0
+    refresher.clock.advance(99)
+    assert refresher.run_pending() == 0
+    refresher.clock.advance(1)
+    assert refresher.run_pending() == 1
+    # the second refresh only fetches the tail
+    assert server.requests == {"market_chart": 2}
+    assert refresher.snapshot.version == 2
+
+def test_snapshots_are_replaced_not_modified(client):
+    refresher = make_refresher(client, coins=["bitcoin"])
+    refresher.run_pending()
+    first = refresher.snapshot
+    refresher.clock.advance(100)
+    refresher.run_pending()
+    assert refresher.snapshot is not first
+    assert first.version == 1
+    with pytest.raises(TypeError):
+        first.data["ethereum"] = None
+
+def test_failed_refreshes_keep_the_previous_data(client, server):
+    refresher = make_refresher(client, coins=["bitcoin", "broken-coin"], interval=10)
+    refresher.run_pending()
+    refresher.clock.advance(5)
+    refresher.run_pending()
+    snapshot = refresher.snapshot
+    assert "bitcoin" in snapshot
+    assert "broken-coin" not in snapshot
+    assert list(snapshot.errors) == ["broken-coin"]
+    assert list(snapshot.latest().index) == ["bitcoin"]
+
+def test_watch_and_unwatch(client):
+    refresher = make_refresher(client, coins=["bitcoin"])
+    refresher.run_pending()
+    refresher.watch(["ethereum"])
+    assert refresher.run_pending() == 1
+    assert sorted(refresher.snapshot.data) == ["bitcoin", "ethereum"]
+
+    refresher.unwatch(["bitcoin"])
+    assert list(refresher.snapshot.data) == ["ethereum"]
+    refresher.clock.advance(100)
+    # the removed coin's scheduled refresh is dropped
+    assert refresher.run_pending() == 1
+
+def test_empty_snapshot():
+    snapshot = ChartSnapshot()
+    assert len(snapshot) == 0
+    assert snapshot.get("bitcoin") is None
+    assert len(snapshot.latest()) == 0
+
+def test_top_coins_are_followed_through_the_refresher_client(server, client):
+    refresher = Refresher(None, top_n=3, interval=30, watchlist_interval=60, cache=None, client=client, clock=FakeClock())
+    for _ in range(3):
+        refresher.run_pending()
+        refresher.clock.advance(10)
+    assert sorted(refresher.snapshot.data) == ["bitcoin", "coin-0", "ethereum"]
+    assert server.requests == {"coins/markets": 1, "market_chart": 3}
+    assert client.limiter.counters["calls"] == 4
@@ -0,0 +1,45 @@
+import pandas as pd
+
+import CoinGeckoAPI as api
+
+DAY_MS = 86400000
+
+def chart(days=10, start="2024-01-01", step_ms=DAY_MS):
+    first = int(pd.Timestamp(start, tz="UTC").value // 10 ** 6)
+    pairs = [[first + i * step_ms, 100.0 + i] for i in range(days)]
+    return api.parse_market_chart({"prices": pairs, "market_caps": pairs, "total_volumes": pairs})
+
+def test_bounds_are_inclusive():
+    data = chart()
+    sliced = api.slice_dates(data, "2024-01-03", "2024-01-05")
+    assert list(sliced.index.strftime("%Y-%m-%d")) == ["2024-01-03", "2024-01-04", "2024-01-05"]
+
+def test_open_bounds():
+    data = chart()
+    assert len(api.slice_dates(data)) == len(data)
+    assert api.slice_dates(data, start="2024-01-09").index[0] == pd.Timestamp("2024-01-09", tz="UTC")
+    assert api.slice_dates(data, end="2024-01-02").index[-1] == pd.Timestamp("2024-01-02", tz="UTC")
+
+def test_sub_millisecond_bounds_on_a_millisecond_index():
+    # the parsed index is in ms, bounds with ns precision used to be refused by searchsorted
+    data = chart()
+    start = pd.Timestamp("2024-01-02", tz="UTC") + pd.Timedelta(nanoseconds=1)
+    end = pd.Timestamp("2024-01-04", tz="UTC") + pd.Timedelta(nanoseconds=999)
+    sliced = api.slice_dates(data, start, end)
+    assert list(sliced.index.strftime("%Y-%m-%d")) == ["2024-01-03", "2024-01-04"]
+
+def test_bounds_between_points():
+    data = chart(step_ms=DAY_MS // 2)
+    sliced = api.slice_dates(data, "2024-01-01 06:00", "2024-01-02 06:00")
+    assert list(sliced.index.strftime("%d %H")) == ["01 12", "02 00"]
+
+def test_nearest_snaps_to_the_closest_points():
+    data = chart()
+    sliced = api.slice_dates(data, "2024-01-02 13:00", "2024-01-04 11:00", snap="nearest")
+    assert list(sliced.index.strftime("%Y-%m-%d")) == ["2024-01-03", "2024-01-04"]
+
+def test_empty_results():
+    data = chart()
+    assert len(api.slice_dates(data, "2025-01-01")) == 0
+    assert len(api.slice_dates(data, "2024-01-05", "2024-01-03")) == 0
+    assert len(api.slice_dates(data.iloc[:0], "2024-01-01", "2024-01-02")) == 0
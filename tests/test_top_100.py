@@ -0,0 +1,65 @@
+import threading, time
+
+import pytest
+
+import CoinGeckoAPI as api
+from api_client import TTLCache, market_pages, top_markets
+from lite import LiteCoinGeckoAPI
+
+@pytest.mark.parametrize("n", [0, -5, 2.5, "100", None])
+def test_bad_n_is_refused(n):
+    with pytest.raises(ValueError):
+        market_pages(n)
+    with pytest.raises(ValueError):
+        api.top_coins(n)
+    with pytest.raises(ValueError):
+        LiteCoinGeckoAPI().get_top_100(n)
+
+def test_market_pages():
+    assert market_pages(1) == [(1, 1)]
+    assert market_pages(100) == [(1, 100)]
+    assert market_pages(251) == [(1, 250), (2, 250)]
+
+def test_top_markets_stops_at_a_short_page():
+    pages = []
+    def get_page(page, per_page):
+        pages.append(page)
+        return [{"id": "coin-{}".format(i)} for i in range(per_page if page == 1 else 3)]
+    assert len(top_markets(600, get_page)) == 253
+    assert pages == [1, 2]
+
+def test_top_coins_pages_through_the_api(server, client):
+    top = api.top_coins(300, client=client)
+    assert len(top) == 300
+    assert list(top.index[:3]) == [1, 2, 3]
+    assert server.requests == {"coins/markets": 2}
+    api.top_coins(300, client=client)
+    assert server.requests == {"coins/markets": 2}
+
+def test_get_or_set_coalesces_concurrent_misses():
+    cache = TTLCache()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        time.sleep(0.2)
+        return len(calls)
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_set(("coins_list",), 60, fetch))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == [1] * 8
+    assert len(calls) == 1
+    # every call is one lookup, a miss for the threads that got there before the value was set
+    assert cache.hits + cache.misses == 8
+    assert cache._fetching == {}
+
+def test_get_or_set_retries_after_an_error():
+    cache = TTLCache()
+    with pytest.raises(RuntimeError):
+        cache.get_or_set(("coins_list",), 60, lambda: (_ for _ in ()).throw(RuntimeError()))
+    assert cache.get_or_set(("coins_list",), 60, lambda: 1) == 1